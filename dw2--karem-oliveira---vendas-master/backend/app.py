@@ -3,37 +3,100 @@ FastAPI Application - Mini Sistema de Vendas
 Backend principal com endpoints para gestão de produtos, carrinho e autenticação
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, Query, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Header, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc, asc
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hmac
 import logging
+from datetime import date
 from decimal import Decimal
 import os
 import uuid
-import aiofiles
 
-from database import get_db, engine
+from database import (
+    get_db, get_db_leitura, engine, async_engine, async_engine_leitura, AsyncSessionLocal, AsyncSessionLeitura
+)
 from models import (
-    Base, Produto, Pedido, ItemPedido, User,
+    Produto, Pedido, ItemPedido, User,
     ProdutoCreate, ProdutoUpdate, ProdutoResponse, 
-    CarrinhoConfirmar, PedidoResponse,
-    UserCreate, UserLogin, UserUpdate, UserResponse, Token
+    CarrinhoConfirmar, PedidoResponse, PedidoHistoricoResponse,
+    CarrinhoOperacoes, CarrinhoCupom, CarrinhoResponse,
+    Cupom, CupomCreate, CupomUpdate, CupomResponse,
+    ReservaAjuste, ReservaResponse, DisponibilidadeResponse,
+    UserCreate, UserLogin, UserUpdate, UserResponse, Token, Principal
 )
 from auth import (
-    hash_password, authenticate_user, create_user_tokens,
-    get_current_user, get_current_admin_user
+    hash_password_async, authenticate_user, create_user_tokens,
+    get_current_principal, get_optional_principal,
+    get_current_user, get_current_user_cached, get_current_admin_user, invalidar_usuario,
+    metricas_hash, encerrar_pool_hash
+)
+from migracoes import verificar_schema
+from busca import detectar_indice_busca
+from cache import (
+    cache_produtos, cache_listagens, cache_categorias,
+    tag_produto, invalidar_produtos, invalidar_catalogo, estatisticas_cache,
+    calcular_etag, etag_confere, CACHE_CONTROL_CATALOGO
+)
+from uploads import (
+    LimiteCorpoMiddleware, AVATAR_DIR, AVATAR_MAX_BYTES, MARGEM_MULTIPART,
+    salvar_upload_limitado, remover_avatar, agendar_miniaturas, encerrar_pool_miniaturas
+)
+from carga_produtos import (
+    FORMATOS, formato_do_arquivo, ler_registros, importar_produtos,
+    consulta_exportacao, cabecalho, formatar_lote
+)
+from relatorios import (
+    registrar_venda, intervalo, resumo_vendas, vendas_por_categoria, uso_cupons, mais_vendidos
+)
+from imagens import preparar_variantes, resposta_variante
+from precos import Precificacao, precificar
+from cupons import carregar_cupons, recarregar_cupons, recarga_periodica, registrar_uso
+from reservas import (
+    DISPONIBILIDADE_MAX_IDS, dono_reserva, exigir_dono, ajustar_reserva, listar_reservas, liberar_reservas,
+    consulta_reservaveis, consumir_reservas, baixa_estoque, consultar_disponibilidade, varredura_periodica
+)
+from carrinhos import (
+    carregar_carrinho, alterar_carrinho, definir_cupom, esvaziar_carrinho,
+    resposta_carrinho, carregar_checkout, itens_pedido, gravar_carrinho, atualizar_carrinho,
+    limpeza_carrinhos_periodica
+)
+from serializacao import produto_dict, serializar, resposta_json, codificacao_resposta, etag_codificada
+from idempotencia import (
+    CABECALHO_REPETIDA, validar_chave, impressao_digital, buscar_resposta, resposta_repetida,
+    gravar_resposta, limpeza_periodica
+)
+from paginacao import (
+    LIMITE_PADRAO, LIMITE_MAXIMO, LIMITE_PEDIDOS_PADRAO, LIMITE_PEDIDOS_MAXIMO,
+    consulta_catalogo, buscar_pagina, iterar_lotes, buscar_pagina_pedidos
+)
+from metricas import (
+    CONTENT_TYPE, MetricasMiddleware, Contador, Medidor, registrar, expor_metricas,
+    instrumentar_engine, medidor_pools, registrar_checkout, registrar_reserva
+)
+from diagnostico_sql import (
+    SQL_DIAGNOSTICO, CABECALHO_CONSULTAS, DiagnosticoSQLMiddleware, ativar_diagnostico, orcamento_consultas
 )
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Criar tabelas no banco
-Base.metadata.create_all(bind=engine)
+# Schema: só compara PRAGMA user_version; migra se houver versão pendente
+verificar_schema(engine)
+
+# Busca pelo índice FTS5 quando a migração conseguiu criá-lo
+detectar_indice_busca(engine)
+
+# Regras dos cupons compiladas em memória (recarregadas quando mudam)
+carregar_cupons(engine)
 
 # Instância FastAPI
 app = FastAPI(
@@ -49,15 +112,110 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", CABECALHO_REPETIDA, CABECALHO_CONSULTAS],
 )
 
+# Limite do corpo da requisição de upload, aplicado enquanto os bytes chegam
+app.add_middleware(
+    LimiteCorpoMiddleware,
+    limites={"/users/avatar": AVATAR_MAX_BYTES + MARGEM_MULTIPART}
+)
+
+# Diagnóstico de SQL (só desenvolvimento/staging): N+1, consultas lentas e orçamento por endpoint
+if SQL_DIAGNOSTICO:
+    app.add_middleware(DiagnosticoSQLMiddleware)
+
+# Métricas por rota: adicionado por último para ser o middleware mais externo
+app.add_middleware(MetricasMiddleware, rotas=lambda: app.routes)
+
+def resposta_condicional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Aplica ETag e Cache-Control à resposta do catálogo
+    Retorna 304 (sem corpo) quando o If-None-Match do cliente confere
+    O Vary vai na 200 e no 304: o 304 não pode anunciar um Vary que a 200 não tinha
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_CATALOGO, "Vary": "Accept-Encoding"}
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Métricas (/metrics): consultas SQL e pools dos três engines, caches e pool de hash
+ENGINES_METRICAS = {
+    "sync": engine,
+    "escrita": async_engine.sync_engine,
+    "leitura": async_engine_leitura.sync_engine,
+}
+for nome_engine, engine_metricas in ENGINES_METRICAS.items():
+    instrumentar_engine(engine_metricas, nome_engine)
+medidor_pools(ENGINES_METRICAS)
+if SQL_DIAGNOSTICO:
+    ativar_diagnostico(ENGINES_METRICAS.values())
+
+EVENTOS_CACHE = ("hits", "misses", "stale_hits", "evictions", "invalidacoes")
+registrar(Contador(
+    "cache_eventos_total", "Eventos dos caches do catálogo", ("cache", "evento"),
+    coletar=lambda: (
+        ((nome, evento), valores[evento])
+        for nome, valores in estatisticas_cache().items() for evento in EVENTOS_CACHE
+    )
+))
+registrar(Medidor(
+    "cache_itens", "Itens guardados em cada cache do catálogo", ("cache",),
+    coletar=lambda: (((nome,), valores["itens"]) for nome, valores in estatisticas_cache().items())
+))
+registrar(Medidor(
+    "hash_senhas_tarefas", "Tarefas no pool de hash de senhas (executando, aguardando)", ("estado",),
+    coletar=lambda: (((estado,), metricas_hash()[estado]) for estado in ("executando", "aguardando"))
+))
+registrar(Contador(
+    "hash_senhas_total", "Hashes de senha concluídos, com falha ou rejeitados (fila cheia)", ("resultado",),
+    coletar=lambda: (((resultado,), metricas_hash()[resultado]) for resultado in ("concluidos", "falhas", "rejeitados"))
+))
+
+# Token opcional para proteger /metrics (Authorization: Bearer <token>)
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+
+# Tarefas de fundo iniciadas no startup
+tarefas_fundo: List[asyncio.Task] = []
+
+async def preparar_imagens():
+    """Gera as variantes das imagens e libera as URLs nas respostas do catálogo"""
+    if await preparar_variantes():
+        invalidar_catalogo()
+
+@app.on_event("startup")
+async def iniciar_tarefas():
+    """
+    Limpeza periódica das chaves de idempotência, das reservas vencidas e dos
+    carrinhos abandonados, recarga dos cupons e geração das variantes de imagem
+    """
+    tarefas_fundo.append(asyncio.create_task(limpeza_periodica(AsyncSessionLocal)))
+    tarefas_fundo.append(asyncio.create_task(varredura_periodica(AsyncSessionLocal)))
+    tarefas_fundo.append(asyncio.create_task(limpeza_carrinhos_periodica(AsyncSessionLocal)))
+    tarefas_fundo.append(asyncio.create_task(recarga_periodica(AsyncSessionLocal)))
+    tarefas_fundo.append(asyncio.create_task(preparar_imagens()))
+
+@app.on_event("shutdown")
+async def encerrar_recursos():
+    """Libera os pools de workers e as conexões do banco ao encerrar"""
+    for tarefa in tarefas_fundo:
+        tarefa.cancel()
+    await asyncio.gather(*tarefas_fundo, return_exceptions=True)
+    encerrar_pool_hash()
+    encerrar_pool_miniaturas()
+    await async_engine.dispose()
+    await async_engine_leitura.dispose()
+
 @app.get("/health", tags=["System"])
 async def health_check():
     """Endpoint para verificar se a API está funcionando"""
     return {
         "status": "ok",
         "message": "Loja Escolar API está rodando",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "senhas": metricas_hash(),
+        "cache": estatisticas_cache()
     }
 
 @app.get("/", tags=["System"])
@@ -69,72 +227,102 @@ async def root():
         "health": "/health"
     }
 
+@app.get("/metrics", tags=["System"])
+async def metricas(authorization: Optional[str] = Header(None)):
+    """Métricas no formato de texto do Prometheus (protegido se METRICAS_TOKEN estiver definido)"""
+    if METRICAS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICAS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de métricas inválido")
+    return Response(content=expor_metricas(), headers={"Content-Type": CONTENT_TYPE})
+
 # ========================================
 # ENDPOINTS DE PRODUTOS
 # ========================================
 
 @app.get("/produtos", response_model=List[ProdutoResponse], tags=["Produtos"])
+@orcamento_consultas(2)
 async def listar_produtos(
-    search: Optional[str] = Query(None, description="Buscar por nome ou descrição"),
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, description="Buscar por nome, descrição ou categoria (prefixo, sem acentos)"),
     categoria: Optional[str] = Query(None, description="Filtrar por categoria"),
-    sort: Optional[str] = Query("nome", description="Campo para ordenação (nome, preco)"),
+    sort: Optional[str] = Query(None, description="Campo para ordenação (nome, preco, relevancia). Padrão: relevancia em buscas, nome nas demais"),
     order: Optional[str] = Query("asc", description="Direção da ordenação (asc, desc)"),
-    db: Session = Depends(get_db)
+    limit: int = Query(LIMITE_PADRAO, ge=1, le=LIMITE_MAXIMO, description="Quantidade máxima de produtos por página"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco retornado em X-Next-Cursor"),
+    formato: Optional[str] = Query("json", description="Formato da resposta (json, ndjson)"),
+    db: AsyncSession = Depends(get_db_leitura)
 ):
-    """Listar produtos com filtros opcionais e ordenação"""
+    """
+    Listar produtos com filtros opcionais e ordenação
+    Paginação por cursor: o cursor da próxima página vem no header X-Next-Cursor.
+    Com formato=ndjson todo o resultado é enviado em streaming, um produto por linha.
+    JSON montado direto das colunas (formato de ProdutoResponse) e comprimido se o cliente aceitar.
+    """
     try:
-        query = db.query(Produto)
-        
-        # Filtro de busca por nome ou descrição
-        if search:
-            search_term = f"%{search.lower()}%"
-            query = query.filter(
-                or_(
-                    Produto.nome.ilike(search_term),
-                    Produto.descricao.ilike(search_term)
-                )
-            )
+        # Busca (índice FTS ou LIKE), categoria e ordenação (nome, preco ou relevancia bm25)
+        query, sort, order = consulta_catalogo(search, categoria, sort, order)
         
-        # Filtro por categoria
-        if categoria:
-            query = query.filter(Produto.categoria == categoria)
+        # Streaming NDJSON: percorre o catálogo inteiro em lotes keyset
+        if formato == "ndjson":
+            async def gerar_linhas():
+                async for lote in iterar_lotes(db, query, sort, order, cursor):
+                    yield b"".join(serializar(produto_dict(linha)) + b"\n" for linha in lote)
+            
+            logger.info(f"Streaming de produtos (filtros: search={search}, categoria={categoria})")
+            return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
         
-        # Ordenação
-        if sort == "preco":
-            if order == "desc":
-                query = query.order_by(desc(Produto.preco))
-            else:
-                query = query.order_by(asc(Produto.preco))
-        else:  # ordenar por nome (padrão)
-            if order == "desc":
-                query = query.order_by(desc(Produto.nome))
-            else:
-                query = query.order_by(asc(Produto.nome))
+        # Página servida do cache já serializada (e comprimida sob demanda);
+        # a carga usa sessão própria para poder ser refeita em segundo plano
+        # (stale-while-revalidate)
+        async def carregar_pagina():
+            async with AsyncSessionLeitura() as sessao:
+                pagina, proximo = await buscar_pagina(sessao, query, sort, order, limit, cursor)
+            corpo = serializar([produto_dict(linha) for linha in pagina])
+            etag = calcular_etag(corpo + (proximo or "").encode("ascii"))
+            return (corpo, len(pagina), proximo, etag, {}), [tag_produto(linha.id) for linha in pagina]
         
-        produtos = query.all()
-        logger.info(f"Listando {len(produtos)} produtos (filtros: search={search}, categoria={categoria})")
+        chave = (search, categoria, sort, order, limit, cursor)
+        corpo, quantidade, proximo_cursor, etag, comprimidos = await cache_listagens.obter(chave, carregar_pagina)
+        if proximo_cursor:
+            response.headers["X-Next-Cursor"] = proximo_cursor
         
-        return produtos
+        # Cada codificação (identidade, gzip, br) tem a própria ETag forte
+        etag = etag_codificada(etag, codificacao_resposta(request, corpo))
+        nao_modificado = resposta_condicional(request, response, etag)
+        if nao_modificado:
+            if proximo_cursor:
+                nao_modificado.headers["X-Next-Cursor"] = proximo_cursor
+            return nao_modificado
         
+        logger.info(f"Listando {quantidade} produtos (filtros: search={search}, categoria={categoria})")
+        
+        # Resposta pronta: o FastAPI não revalida contra o response_model
+        return resposta_json(request, corpo, headers=response.headers, comprimidos=comprimidos)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar produtos: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/produtos", response_model=ProdutoResponse, status_code=status.HTTP_201_CREATED, tags=["Produtos"])
-async def criar_produto(produto_data: ProdutoCreate, db: Session = Depends(get_db)):
+async def criar_produto(produto_data: ProdutoCreate, db: AsyncSession = Depends(get_db)):
     """Criar novo produto"""
     try:
         # Verificar se SKU já existe (se fornecido)
         if produto_data.sku:
-            existing_sku = db.query(Produto).filter(Produto.sku == produto_data.sku).first()
+            result = await db.execute(select(Produto).where(Produto.sku == produto_data.sku))
+            existing_sku = result.scalars().first()
             if existing_sku:
                 raise HTTPException(status_code=400, detail=f"SKU '{produto_data.sku}' já existe")
         
         # Criar novo produto
         db_produto = Produto(**produto_data.dict())
         db.add(db_produto)
-        db.commit()
-        db.refresh(db_produto)
+        await db.commit()
+        await db.refresh(db_produto)
+        
+        invalidar_produtos([db_produto.id], mudou_catalogo=True)
         
         logger.info(f"Produto criado: {db_produto.nome} (ID: {db_produto.id})")
         return db_produto
@@ -142,44 +330,135 @@ async def criar_produto(produto_data: ProdutoCreate, db: Session = Depends(get_d
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Erro ao criar produto: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+# Rotas /produtos/bulk declaradas antes de /produtos/{produto_id}
+
+@app.post("/produtos/bulk", tags=["Produtos"])
+async def importar_produtos_lote(
+    file: UploadFile = File(...),
+    formato: Optional[str] = Query(None, description="csv ou jsonl (padrão: extensão do arquivo)"),
+    admin: Principal = Depends(get_current_admin_user)
+):
+    """
+    Importar produtos em lote (CSV com cabeçalho ou JSONL)
+    Upsert por sku em transações por lote; linhas inválidas voltam no relatório
+    """
+    formato = formato or formato_do_arquivo(file.filename)
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato não suportado. Use csv ou jsonl")
+    
+    try:
+        # Leitura e gravação síncronas (engine de scripts) fora do event loop
+        relatorio = await run_in_threadpool(
+            importar_produtos, engine, ler_registros(file.file, formato)
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Arquivo deve estar em UTF-8")
+    except Exception as e:
+        # Lotes anteriores à falha já foram gravados
+        invalidar_catalogo()
+        logger.error(f"Erro na importação em lote: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+    
+    if relatorio["criados"] or relatorio["atualizados"]:
+        invalidar_catalogo()
+    
+    logger.info(
+        f"Importação em lote por {admin.email}: {relatorio['criados']} criados, "
+        f"{relatorio['atualizados']} atualizados, {relatorio['total_erros']} com erro, "
+        f"{relatorio['estoque_ajustado']} com estoque ajustado ao reservado"
+    )
+    return relatorio
+
+@app.get("/produtos/bulk", tags=["Produtos"])
+async def exportar_produtos_lote(
+    formato: str = Query("csv", description="Formato do arquivo (csv, jsonl)"),
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Exportar o catálogo inteiro em streaming, no mesmo formato aceito pela importação"""
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato não suportado. Use csv ou jsonl")
+    
+    async def gerar_arquivo():
+        yield cabecalho(formato)
+        ultimo_id = 0
+        while True:
+            linhas = (await db.execute(consulta_exportacao(ultimo_id))).all()
+            if not linhas:
+                break
+            yield formatar_lote(linhas, formato)
+            ultimo_id = linhas[-1].id
+    
+    return StreamingResponse(
+        gerar_arquivo(),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="produtos.{formato}"'}
+    )
+
+@app.get("/produtos/disponibilidade", response_model=List[DisponibilidadeResponse], tags=["Produtos"])
+@orcamento_consultas(1)
+async def disponibilidade_produtos(
+    ids: List[int] = Query(..., description="IDs dos produtos (?ids=1&ids=2)"),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Estoque disponível agora (estoque menos as reservas dos carrinhos), sem cache"""
+    if len(ids) > DISPONIBILIDADE_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Informe no máximo {DISPONIBILIDADE_MAX_IDS} produtos")
+    return await consultar_disponibilidade(db, ids)
+
 @app.get("/produtos/{produto_id}", response_model=ProdutoResponse, tags=["Produtos"])
-async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
+@orcamento_consultas(1)
+async def obter_produto(produto_id: int, request: Request, response: Response):
     """Obter produto por ID"""
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
+    async def carregar_produto():
+        async with AsyncSessionLeitura() as sessao:
+            encontrado = await sessao.get(Produto, produto_id)
+        if not encontrado:
+            return (None, None), []
+        dados = jsonable_encoder(ProdutoResponse.from_orm(encontrado))
+        return (dados, calcular_etag(dados)), []
+    
+    produto, etag = await cache_produtos.obter(produto_id, carregar_produto)
     
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
-    return produto
+    return resposta_condicional(request, response, etag) or produto
 
 @app.put("/produtos/{produto_id}", response_model=ProdutoResponse, tags=["Produtos"])
-async def atualizar_produto(produto_id: int, produto_data: ProdutoUpdate, db: Session = Depends(get_db)):
+async def atualizar_produto(produto_id: int, produto_data: ProdutoUpdate, db: AsyncSession = Depends(get_db)):
     """Atualizar produto existente"""
     try:
-        produto = db.query(Produto).filter(Produto.id == produto_id).first()
+        produto = await db.get(Produto, produto_id)
         
         if not produto:
             raise HTTPException(status_code=404, detail="Produto não encontrado")
         
         # Verificar se SKU já existe em outro produto (se fornecido)
         if produto_data.sku and produto_data.sku != produto.sku:
-            existing_sku = db.query(Produto).filter(
+            result = await db.execute(select(Produto).where(
                 Produto.sku == produto_data.sku,
                 Produto.id != produto_id
-            ).first()
+            ))
+            existing_sku = result.scalars().first()
             if existing_sku:
                 raise HTTPException(status_code=400, detail=f"SKU '{produto_data.sku}' já existe")
         
         # Atualizar campos
-        for field, value in produto_data.dict().items():
+        campos_listagem = ("nome", "descricao", "preco", "categoria")
+        dados = produto_data.dict()
+        mudou_catalogo = any(getattr(produto, campo) != dados[campo] for campo in campos_listagem)
+        for field, value in dados.items():
             setattr(produto, field, value)
         
-        db.commit()
-        db.refresh(produto)
+        await db.commit()
+        await db.refresh(produto)
+        
+        invalidar_produtos([produto_id], mudou_catalogo=mudou_catalogo)
         
         logger.info(f"Produto atualizado: {produto.nome} (ID: {produto_id})")
         return produto
@@ -187,28 +466,30 @@ async def atualizar_produto(produto_id: int, produto_data: ProdutoUpdate, db: Se
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Erro ao atualizar produto {produto_id}: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.delete("/produtos/{produto_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Produtos"])
-async def deletar_produto(produto_id: int, db: Session = Depends(get_db)):
+async def deletar_produto(produto_id: int, db: AsyncSession = Depends(get_db)):
     """Deletar produto"""
     try:
-        produto = db.query(Produto).filter(Produto.id == produto_id).first()
+        produto = await db.get(Produto, produto_id)
         
         if not produto:
             raise HTTPException(status_code=404, detail="Produto não encontrado")
         
-        db.delete(produto)
-        db.commit()
+        await db.delete(produto)
+        await db.commit()
+        
+        invalidar_produtos([produto_id], mudou_catalogo=True)
         
         logger.info(f"Produto deletado: {produto.nome} (ID: {produto_id})")
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Erro ao deletar produto {produto_id}: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
@@ -216,144 +497,639 @@ async def deletar_produto(produto_id: int, db: Session = Depends(get_db)):
 # ENDPOINT DE CARRINHO
 # ========================================
 
+async def resposta_concorrente(db: AsyncSession, idempotencia: Optional[Tuple[int, str, str]]) -> Optional[Response]:
+    """
+    Resposta gravada por outra requisição com a mesma Idempotency-Key que confirmou
+    enquanto esta rodava (levando o estoque, as reservas ou o carrinho), ou None
+    """
+    if idempotencia is None:
+        return None
+    escopo, chave, impressao = idempotencia
+    registro = await buscar_resposta(db, escopo, chave)
+    if registro is None:
+        return None
+    repetida = resposta_repetida(registro, impressao)
+    registrar_checkout("repetido")
+    return repetida
+
+async def efetivar_pedido(
+    db: AsyncSession,
+    itens: List[dict],
+    precificacao: Precificacao,
+    reservas: Dict[int, Tuple[int, int]],
+    user_id: Optional[int],
+    precos: Optional[Dict[int, Decimal]] = None,
+    idempotencia: Optional[Tuple[int, str, str]] = None,
+    carrinho: Optional[Tuple[str, dict]] = None
+):
+    """
+    Fase de escrita do checkout, numa transação: as reservas viram venda, baixa
+    do estoque, uso do cupom, pedido e itens, agregados dos relatórios, resposta
+    idempotente e (carrinho salvo) a remoção do carrinho
+    itens: produto_id, nome, preco, categoria, quantidade (já validados)
+    reservas: produto_id -> (reserva_id, quantidade reservada)
+    precos: a baixa também confere o preço de cada produto (foto do carrinho salvo)
+    idempotencia: (escopo, chave, impressão); carrinho: (dono, estado lido)
+    Conflitos desfazem tudo e levantam HTTPException 409, exceto quando outra
+    requisição com a mesma chave já confirmou: aí devolvem a resposta dela
+    """
+    async def conflito(detalhe: str):
+        await db.rollback()
+        repetida = await resposta_concorrente(db, idempotencia)
+        if repetida is None:
+            raise HTTPException(status_code=409, detail=detalhe)
+        return repetida
+    
+    quantidades = {}
+    for item in itens:
+        quantidades[item['produto_id']] = quantidades.get(item['produto_id'], 0) + item['quantidade']
+    reservadas = {produto_id: quantidade for produto_id, (_, quantidade) in reservas.items()}
+    
+    # Reservas do carrinho viram venda: apagadas antes da baixa (a varredura pode ter levado alguma)
+    if reservas and not await consumir_reservas(db, [reserva_id for reserva_id, _ in reservas.values()]):
+        return await conflito("Reservas do carrinho expiraram durante a confirmação. Tente novamente.")
+    
+    # Baixa de estoque atômica: só decrementa se ainda houver estoque livre além das reservas
+    # (UPDATE único com CASE; se alguma linha não casar, outro checkout levou o estoque)
+    result = await db.execute(baixa_estoque(quantidades, reservadas, precos))
+    if result.rowcount != len(quantidades):
+        return await conflito("Estoque alterado por outro pedido. Revise o carrinho e tente novamente.")
+    
+    # Uso do cupom contado no mesmo UPDATE que confere o limite
+    if precificacao.cupom_usado and not await registrar_uso(db, precificacao.cupom_usado):
+        return await conflito(
+            f"Cupom {precificacao.cupom_usado} esgotado ou desativado. Revise o carrinho e tente novamente."
+        )
+    
+    # Criar pedido
+    pedido = Pedido(
+        total_bruto=precificacao.total_bruto,
+        desconto=precificacao.desconto,
+        total_final=precificacao.total_final,
+        cupom_usado=precificacao.cupom_usado,
+        user_id=user_id
+    )
+    
+    db.add(pedido)
+    await db.flush()  # Para obter o ID do pedido
+    
+    # Criar itens do pedido em um único INSERT (executemany)
+    for item, subtotal in zip(itens, precificacao.subtotais):
+        item['subtotal'] = subtotal
+    await db.execute(insert(ItemPedido), [
+        {
+            'pedido_id': pedido.id,
+            'produto_id': item['produto_id'],
+            'nome_produto': item['nome'],
+            'preco_unitario': item['preco'],
+            'quantidade': item['quantidade'],
+            'subtotal': item['subtotal']
+        }
+        for item in itens
+    ])
+    await db.refresh(pedido, ["data"])  # data gerada pelo banco, para a resposta
+    
+    # Agregados dos relatórios na mesma transação do pedido
+    await registrar_venda(
+        db, itens, precificacao.total_bruto, precificacao.desconto, precificacao.total_final, precificacao.cupom_usado
+    )
+    
+    resposta = {
+        'id': pedido.id,
+        'total_bruto': float(precificacao.total_bruto),
+        'desconto': float(precificacao.desconto),
+        'total_final': float(precificacao.total_final),
+        'cupom_usado': precificacao.cupom_usado,
+        'data': pedido.data,
+        'itens': [
+            {
+                'produto_id': item['produto_id'],
+                'nome': item['nome'],
+                'preco_unitario': float(item['preco']),
+                'quantidade': item['quantidade'],
+                'subtotal': float(item['subtotal'])
+            }
+            for item in itens
+        ]
+    }
+    
+    # Carrinho salvo vira pedido: apagado se ninguém o alterou desde a leitura
+    if carrinho is not None:
+        dono, estado = carrinho
+        try:
+            await gravar_carrinho(db, dono, {**estado, 'itens': {}})
+        except HTTPException as e:
+            return await conflito(e.detail)
+    
+    # Resposta gravada na mesma transação do pedido
+    if idempotencia is not None:
+        escopo, chave, impressao = idempotencia
+        gravada = await gravar_resposta(db, escopo, chave, impressao, PedidoResponse(**resposta).json())
+        if not gravada:
+            # Requisição concorrente com a mesma chave confirmou primeiro: desfaz esta
+            await db.rollback()
+            return await resposta_concorrente(db, idempotencia)
+    
+    await db.commit()
+    
+    # Estoque mudou: invalida só os produtos comprados e as listagens que os contêm
+    invalidar_produtos(quantidades.keys())
+    registrar_reserva("convertidas", sum(reservadas.values()))
+    
+    logger.info(f"Pedido confirmado: ID {pedido.id}, Total: R$ {precificacao.total_final}")
+    registrar_checkout("sucesso")
+    
+    # Retornar resposta estruturada
+    return resposta
+
 @app.post("/carrinho/confirmar", response_model=PedidoResponse, tags=["Carrinho"])
-async def confirmar_carrinho(dados_carrinho: CarrinhoConfirmar, db: Session = Depends(get_db)):
-    """Confirmar pedido do carrinho com validação de estoque e aplicação de cupom"""
+@orcamento_consultas(12)
+async def confirmar_carrinho(
+    dados_carrinho: CarrinhoConfirmar,
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    idempotency_key: Optional[str] = Header(None, description="Chave única da tentativa de compra (repetições devolvem o mesmo pedido)"),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante (reservas de estoque)"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Confirmar pedido do carrinho com validação de estoque e aplicação de cupom
+    Com token o pedido entra no histórico do usuário; sem token é compra de visitante.
+    Com Idempotency-Key, repetições da mesma compra devolvem a resposta da primeira.
+    As reservas de estoque do carrinho viram venda sem disputar o estoque livre.
+    """
+    falha = "requisicao_invalida"  # motivo registrado se uma HTTPException sair do checkout
+    idempotencia = None
     try:
+        # Repetição de uma compra já confirmada: devolve a resposta gravada
+        escopo = principal.user_id if principal else 0
+        if idempotency_key is not None:
+            validar_chave(idempotency_key)
+            impressao = impressao_digital(jsonable_encoder(dados_carrinho))
+            idempotencia = (escopo, idempotency_key, impressao)
+            registro = await buscar_resposta(db, escopo, idempotency_key)
+            if registro:
+                logger.info(f"Checkout repetido com Idempotency-Key (escopo {escopo})")
+                falha = "chave_reutilizada"  # mesma chave com outro corpo (422)
+                repetida = resposta_repetida(registro, impressao)
+                registrar_checkout("repetido")
+                return repetida
+        
         if not dados_carrinho.itens:
+            falha = "carrinho_vazio"
             raise HTTPException(status_code=400, detail="Carrinho não pode estar vazio")
         
-        itens_confirmados = []
-        total_bruto = Decimal('0.00')
-        
-        # Validar cada item e calcular totais
+        # Somar quantidades de itens repetidos do mesmo produto
+        quantidades = {}
         for item in dados_carrinho.itens:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
+            quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+        
+        # Carregar todos os produtos do carrinho e as reservas dele em uma única consulta
+        dono = dono_reserva(principal, x_sessao_carrinho)
+        result = await db.execute(consulta_reservaveis(dono, quantidades.keys()))
+        produtos = {linha.id: linha for linha in result}
+        reservadas = {linha.id: linha.reservada for linha in produtos.values() if linha.reserva_id is not None}
+        
+        validados = []
+        
+        # Validar cada item (o que está todo reservado pelo carrinho não precisa de estoque livre)
+        for produto_id, quantidade in quantidades.items():
+            produto = produtos.get(produto_id)
             
             if not produto:
+                falha = "produto_inexistente"
                 raise HTTPException(
                     status_code=422, 
-                    detail=f"Produto com ID {item.produto_id} não encontrado"
+                    detail=f"Produto com ID {produto_id} não encontrado"
                 )
             
-            if produto.estoque < item.quantidade:
+            reservada = reservadas.get(produto_id, 0)
+            disponivel = produto.estoque - produto.reservado + reservada
+            if reservada < quantidade and disponivel < quantidade:
+                falha = "estoque_insuficiente"
                 raise HTTPException(
                     status_code=422,
-                    detail=f"Estoque insuficiente para '{produto.nome}'. Disponível: {produto.estoque}, Solicitado: {item.quantidade}"
+                    detail=f"Estoque insuficiente para '{produto.nome}'. Disponível: {max(disponivel, 0)}, Solicitado: {quantidade}"
                 )
             
-            subtotal = produto.preco * item.quantidade
-            total_bruto += subtotal
-            
-            itens_confirmados.append({
-                'produto': produto,
-                'quantidade': item.quantidade,
-                'subtotal': subtotal
-            })
-        
-        # Aplicar desconto do cupom
-        desconto = Decimal('0.00')
-        cupom_usado = None
-        
-        if dados_carrinho.cupom and dados_carrinho.cupom.upper() == "ALUNO10":
-            desconto = total_bruto * Decimal('0.10')  # 10% de desconto
-            cupom_usado = "ALUNO10"
-        
-        total_final = total_bruto - desconto
-        
-        # Criar pedido
-        pedido = Pedido(
-            total_bruto=total_bruto,
-            desconto=desconto,
-            total_final=total_final,
-            cupom_usado=cupom_usado
-        )
-        
-        db.add(pedido)
-        db.flush()  # Para obter o ID do pedido
+            validados.append((produto, quantidade))
         
-        # Criar itens do pedido e atualizar estoque
-        itens_pedido_response = []
-        
-        for item_data in itens_confirmados:
-            produto = item_data['produto']
-            quantidade = item_data['quantidade']
-            subtotal = item_data['subtotal']
-            
-            # Criar item do pedido
-            item_pedido = ItemPedido(
-                pedido_id=pedido.id,
-                produto_id=produto.id,
-                nome_produto=produto.nome,
-                preco_unitario=produto.preco,
-                quantidade=quantidade,
-                subtotal=subtotal
-            )
-            
-            db.add(item_pedido)
-            
-            # Atualizar estoque
-            produto.estoque -= quantidade
-            
-            # Dados para resposta
-            itens_pedido_response.append({
+        # Subtotais, total bruto e desconto do cupom
+        itens = [
+            {
                 'produto_id': produto.id,
                 'nome': produto.nome,
-                'preco_unitario': float(produto.preco),
-                'quantidade': quantidade,
-                'subtotal': float(subtotal)
-            })
+                'preco': produto.preco,
+                'categoria': produto.categoria,
+                'quantidade': quantidade
+            }
+            for produto, quantidade in validados
+        ]
+        precificacao = precificar([(item['preco'], item['quantidade'], item['categoria']) for item in itens], dados_carrinho.cupom)
+        
+        falha = "conflito_estoque"
+        return await efetivar_pedido(
+            db, itens, precificacao,
+            {produto_id: (produtos[produto_id].reserva_id, reservada) for produto_id, reservada in reservadas.items()},
+            principal.user_id if principal else None,
+            idempotencia=idempotencia
+        )
+        
+    except HTTPException:
+        # O estoque pode ter ido para a outra requisição com a mesma chave
+        if falha == "estoque_insuficiente":
+            repetida = await resposta_concorrente(db, idempotencia)
+            if repetida is not None:
+                return repetida
+        registrar_checkout(falha)
+        raise
+    except Exception as e:
+        await db.rollback()
+        registrar_checkout("erro_interno")
+        logger.error(f"Erro ao confirmar carrinho: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+# ========================================
+# RESERVAS DE ESTOQUE DO CARRINHO
+# ========================================
+
+@app.put("/carrinho/reservas/{produto_id}", response_model=ReservaResponse, tags=["Carrinho"])
+@orcamento_consultas(4)
+async def reservar_produto(
+    produto_id: int,
+    ajuste: ReservaAjuste,
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Reservar a quantidade do produto no carrinho (0 solta a reserva)
+    A reserva vale por alguns minutos e é renovada a cada alteração do carrinho
+    """
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    try:
+        return await ajustar_reserva(db, dono, produto_id, ajuste.quantidade)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao reservar produto {produto_id}: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@app.get("/carrinho/reservas", response_model=List[ReservaResponse], tags=["Carrinho"])
+@orcamento_consultas(1)
+async def listar_reservas_carrinho(
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Reservas ainda no prazo do carrinho"""
+    return await listar_reservas(db, exigir_dono(principal, x_sessao_carrinho))
+
+@app.delete("/carrinho/reservas", tags=["Carrinho"])
+@orcamento_consultas(3)
+async def liberar_reservas_carrinho(
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Soltar todas as reservas do carrinho (carrinho esvaziado ou abandonado)"""
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    try:
+        return {"unidades_liberadas": await liberar_reservas(db, dono)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao liberar reservas: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+# ========================================
+# CARRINHO SALVO NO SERVIDOR
+# ========================================
+
+@app.get("/carrinho", response_model=CarrinhoResponse, tags=["Carrinho"])
+@orcamento_consultas(1)
+async def obter_carrinho(
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Itens, cupom e totais do carrinho (busca pela chave primária)"""
+    return resposta_carrinho(await carregar_carrinho(db, exigir_dono(principal, x_sessao_carrinho)))
+
+@app.patch("/carrinho", response_model=CarrinhoResponse, tags=["Carrinho"])
+@orcamento_consultas(8)
+async def alterar_itens_carrinho(
+    dados: CarrinhoOperacoes,
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Aplicar operações no carrinho, na ordem: adicionar, remover ou definir a quantidade
+    Cada produto alterado reserva o estoque; o total é atualizado só pela diferença
+    """
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    try:
+        return await alterar_carrinho(db, dono, dados.operacoes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao alterar carrinho: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@app.put("/carrinho/cupom", response_model=CarrinhoResponse, tags=["Carrinho"])
+@orcamento_consultas(3)
+async def aplicar_cupom_carrinho(
+    dados: CarrinhoCupom,
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Aplicar o cupom ao carrinho (null remove)"""
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    try:
+        return await definir_cupom(db, dono, dados.cupom)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao aplicar cupom: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@app.delete("/carrinho", tags=["Carrinho"])
+@orcamento_consultas(4)
+async def esvaziar_carrinho_salvo(
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Esvaziar o carrinho e soltar as reservas de estoque dele"""
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    try:
+        return {"unidades_liberadas": await esvaziar_carrinho(db, dono)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao esvaziar carrinho: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@app.post("/carrinho/checkout", response_model=PedidoResponse, tags=["Carrinho"])
+@orcamento_consultas(14)
+async def checkout_carrinho(
+    principal: Optional[Principal] = Depends(get_optional_principal),
+    idempotency_key: Optional[str] = Header(None, description="Chave única da tentativa de compra (repetições devolvem o mesmo pedido)"),
+    x_sessao_carrinho: Optional[str] = Header(None, description="Sessão do carrinho de visitante"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Confirmar o carrinho salvo no servidor
+    Itens, preços e cupom já foram validados nas operações do carrinho: aqui só
+    se grava a foto, e a baixa confere que estoque e preços continuam os mesmos.
+    Se mudaram, o carrinho é atualizado e a resposta é 409 para o cliente revisar.
+    """
+    dono = exigir_dono(principal, x_sessao_carrinho)
+    falha = "requisicao_invalida"  # motivo registrado se uma HTTPException sair do checkout
+    idempotencia = None
+    try:
+        # Repetição de uma compra já confirmada: devolve a resposta gravada
+        escopo = principal.user_id if principal else 0
+        if idempotency_key is not None:
+            validar_chave(idempotency_key)
+            impressao = impressao_digital({"carrinho": dono})
+            idempotencia = (escopo, idempotency_key, impressao)
+            registro = await buscar_resposta(db, escopo, idempotency_key)
+            if registro:
+                logger.info(f"Checkout repetido com Idempotency-Key (escopo {escopo})")
+                falha = "chave_reutilizada"
+                repetida = resposta_repetida(registro, impressao)
+                registrar_checkout("repetido")
+                return repetida
         
-        db.commit()
-        db.refresh(pedido)
+        # Carrinho e reservas dele em uma única consulta
+        estado, reservas = await carregar_checkout(db, dono)
+        if not estado["itens"]:
+            falha = "carrinho_vazio"
+            raise HTTPException(status_code=400, detail="Carrinho não pode estar vazio")
         
-        logger.info(f"Pedido confirmado: ID {pedido.id}, Total: R$ {total_final}")
+        itens = itens_pedido(estado)
+        precificacao = precificar([(item['preco'], item['quantidade'], item['categoria']) for item in itens], estado["cupom"])
         
-        # Retornar resposta estruturada
-        return {
-            'id': pedido.id,
-            'total_bruto': float(total_bruto),
-            'desconto': float(desconto),
-            'total_final': float(total_final),
-            'cupom_usado': cupom_usado,
-            'data': pedido.data,
-            'itens': itens_pedido_response
-        }
+        falha = "conflito_estoque"
+        try:
+            return await efetivar_pedido(
+                db, itens, precificacao, reservas,
+                principal.user_id if principal else None,
+                precos={item['produto_id']: item['preco'] for item in itens},
+                idempotencia=idempotencia,
+                carrinho=(dono, estado)
+            )
+        except HTTPException as e:
+            if e.status_code != 409:
+                raise
+            # Preço, estoque ou o próprio carrinho mudaram: atualiza a foto para o cliente revisar
+            await atualizar_carrinho(db, dono)
+            raise HTTPException(
+                status_code=409,
+                detail="Carrinho atualizado: preços, estoque ou cupom mudaram. Revise o carrinho e confirme novamente."
+            )
         
     except HTTPException:
+        # O carrinho pode ter virado pedido na outra requisição com a mesma chave
+        if falha == "carrinho_vazio":
+            repetida = await resposta_concorrente(db, idempotencia)
+            if repetida is not None:
+                return repetida
+        registrar_checkout(falha)
         raise
     except Exception as e:
-        db.rollback()
-        logger.error(f"Erro ao confirmar carrinho: {e}")
+        await db.rollback()
+        registrar_checkout("erro_interno")
+        logger.error(f"Erro ao confirmar carrinho salvo: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+# ========================================
+# IMAGENS DE PRODUTOS
+# ========================================
+
+@app.api_route("/imagens/{nome}", methods=["GET", "HEAD"], tags=["Imagens"])
+async def servir_imagem(nome: str, request: Request):
+    """
+    Variante redimensionada (WebP/AVIF) de imagem de produto
+    URLs vêm em ProdutoResponse.imagens; o nome contém o hash do conteúdo (cache imutável)
+    """
+    resposta = resposta_variante(nome, request.method)
+    if resposta is None:
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    return resposta
+
 # ========================================
 # ENDPOINT ADICIONAL - CATEGORIAS
 # ========================================
 
 @app.get("/categorias", tags=["Utilitários"])
-async def listar_categorias(db: Session = Depends(get_db)):
+@orcamento_consultas(1)
+async def listar_categorias(request: Request, response: Response):
     """Listar todas as categorias disponíveis"""
+    async def carregar_categorias():
+        async with AsyncSessionLeitura() as sessao:
+            result = await sessao.execute(select(Produto.categoria).distinct())
+            categorias = result.all()
+        categorias_list = sorted(cat[0] for cat in categorias if cat[0])
+        return (categorias_list, calcular_etag(categorias_list)), []
+    
     try:
-        categorias = db.query(Produto.categoria).distinct().all()
-        categorias_list = [cat[0] for cat in categorias if cat[0]]
-        
-        return sorted(categorias_list)
+        categorias_list, etag = await cache_categorias.obter("todas", carregar_categorias)
+        return resposta_condicional(request, response, etag) or categorias_list
         
     except Exception as e:
         logger.error(f"Erro ao listar categorias: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+# ========================================
+# ENDPOINTS DE RELATÓRIOS (ADMIN)
+# ========================================
+
+@app.get("/admin/relatorios/vendas", tags=["Relatórios"])
+async def relatorio_vendas(
+    inicio: Optional[date] = Query(None, description="Data inicial (padrão: 30 dias atrás)"),
+    fim: Optional[date] = Query(None, description="Data final (padrão: hoje)"),
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Receita, descontos, pedidos e unidades vendidas por dia no intervalo"""
+    inicio, fim = intervalo(inicio, fim)
+    return await resumo_vendas(db, inicio, fim)
+
+@app.get("/admin/relatorios/categorias", tags=["Relatórios"])
+async def relatorio_categorias(
+    inicio: Optional[date] = Query(None, description="Data inicial (padrão: 30 dias atrás)"),
+    fim: Optional[date] = Query(None, description="Data final (padrão: hoje)"),
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Unidades e receita bruta por categoria no intervalo"""
+    inicio, fim = intervalo(inicio, fim)
+    return {"inicio": inicio, "fim": fim, "categorias": await vendas_por_categoria(db, inicio, fim)}
+
+@app.get("/admin/relatorios/cupons", tags=["Relatórios"])
+async def relatorio_cupons(
+    inicio: Optional[date] = Query(None, description="Data inicial (padrão: 30 dias atrás)"),
+    fim: Optional[date] = Query(None, description="Data final (padrão: hoje)"),
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Uso de cupons (ex.: ALUNO10): pedidos e desconto concedido no intervalo"""
+    inicio, fim = intervalo(inicio, fim)
+    return {"inicio": inicio, "fim": fim, "cupons": await uso_cupons(db, inicio, fim)}
+
+@app.get("/admin/relatorios/mais-vendidos", tags=["Relatórios"])
+async def relatorio_mais_vendidos(
+    inicio: Optional[date] = Query(None, description="Data inicial (padrão: 30 dias atrás)"),
+    fim: Optional[date] = Query(None, description="Data final (padrão: hoje)"),
+    limite: int = Query(10, ge=1, le=100, description="Quantidade de produtos"),
+    por: str = Query("unidades", regex="^(unidades|receita)$", description="Critério (unidades, receita)"),
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """Produtos mais vendidos no intervalo"""
+    inicio, fim = intervalo(inicio, fim)
+    return {"inicio": inicio, "fim": fim, "produtos": await mais_vendidos(db, inicio, fim, limite, por)}
+
+# ========================================
+# CUPONS (ADMIN)
+# ========================================
+
+@app.get("/admin/cupons", response_model=List[CupomResponse], tags=["Cupons"])
+async def listar_cupons(
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cupons cadastrados, com os usos já contados"""
+    result = await db.execute(select(Cupom).order_by(Cupom.codigo))
+    return result.scalars().all()
+
+@app.post("/admin/cupons", response_model=CupomResponse, status_code=status.HTTP_201_CREATED, tags=["Cupons"])
+async def criar_cupom(
+    cupom_data: CupomCreate,
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Criar cupom: percentual ou valor fixo, com categoria, mínimo, validade e limite de usos opcionais"""
+    try:
+        cupom = Cupom(**cupom_data.dict())
+        db.add(cupom)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail=f"Cupom '{cupom_data.codigo}' já existe")
+        await db.refresh(cupom)
+        
+        # Vale na hora neste worker; os demais recarregam pelo carimbo
+        await recarregar_cupons(db)
+        
+        logger.info(f"Cupom criado: {cupom.codigo} (ID: {cupom.id})")
+        return cupom
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao criar cupom: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@app.put("/admin/cupons/{cupom_id}", response_model=CupomResponse, tags=["Cupons"])
+async def atualizar_cupom(
+    cupom_id: int,
+    cupom_data: CupomUpdate,
+    admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Atualizar cupom (ativo=false desativa; os usos já contados são mantidos)"""
+    try:
+        cupom = await db.get(Cupom, cupom_id)
+        
+        if not cupom:
+            raise HTTPException(status_code=404, detail="Cupom não encontrado")
+        
+        for field, value in cupom_data.dict().items():
+            setattr(cupom, field, value)
+        cupom.versao = Cupom.versao + 1
+        
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail=f"Cupom '{cupom_data.codigo}' já existe")
+        await db.refresh(cupom)
+        
+        await recarregar_cupons(db)
+        
+        logger.info(f"Cupom atualizado: {cupom.codigo} (ID: {cupom_id})")
+        return cupom
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Erro ao atualizar cupom: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
 # ========================================
 # ENDPOINTS DE AUTENTICAÇÃO
 # ========================================
 
 @app.post("/auth/register", response_model=Token, tags=["Autenticação"])
-async def registrar_usuario(user_data: UserCreate, db: Session = Depends(get_db)):
+@orcamento_consultas(3)
+async def registrar_usuario(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Registrar novo usuário"""
     try:
         # Verificar se o email já existe
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        result = await db.execute(select(User).where(User.email == user_data.email))
+        existing_user = result.scalars().first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -361,7 +1137,7 @@ async def registrar_usuario(user_data: UserCreate, db: Session = Depends(get_db)
             )
         
         # Criar usuário com senha hasheada
-        hashed = hash_password(user_data.senha)
+        hashed = await hash_password_async(user_data.senha)
         db_user = User(
             email=user_data.email,
             senha_hash=hashed,
@@ -371,8 +1147,8 @@ async def registrar_usuario(user_data: UserCreate, db: Session = Depends(get_db)
         )
         
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         # Criar tokens
         tokens = create_user_tokens(db_user)
@@ -391,22 +1167,23 @@ async def registrar_usuario(user_data: UserCreate, db: Session = Depends(get_db)
     except HTTPException:
         raise
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já está em uso"
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Erro ao registrar usuário: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/auth/login", response_model=Token, tags=["Autenticação"])
-async def login_usuario(user_credentials: UserLogin, db: Session = Depends(get_db)):
+@orcamento_consultas(1)
+async def login_usuario(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login do usuário"""
     try:
         # Autenticar usuário
-        user = authenticate_user(db, user_credentials.email, user_credentials.senha)
+        user = await authenticate_user(db, user_credentials.email, user_credentials.senha)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -439,15 +1216,35 @@ async def login_usuario(user_credentials: UserLogin, db: Session = Depends(get_d
 # ========================================
 
 @app.get("/users/me", response_model=UserResponse, tags=["Usuário"])
-async def get_user_profile(current_user: User = Depends(get_current_user)):
+@orcamento_consultas(1)
+async def get_user_profile(current_user: UserResponse = Depends(get_current_user_cached)):
     """Obter perfil do usuário logado"""
-    return UserResponse.from_orm(current_user)
+    return current_user
+
+@app.get("/users/me/pedidos", response_model=List[PedidoHistoricoResponse], tags=["Usuário"])
+@orcamento_consultas(2)
+async def listar_meus_pedidos(
+    response: Response,
+    limit: int = Query(LIMITE_PEDIDOS_PADRAO, ge=1, le=LIMITE_PEDIDOS_MAXIMO, description="Quantidade máxima de pedidos por página"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco retornado em X-Next-Cursor"),
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db_leitura)
+):
+    """
+    Histórico de pedidos do usuário logado, com itens, mais recentes primeiro
+    Paginação por cursor: o cursor da próxima página vem no header X-Next-Cursor.
+    """
+    pedidos, proximo_cursor = await buscar_pagina_pedidos(db, principal.user_id, limit, cursor)
+    if proximo_cursor:
+        response.headers["X-Next-Cursor"] = proximo_cursor
+    return pedidos
 
 @app.put("/users/me", response_model=UserResponse, tags=["Usuário"])
+@orcamento_consultas(3)
 async def update_user_profile(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Atualizar perfil do usuário logado"""
     try:
@@ -459,15 +1256,16 @@ async def update_user_profile(
         if user_update.endereco is not None:
             current_user.endereco = user_update.endereco
         
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
+        invalidar_usuario(current_user.id)
         
         logger.info(f"Perfil atualizado: {current_user.email}")
         
         return UserResponse.from_orm(current_user)
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Erro ao atualizar perfil: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
@@ -475,7 +1273,7 @@ async def update_user_profile(
 async def upload_avatar(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload de avatar do usuário"""
     try:
@@ -486,36 +1284,31 @@ async def upload_avatar(
                 detail="Arquivo deve ser uma imagem"
             )
         
-        # Validar tamanho (máximo 5MB)
-        if file.size > 5 * 1024 * 1024:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Arquivo muito grande. Máximo 5MB"
-            )
-        
         # Criar diretório se não existir
-        avatar_dir = "uploads/avatars"
-        os.makedirs(avatar_dir, exist_ok=True)
+        os.makedirs(AVATAR_DIR, exist_ok=True)
         
         # Gerar nome único para o arquivo
         file_extension = file.filename.split(".")[-1] if "." in file.filename else "jpg"
+        if not file_extension.isalnum():
+            file_extension = "jpg"
         filename = f"{current_user.id}_{uuid.uuid4().hex}.{file_extension}"
-        file_path = os.path.join(avatar_dir, filename)
+        file_path = os.path.join(AVATAR_DIR, filename)
         
-        # Salvar arquivo
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
-        # Remover avatar anterior se existir
-        if current_user.avatar_filename:
-            old_path = os.path.join(avatar_dir, current_user.avatar_filename)
-            if os.path.exists(old_path):
-                os.remove(old_path)
+        # Salvar arquivo em blocos (limite de 5MB aplicado durante a leitura)
+        await salvar_upload_limitado(file, file_path)
         
         # Atualizar banco
+        avatar_anterior = current_user.avatar_filename
         current_user.avatar_filename = filename
-        db.commit()
+        await db.commit()
+        invalidar_usuario(current_user.id)
+        
+        # Remover avatar anterior (e miniaturas) se existir
+        if avatar_anterior:
+            await remover_avatar(avatar_anterior)
+        
+        # Miniaturas geradas no pool de workers, fora do caminho da requisição
+        agendar_miniaturas(filename)
         
         logger.info(f"Avatar atualizado: {current_user.email}")
         
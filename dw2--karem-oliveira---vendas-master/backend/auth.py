@@ -3,26 +3,53 @@ Utilidades de autenticação e segurança
 JWT, hash de senhas, validação de tokens
 """
 
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-from database import get_db
-from models import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, AsyncSessionLeitura
+from models import User, UserResponse, Principal
+from cache import CacheTTL
 
 # Configurações de segurança
 SECRET_KEY = "seu-secret-key-super-secreto-aqui-mude-em-producao-123456789"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Cache de perfis de usuário (sem janela stale: perfil sempre dentro do TTL)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ITENS = int(os.getenv("USER_CACHE_MAX_ITENS", "5000"))
+
+# Custo do bcrypt: hashes com custo diferente são regerados no próximo login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Pool de hash: "thread" (bcrypt libera o GIL) ou "process"
+HASH_POOL = os.getenv("HASH_POOL", "thread")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Máximo de hashes executando e aguardando; acima disso responde 503
+HASH_MAX_CONCORRENCIA = int(os.getenv("HASH_MAX_CONCORRENCIA", str(HASH_WORKERS)))
+HASH_MAX_FILA = int(os.getenv("HASH_MAX_FILA", "100"))
+
 # Contexto para hash de senhas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 
 # Esquema de autenticação Bearer
 security = HTTPBearer()
+# Variante que não exige o cabeçalho (rotas abertas a visitantes)
+security_opcional = HTTPBearer(auto_error=False)
 
 # ========== FUNÇÕES DE HASH ==========
 
@@ -34,6 +61,96 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha confere com o hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha e retorna novo hash se o custo configurado mudou"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# ========== POOL DE HASH ==========
+
+_executor: Optional[Executor] = None
+_semaforo: Optional[asyncio.Semaphore] = None
+
+# Contadores para métricas de fila
+_hash_metricas = {
+    "executando": 0,
+    "aguardando": 0,
+    "concluidos": 0,
+    "falhas": 0,  # exceção ou cancelamento durante o hash
+    "rejeitados": 0,
+}
+
+def _obter_executor() -> Executor:
+    """Cria o pool de hash na primeira utilização"""
+    global _executor
+    if _executor is None:
+        if HASH_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+def _obter_semaforo() -> asyncio.Semaphore:
+    """Semáforo que limita quantos hashes rodam ao mesmo tempo"""
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(HASH_MAX_CONCORRENCIA)
+    return _semaforo
+
+async def _executar_no_pool(funcao, *args):
+    """Executa função de hash no pool sem bloquear o event loop"""
+    if _hash_metricas["aguardando"] >= HASH_MAX_FILA:
+        _hash_metricas["rejeitados"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado. Tente novamente em instantes.",
+            headers={"Retry-After": "1"},
+        )
+
+    _hash_metricas["aguardando"] += 1
+    try:
+        await _obter_semaforo().acquire()
+    finally:
+        _hash_metricas["aguardando"] -= 1
+
+    _hash_metricas["executando"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        resultado = await loop.run_in_executor(_obter_executor(), funcao, *args)
+    except BaseException:
+        _hash_metricas["falhas"] += 1
+        raise
+    finally:
+        _hash_metricas["executando"] -= 1
+        _obter_semaforo().release()
+    _hash_metricas["concluidos"] += 1
+    return resultado
+
+async def hash_password_async(password: str) -> str:
+    """Gera hash da senha no pool de hash"""
+    return await _executar_no_pool(hash_password, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha no pool de hash (retorna novo hash se precisar atualizar)"""
+    return await _executar_no_pool(verify_and_update_password, plain_password, hashed_password)
+
+def metricas_hash() -> Dict[str, Any]:
+    """Profundidade da fila e contadores do pool de hash"""
+    return {
+        **_hash_metricas,
+        "pool": HASH_POOL,
+        "workers": HASH_WORKERS,
+        "max_concorrencia": HASH_MAX_CONCORRENCIA,
+        "max_fila": HASH_MAX_FILA,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+    }
+
+def encerrar_pool_hash():
+    """Encerra o pool de hash (shutdown da aplicação)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
 # ========== FUNÇÕES JWT ==========
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -61,18 +178,25 @@ def decode_access_token(token: str) -> Dict[str, Any]:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+# ========== CACHE DE USUÁRIOS ==========
+
+cache_usuarios = CacheTTL("usuarios", ttl=USER_CACHE_TTL, stale=0, max_itens=USER_CACHE_MAX_ITENS)
+
+def invalidar_usuario(user_id: int):
+    """Descarta o perfil em cache (chamar após alterar o usuário)"""
+    cache_usuarios.invalidar(user_id)
+
 # ========== DEPENDÊNCIAS DE AUTENTICAÇÃO ==========
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Dependência que retorna o usuário atual autenticado"""
-    
-    # Decodifica o token
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> Principal:
+    """
+    Dependência leve: só verifica a assinatura do token e lê os claims
+    Para endpoints que precisam apenas do id, email ou is_admin
+    """
     payload = decode_access_token(credentials.credentials)
     
-    # Extrai dados do usuário
     user_id: int = payload.get("user_id")
     if user_id is None:
         raise HTTPException(
@@ -81,8 +205,31 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    return Principal(
+        user_id=user_id,
+        email=payload.get("email"),
+        is_admin=bool(payload.get("is_admin"))
+    )
+
+async def get_optional_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_opcional)
+) -> Optional[Principal]:
+    """
+    Principal do token, se houver; None para visitantes
+    Um token presente mas inválido continua sendo 401
+    """
+    if credentials is None:
+        return None
+    return await get_current_principal(credentials)
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Dependência que retorna o usuário atual autenticado (linha do banco, para alterações)"""
+    
     # Busca usuário no banco
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, principal.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -92,24 +239,52 @@ def get_current_user(
     
     return user
 
-def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
-    """Dependência que verifica se o usuário atual é admin"""
-    if not current_user.is_admin:
+async def get_current_user_cached(principal: Principal = Depends(get_current_principal)) -> UserResponse:
+    """Dependência que retorna o perfil do usuário atual a partir do cache (somente leitura)"""
+    
+    async def carregar_usuario():
+        async with AsyncSessionLeitura() as sessao:
+            user = await sessao.get(User, principal.user_id)
+        return (UserResponse.from_orm(user) if user else None), []
+    
+    user = await cache_usuarios.obter(principal.user_id, carregar_usuario)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não encontrado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return user
+
+async def get_current_admin_user(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Dependência que verifica se o usuário atual é admin (pelo claim is_admin do token)"""
+    if not principal.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acesso negado. Privilégios de administrador necessários."
         )
-    return current_user
+    return principal
 
 # ========== FUNÇÕES DE AUTENTICAÇÃO ==========
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Autentica usuário com email e senha"""
-    user = db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     if not user:
         return None
-    if not verify_password(password, user.senha_hash):
+    
+    valido, novo_hash = await verify_and_update_password_async(password, user.senha_hash)
+    if not valido:
         return None
+    
+    # Custo do bcrypt mudou: regrava o hash de forma transparente
+    if novo_hash:
+        user.senha_hash = novo_hash
+        await db.commit()
+        await db.refresh(user)
+    
     return user
 
 def create_user_tokens(user: User) -> Dict[str, Any]:
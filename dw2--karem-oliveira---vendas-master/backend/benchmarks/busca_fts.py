@@ -0,0 +1,121 @@
+"""
+Benchmark da busca de produtos: ILIKE (varredura) x índice FTS5
+Execute a partir da pasta backend: python benchmarks/busca_fts.py [10000 100000 1000000]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+from models import Produto
+from migracoes import aplicar_migracoes
+from busca import (
+    detectar_indice_busca, suspender_indice_busca, reconstruir_indice_busca,
+    montar_expressao_busca, filtrar_busca
+)
+
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000]
+
+# Termos seletivos (vocabulário sintético), acento, prefixo e um termo muito comum
+TERMOS = ["vetora", "lurimo caderno", "matematica", "calc", "azul"]
+REPETICOES = 5
+LIMITE = 100
+
+PALAVRAS = [
+    "Matemática", "Português", "História", "Geografia", "Ciências", "Caderno",
+    "Mochila", "Lápis", "Caneta", "Calculadora", "Régua", "Estojo", "Camiseta",
+    "Bola", "Tablet", "Fone", "Atlas", "Dicionário", "Azul", "Vermelho", "Grande",
+]
+SILABAS = ["ba", "ve", "ti", "lo", "mu", "ra", "se", "do", "ni", "ca", "pe", "ri", "mo", "ta", "lu"]
+CATEGORIAS = ["Livros", "Material Escolar", "Uniformes", "Eletrônicos", "Esportes", "Arte"]
+
+def popular(engine, quantidade: int):
+    """Insere produtos sintéticos em lotes via executemany"""
+    rng = random.Random(42)
+    vocabulario = sorted({"".join(rng.choices(SILABAS, k=3)) for _ in range(5000)})
+    vocabulario += ["vetora", "lurimo"]
+    lote = []
+    with engine.begin() as conn:
+        for i in range(quantidade):
+            nome = " ".join(rng.sample(PALAVRAS, 2) + rng.sample(vocabulario, 2))
+            lote.append({
+                "nome": nome[:60],
+                "descricao": " ".join(rng.sample(PALAVRAS, 4) + rng.sample(vocabulario, 4)),
+                "preco": round(rng.uniform(1, 500), 2),
+                "estoque": rng.randint(0, 100),
+                "categoria": rng.choice(CATEGORIAS),
+                "sku": f"BENCH{i:07d}",
+            })
+            if len(lote) == 10_000:
+                conn.execute(Produto.__table__.insert(), lote)
+                lote = []
+        if lote:
+            conn.execute(Produto.__table__.insert(), lote)
+
+def cronometrar(funcao) -> float:
+    """Mediana em milissegundos de REPETICOES execuções"""
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+def executar(quantidade: int):
+    with tempfile.TemporaryDirectory() as pasta:
+        engine = create_engine(f"sqlite:///{os.path.join(pasta, 'bench.db')}")
+        aplicar_migracoes(engine)
+        if not detectar_indice_busca(engine):
+            print("SQLite sem suporte a FTS5")
+            return
+
+        # Carga sem os triggers do índice, como em carga_produtos; o índice é construído de uma vez
+        suspender_indice_busca(engine)
+        inicio = time.perf_counter()
+        popular(engine, quantidade)
+        carga = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        reconstruir_indice_busca(engine)
+        indexacao = time.perf_counter() - inicio
+
+        print(f"\n📦 {quantidade:,} produtos (carga {carga:.1f}s, índice FTS {indexacao:.1f}s)")
+        print(f"   {'termo':<16}{'ILIKE (ms)':>12}{'FTS5 (ms)':>12}{'ganho':>10}")
+
+        db = sessionmaker(bind=engine)()
+        try:
+            for termo in TERMOS:
+                def via_ilike():
+                    padrao = f"%{termo}%"
+                    db.query(Produto).filter(
+                        or_(Produto.nome.ilike(padrao), Produto.descricao.ilike(padrao))
+                    ).order_by(Produto.nome, Produto.id).limit(LIMITE).all()
+
+                def via_fts():
+                    filtrar_busca(db.query(Produto), montar_expressao_busca(termo)).order_by(
+                        Produto.nome, Produto.id
+                    ).limit(LIMITE).all()
+
+                ms_ilike = cronometrar(via_ilike)
+                ms_fts = cronometrar(via_fts)
+                print(f"   {termo:<16}{ms_ilike:>12.2f}{ms_fts:>12.2f}{ms_ilike / ms_fts:>9.1f}x")
+        finally:
+            db.close()
+            engine.dispose()
+
+if __name__ == "__main__":
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or TAMANHOS_PADRAO
+
+    print("🔎 BENCHMARK DE BUSCA - ILIKE x FTS5")
+    print("=" * 50)
+    print("Observação: ILIKE '%x%' não usa índice; 'matematica' só casa com 'Matemática' no FTS5")
+
+    for quantidade in tamanhos:
+        executar(quantidade)
@@ -0,0 +1,299 @@
+"""
+Teste de carga da API inteira com dados sintéticos (dados_sinteticos.py)
+Sobe um uvicorn local num banco gerado com semente fixa e reproduz uma mistura
+de tráfego roteirizada (navegação, busca, detalhe, login, checkout, histórico).
+Grava vazão e latência p50/p95/p99 por endpoint num JSON (baseline) e,
+com --comparar, aponta regressões em relação a um baseline anterior.
+
+Execute a partir da pasta backend:
+    python benchmarks/carga_api.py                                  # grava benchmarks/baselines/carga-<commit>.json
+    python benchmarks/carga_api.py --comparar benchmarks/baselines/carga-<outro>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from concorrencia import BACKEND_ATUAL, subir_servidor, requisitar_resposta
+
+# Peso de cada ação na mistura de tráfego (uma sessão sorteia as ações com a própria semente)
+MISTURA = {
+    "navegar": 30,
+    "proxima_pagina": 8,
+    "buscar": 15,
+    "detalhe": 25,
+    "categorias": 7,
+    "checkout": 10,
+    "historico": 5,
+}
+CHANCE_LOGIN = 0.4  # sessões que fazem login antes de navegar (as demais compram como visitante)
+TERMOS_BUSCA = ["caderno", "mochila", "calculadora", "livro", "camisa", "tinta", "bola", "lapis", "fone azul"]
+CATEGORIAS = ["Livros", "Material Escolar", "Uniformes", "Eletrônicos", "Esportes", "Arte"]
+
+VERSAO_BASELINE = 1
+PASTA_BASELINES = os.path.join(BACKEND_ATUAL, "benchmarks", "baselines")
+
+# ========== SESSÕES ==========
+
+class Sessao:
+    """Um visitante: conexão keep-alive própria e um roteiro sorteado com semente fixa"""
+
+    def __init__(self, numero: int, args, amostras: Dict[str, List[float]], erros: Dict[str, Dict[str, int]]):
+        self.rng = random.Random(args.semente * 1000 + numero)
+        self.args = args
+        self.usuario = numero % args.usuarios + 1
+        self.amostras = amostras
+        self.erros = erros
+        self.cabecalhos: Dict[str, str] = {}
+        self.listagem: Optional[str] = None  # última listagem com próxima página (cursor)
+
+    async def chamar(self, endpoint: str, caminho: str, metodo: str = "GET", corpo: Optional[dict] = None,
+                     extras: Optional[Dict[str, str]] = None):
+        dados = json.dumps(corpo).encode() if corpo is not None else b""
+        inicio = time.perf_counter()
+        status, cabecalhos, conteudo = await requisitar_resposta(
+            self.reader, self.writer, "127.0.0.1", caminho, metodo, dados, {**self.cabecalhos, **(extras or {})}
+        )
+        self.amostras.setdefault(endpoint, []).append((time.perf_counter() - inicio) * 1000)
+        if status >= 400:
+            por_status = self.erros.setdefault(endpoint, {})
+            por_status[str(status)] = por_status.get(str(status), 0) + 1
+        return status, cabecalhos, conteudo
+
+    async def login(self):
+        status, _, conteudo = await self.chamar(
+            "POST /auth/login", "/auth/login", "POST",
+            {"email": f"usuario{self.usuario}@sintetico.loja", "senha": self.args.senha}
+        )
+        if status == 200:
+            self.cabecalhos["Authorization"] = f"Bearer {json.loads(conteudo)['access_token']}"
+
+    async def acao(self, nome: str):
+        rng = self.rng
+        if nome == "navegar" or (nome == "proxima_pagina" and not self.listagem):
+            caminho = rng.choice([
+                "/produtos?limit=20",
+                "/produtos?limit=20&sort=preco&order=asc",
+                f"/produtos?limit=20&categoria={quote(rng.choice(CATEGORIAS))}",
+            ])
+            _, cabecalhos, _ = await self.chamar("GET /produtos", caminho)
+            self._guardar_listagem(caminho, cabecalhos)
+        elif nome == "proxima_pagina":
+            caminho = self.listagem
+            _, cabecalhos, _ = await self.chamar("GET /produtos", caminho)
+            self._guardar_listagem(caminho.split("&cursor=")[0], cabecalhos)
+        elif nome == "buscar":
+            termo = quote(rng.choice(TERMOS_BUSCA))
+            await self.chamar("GET /produtos?search", f"/produtos?search={termo}&limit=20")
+        elif nome == "detalhe":
+            await self.chamar("GET /produtos/{id}", f"/produtos/{self._produto()}")
+        elif nome == "categorias":
+            await self.chamar("GET /categorias", "/categorias")
+        elif nome == "checkout":
+            itens = {self._produto(): 1 for _ in range(rng.randint(1, 3))}
+            await self.chamar(
+                "POST /carrinho/confirmar", "/carrinho/confirmar", "POST",
+                {
+                    "itens": [{"produto_id": pid, "quantidade": qtd} for pid, qtd in itens.items()],
+                    "cupom": "ALUNO10" if rng.random() < 0.2 else None,
+                },
+                {"Idempotency-Key": str(uuid.UUID(int=rng.getrandbits(128)))}
+            )
+        elif nome == "historico":
+            if "Authorization" in self.cabecalhos:
+                await self.chamar("GET /users/me/pedidos", "/users/me/pedidos?limit=20")
+            else:
+                await self.acao("navegar")
+
+    def _guardar_listagem(self, caminho: str, cabecalhos: Dict[str, str]):
+        """A próxima página repete os filtros e a ordenação da listagem (o cursor depende deles)"""
+        cursor = cabecalhos.get("x-next-cursor")
+        self.listagem = f"{caminho}&cursor={cursor}" if cursor else None
+
+    def _produto(self) -> int:
+        # Metade das visitas nos 5% mais vistos: o cache de produto tem acertos realistas
+        if self.rng.random() < 0.5:
+            return self.rng.randint(1, max(1, self.args.produtos // 20))
+        return self.rng.randint(1, self.args.produtos)
+
+    async def executar(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.args.porta)
+        try:
+            if self.rng.random() < CHANCE_LOGIN:
+                await self.login()
+            acoes = self.rng.choices(list(MISTURA), weights=list(MISTURA.values()), k=self.args.requisicoes)
+            for nome in acoes:
+                await self.acao(nome)
+        finally:
+            self.writer.close()
+
+# ========== MEDIÇÃO ==========
+
+def resumir(latencias: List[float], erros: Dict[str, int], duracao: float) -> Dict[str, object]:
+    ordenadas = sorted(latencias)
+    quantis = statistics.quantiles(ordenadas, n=100, method="inclusive") if len(ordenadas) > 1 else ordenadas * 99
+    return {
+        "requisicoes": len(ordenadas),
+        "erros": sum(erros.values()),
+        "erros_por_status": dict(sorted(erros.items())),
+        "req_s": round(len(ordenadas) / duracao, 1),
+        "p50_ms": round(quantis[49], 2),
+        "p95_ms": round(quantis[94], 2),
+        "p99_ms": round(quantis[98], 2),
+        "max_ms": round(ordenadas[-1], 2),
+    }
+
+async def rodar_carga(args) -> Dict[str, dict]:
+    amostras: Dict[str, List[float]] = {}
+    erros: Dict[str, Dict[str, int]] = {}
+
+    # Aquecimento (não medido): caches, pools de conexões e de hash
+    aquecimento = argparse.Namespace(**{**vars(args), "requisicoes": 20})
+    await asyncio.gather(*[Sessao(-1 - i, aquecimento, {}, {}).executar() for i in range(5)])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[Sessao(i, args, amostras, erros).executar() for i in range(args.clientes)])
+    duracao = time.perf_counter() - inicio
+
+    endpoints = {
+        endpoint: resumir(latencias, erros.get(endpoint, {}), duracao)
+        for endpoint, latencias in sorted(amostras.items())
+    }
+    todas = [latencia for latencias in amostras.values() for latencia in latencias]
+    erros_total: Dict[str, int] = {}
+    for por_status in erros.values():
+        for codigo, quantidade in por_status.items():
+            erros_total[codigo] = erros_total.get(codigo, 0) + quantidade
+    return {"duracao_s": round(duracao, 2), "total": resumir(todas, erros_total, duracao), "endpoints": endpoints}
+
+def commit_atual() -> Dict[str, object]:
+    def git(*comando):
+        return subprocess.run(["git", *comando], cwd=BACKEND_ATUAL, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "--short", "HEAD") or "desconhecido", "alteracoes_locais": bool(git("status", "--porcelain", "."))}
+
+# ========== COMPARAÇÃO ==========
+
+def comparar(atual: dict, anterior: dict, tolerancia: float, folga_ms: float) -> int:
+    """
+    Compara endpoint a endpoint; regressão: p95 acima de (1 + tolerância) do anterior
+    (e acima da folga absoluta), vazão abaixo de (1 - tolerância) ou erros onde não
+    havia. Retorna quantas houve.
+    """
+    if atual["parametros"] != anterior.get("parametros"):
+        print("⚠️  Parâmetros diferentes do baseline: a comparação pode não ser justa")
+    print(f"\nComparando com {anterior.get('commit', '?')} ({anterior.get('data', '?')})")
+    print(f"{'endpoint':<28}{'p95 antes':>11}{'p95 agora':>11}{'Δ p95':>9}{'req/s antes':>13}{'req/s agora':>13}")
+
+    regressoes = 0
+    for endpoint, medida in atual["endpoints"].items():
+        base = anterior.get("endpoints", {}).get(endpoint)
+        if not base:
+            print(f"{endpoint:<28}{'-':>11}{medida['p95_ms']:>11.1f}{'novo':>9}")
+            continue
+        variacao = medida["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        piorou = (
+            (variacao > tolerancia and medida["p95_ms"] - base["p95_ms"] > folga_ms)
+            or medida["req_s"] < base["req_s"] * (1 - tolerancia)
+            or (medida["erros"] > 0 and not base.get("erros"))
+        )
+        regressoes += piorou
+        print(
+            f"{endpoint:<28}{base['p95_ms']:>11.1f}{medida['p95_ms']:>11.1f}{variacao * 100:>+8.0f}%"
+            f"{base['req_s']:>13.1f}{medida['req_s']:>13.1f}  {'❌' if piorou else '✅'}"
+        )
+    return regressoes
+
+# ========== EXECUÇÃO ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga da API com dados sintéticos")
+    parser.add_argument("--produtos", type=int, default=20000)
+    parser.add_argument("--usuarios", type=int, default=2000)
+    parser.add_argument("--pedidos", type=int, default=100000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--clientes", type=int, default=50, help="Sessões simultâneas")
+    parser.add_argument("--requisicoes", type=int, default=40, help="Ações por sessão")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                        help="Custo do hash das senhas sintéticas (o login paga esse custo)")
+    parser.add_argument("--porta", type=int, default=8766)
+    parser.add_argument("--saida", help="Arquivo JSON do resultado (padrão: benchmarks/baselines/carga-<commit>.json)")
+    parser.add_argument("--comparar", help="Baseline anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita (0.2 = 20%%)")
+    parser.add_argument("--folga-ms", type=float, default=2.0, help="Piora absoluta de p95 sempre aceita")
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    sys.path.insert(0, BACKEND_ATUAL)
+    from sqlalchemy import create_engine
+    from migracoes import aplicar_migracoes
+    from dados_sinteticos import SENHA_SINTETICA, gerar_dados
+    import imagens
+    args.senha = SENHA_SINTETICA
+
+    print("🚦 TESTE DE CARGA DA API")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        engine = create_engine(f"sqlite:///{os.path.join(pasta, 'app.db')}")
+        aplicar_migracoes(engine)
+        dados = gerar_dados(engine, args.produtos, args.usuarios, args.pedidos, args.semente)
+        engine.dispose()
+        print(f"Dados: {dados['produtos']:,} produtos, {dados['usuarios']:,} usuários, "
+              f"{dados['pedidos']:,} pedidos ({dados['itens_pedido']:,} itens), semente {args.semente}")
+
+        # Variantes de imagem geradas antes de subir o servidor: o startup só as registra
+        # e a codificação AVIF/WebP não disputa CPU com a medição
+        imagens.VARIANTES_DIR = os.path.join(pasta, "uploads", "imagens")
+        asyncio.run(imagens.preparar_variantes())
+
+        servidor = subir_servidor(BACKEND_ATUAL, pasta, args.porta)
+        try:
+            loop = asyncio.new_event_loop()
+            medicao = loop.run_until_complete(rodar_carga(args))
+            loop.close()
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+    resultado = {
+        "versao": VERSAO_BASELINE,
+        **commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "parametros": {
+            chave: getattr(args, chave)
+            for chave in ("produtos", "usuarios", "pedidos", "semente", "clientes", "requisicoes", "bcrypt_rounds")
+        },
+        **medicao,
+    }
+
+    print(f"\n{args.clientes} sessões x {args.requisicoes} ações em {medicao['duracao_s']}s\n")
+    print(f"{'endpoint':<28}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}")
+    for endpoint, medida in [*medicao["endpoints"].items(), ("TOTAL", medicao["total"])]:
+        print(f"{endpoint:<28}{medida['requisicoes']:>7}{medida['req_s']:>9.1f}{medida['p50_ms']:>9.1f}"
+              f"{medida['p95_ms']:>9.1f}{medida['p99_ms']:>9.1f}{medida['erros']:>7}"
+              + (f"  {medida['erros_por_status']}" if medida["erros"] else ""))
+
+    saida = args.saida or os.path.join(PASTA_BASELINES, f"carga-{resultado['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"\n💾 Baseline gravado em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia, args.folga_ms)
+        print(f"\n❌ {regressoes} endpoint(s) com regressão" if regressoes else "\n✅ Sem regressões")
+        sys.exit(1 if regressoes else 0)
@@ -0,0 +1,83 @@
+"""
+Benchmark da carga em lote do catálogo: importação (inserção e atualização) e exportação
+Mede linhas por segundo e o pico de memória do processo
+
+Execute a partir da pasta backend: python benchmarks/carga_produtos.py [--produtos 1000000]
+"""
+
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from migracoes import aplicar_migracoes
+from carga_produtos import CAMPOS, ler_registros, importar_produtos, exportar_produtos
+
+CATEGORIAS = ["Livros", "Material Escolar", "Uniformes", "Eletrônicos", "Esportes", "Arte"]
+
+def gerar_csv(caminho: str, quantidade: int, semente: int):
+    """Lista de preços sintética de fornecedor, gravada linha a linha"""
+    rng = random.Random(semente)
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(CAMPOS)
+        for i in range(quantidade):
+            escritor.writerow([
+                f"FORN{i:07d}",
+                f"Produto {i} {rng.choice(['Caderno', 'Lápis', 'Mochila', 'Livro'])}",
+                "Item da lista de preços do fornecedor",
+                f"{rng.uniform(1, 300):.2f}",
+                rng.randint(0, 500),
+                rng.choice(CATEGORIAS),
+                "",
+            ])
+
+def pico_memoria_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def importar(engine, caminho: str, rotulo: str):
+    inicio = time.perf_counter()
+    with open(caminho, "rb") as arquivo:
+        relatorio = importar_produtos(engine, ler_registros(arquivo, "csv"))
+    duracao = time.perf_counter() - inicio
+    print(
+        f"{rotulo:<22}{duracao:>8.1f}s{relatorio['linhas'] / duracao:>12,.0f} linhas/s"
+        f"   criados={relatorio['criados']} atualizados={relatorio['atualizados']}"
+        f" erros={relatorio['total_erros']}   pico {pico_memoria_mb():.0f} MB"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da importação/exportação em lote")
+    parser.add_argument("--produtos", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print("📦 BENCHMARK CARGA EM LOTE DO CATÁLOGO")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        entrada = os.path.join(pasta, "fornecedor.csv")
+        gerar_csv(entrada, args.produtos, semente=1)
+        print(f"{args.produtos:,} linhas, memória inicial {pico_memoria_mb():.0f} MB\n")
+
+        engine = create_engine(f"sqlite:///{os.path.join(pasta, 'bench.db')}")
+        aplicar_migracoes(engine)
+
+        importar(engine, entrada, "importação (inserção)")
+
+        gerar_csv(entrada, args.produtos, semente=2)
+        importar(engine, entrada, "importação (upsert)")
+
+        inicio = time.perf_counter()
+        with open(os.path.join(pasta, "saida.jsonl"), "w", encoding="utf-8") as saida:
+            total = exportar_produtos(engine, saida, "jsonl")
+        duracao = time.perf_counter() - inicio
+        print(f"{'exportação jsonl':<22}{duracao:>8.1f}s{total / duracao:>12,.0f} linhas/s"
+              f"   pico {pico_memoria_mb():.0f} MB")
+        engine.dispose()
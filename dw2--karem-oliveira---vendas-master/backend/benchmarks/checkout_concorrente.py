@@ -0,0 +1,107 @@
+"""
+Teste de carga do checkout: muitos compradores disputando um produto com pouco estoque
+Verifica que o estoque nunca fica negativo e mede checkouts por segundo
+Com --reservas cada comprador reserva o produto ao colocá-lo no carrinho
+(PUT /carrinho/reservas) e só confirma se a reserva deu certo: quem fica
+sem estoque descobre na reserva, não numa confirmação que falha
+
+Execute a partir da pasta backend: python benchmarks/checkout_concorrente.py [--reservas]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Optional
+
+from concorrencia import BACKEND_ATUAL, criar_banco, subir_servidor, requisitar_resposta
+
+async def comprador(
+    host: str, porta: int, numero: int, produto_id: int, quantidade: int,
+    status: Counter, reservas: Optional[Counter]
+):
+    """Um comprador: conexão própria, reserva (opcional) e uma confirmação de carrinho"""
+    reader, writer = await asyncio.open_connection(host, porta)
+    try:
+        extras = None
+        if reservas is not None:
+            extras = {"X-Sessao-Carrinho": f"comprador-{numero:010d}"}
+            corpo = json.dumps({"quantidade": quantidade}).encode()
+            resultado, _, _ = await requisitar_resposta(
+                reader, writer, host, f"/carrinho/reservas/{produto_id}", "PUT", corpo, extras
+            )
+            reservas[resultado] += 1
+            if resultado != 200:
+                return  # sem estoque para reservar: não chega a confirmar
+        corpo = json.dumps({"itens": [{"produto_id": produto_id, "quantidade": quantidade}]}).encode()
+        resultado, _, _ = await requisitar_resposta(reader, writer, host, "/carrinho/confirmar", "POST", corpo, extras)
+        status[resultado] += 1
+    finally:
+        writer.close()
+
+async def disputar(host: str, porta: int, compradores: int, produto_id: int, quantidade: int, com_reservas: bool):
+    status = Counter()
+    reservas = Counter() if com_reservas else None
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        comprador(host, porta, numero, produto_id, quantidade, status, reservas) for numero in range(compradores)
+    ])
+    return status, reservas, time.perf_counter() - inicio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do checkout concorrente")
+    parser.add_argument("--backend", default=BACKEND_ATUAL, help="Pasta backend a testar")
+    parser.add_argument("--compradores", type=int, default=300)
+    parser.add_argument("--estoque", type=int, default=25)
+    parser.add_argument("--quantidade", type=int, default=1)
+    parser.add_argument("--porta", type=int, default=8766)
+    parser.add_argument("--reservas", action="store_true", help="Reservar no carrinho antes de confirmar")
+    args = parser.parse_args()
+
+    print("🛒 CHECKOUT CONCORRENTE")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        criar_banco(pasta, 10)
+        banco = os.path.join(pasta, "app.db")
+        with sqlite3.connect(banco) as conn:
+            conn.execute("UPDATE produtos SET estoque = ? WHERE id = 1", (args.estoque,))
+
+        servidor = subir_servidor(args.backend, pasta, args.porta)
+        try:
+            status, reservas, duracao = asyncio.run(
+                disputar("127.0.0.1", args.porta, args.compradores, 1, args.quantidade, args.reservas)
+            )
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+        with sqlite3.connect(banco) as conn:
+            estoque_final, reservado_final = conn.execute(
+                "SELECT estoque, reservado FROM produtos WHERE id = 1"
+            ).fetchone()
+            vendidos = conn.execute(
+                "SELECT COALESCE(SUM(quantidade), 0) FROM itens_pedido WHERE produto_id = 1"
+            ).fetchone()[0]
+
+    sucesso = status.get(200, 0)
+    print(f"Compradores: {args.compradores} | Estoque inicial: {args.estoque}")
+    if reservas is not None:
+        print(f"Reservas: {dict(sorted(reservas.items()))}")
+    print(f"Confirmações: {dict(sorted(status.items()))} ({sum(status.values()) - sucesso} com falha)")
+    print(f"Checkouts/s: {args.compradores / duracao:.0f} ({duracao:.2f}s no total)")
+    print(f"Estoque final: {estoque_final} | Reservado: {reservado_final} | Unidades vendidas: {vendidos}")
+
+    ok = (
+        estoque_final >= 0
+        and reservado_final == 0
+        and vendidos == sucesso * args.quantidade
+        and estoque_final + vendidos == args.estoque
+    )
+    print("✅ Estoque consistente" if ok else "❌ Estoque inconsistente (overselling)")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,163 @@
+"""
+Benchmark de concorrência da API: latência p50/p95/p99 com 50 a 500 clientes simultâneos
+Sobe um uvicorn local com banco temporário e dispara uma mistura de GETs de catálogo
+
+Execute a partir da pasta backend: python benchmarks/concorrencia.py
+Para comparar antes/depois, gere outra cópia do backend (ex.: git worktree add /tmp/antes <commit>)
+e rode: python benchmarks/concorrencia.py --backend /tmp/antes/dw2--karem-oliveira---vendas-master/backend
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+BACKEND_ATUAL = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_ATUAL)
+
+NIVEIS_PADRAO = [50, 100, 200, 500]
+REQUISICOES_POR_CLIENTE = 10
+
+# ========== SERVIDOR LOCAL ==========
+
+def criar_banco(pasta: str, produtos: int):
+    """Cria app.db temporário com produtos sintéticos"""
+    from sqlalchemy import create_engine
+    from migracoes import aplicar_migracoes
+    from models import Produto
+
+    # Schema pelas migrações: com create_all os ALTER TABLE das migrações falhariam no startup
+    engine = create_engine(f"sqlite:///{os.path.join(pasta, 'app.db')}")
+    aplicar_migracoes(engine)
+    rng = random.Random(7)
+    categorias = ["Livros", "Material Escolar", "Uniformes", "Eletrônicos", "Esportes", "Arte"]
+    with engine.begin() as conn:
+        conn.execute(Produto.__table__.insert(), [
+            {
+                "nome": f"Produto {i} {rng.choice(['Caderno', 'Lápis', 'Mochila', 'Livro'])}",
+                "descricao": "Produto sintético para benchmark",
+                "preco": round(rng.uniform(1, 300), 2),
+                "estoque": 1000,
+                "categoria": rng.choice(categorias),
+                "sku": f"CONC{i:06d}",
+            }
+            for i in range(produtos)
+        ])
+    engine.dispose()
+
+def subir_servidor(backend: str, pasta: str, porta: int) -> subprocess.Popen:
+    """Inicia uvicorn com o banco temporário e espera o /health responder"""
+    env = dict(os.environ, PYTHONPATH=backend)
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=pasta, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{porta}/health", timeout=1)
+            return processo
+        except Exception:
+            time.sleep(0.1)
+    processo.kill()
+    raise RuntimeError("Servidor não respondeu ao /health")
+
+# ========== CLIENTE HTTP ==========
+
+async def requisitar_resposta(
+    reader, writer, host: str, caminho: str, metodo: str = "GET", corpo: bytes = b"",
+    extras: Optional[Dict[str, str]] = None
+) -> Tuple[int, Dict[str, str], bytes]:
+    """Requisição HTTP/1.1 com keep-alive; retorna status, cabeçalhos (minúsculos) e corpo"""
+    cabecalhos = f"{metodo} {caminho} HTTP/1.1\r\nHost: {host}\r\n"
+    if corpo:
+        cabecalhos += f"Content-Type: application/json\r\nContent-Length: {len(corpo)}\r\n"
+    for nome, valor in (extras or {}).items():
+        cabecalhos += f"{nome}: {valor}\r\n"
+    writer.write(cabecalhos.encode() + b"\r\n" + corpo)
+    await writer.drain()
+    cabecalho = await reader.readuntil(b"\r\n\r\n")
+    linhas = cabecalho.decode("latin-1").split("\r\n")
+    status = int(linhas[0].split()[1])
+    recebidos = {}
+    for linha in linhas[1:]:
+        if ":" in linha:
+            nome, valor = linha.split(":", 1)
+            recebidos[nome.strip().lower()] = valor.strip()
+    conteudo = await reader.readexactly(int(recebidos.get("content-length", 0)))
+    return status, recebidos, conteudo
+
+async def requisitar(reader, writer, host: str, caminho: str, metodo: str = "GET", corpo: bytes = b""):
+    """Requisição HTTP/1.1 com keep-alive; retorna o status"""
+    status, _, _ = await requisitar_resposta(reader, writer, host, caminho, metodo, corpo)
+    return status
+
+async def cliente(host: str, porta: int, produtos: int, latencias: list, erros: list):
+    """Um cliente: conexão própria e REQUISICOES_POR_CLIENTE GETs variados"""
+    rng = random.Random()
+    reader, writer = await asyncio.open_connection(host, porta)
+    try:
+        for _ in range(REQUISICOES_POR_CLIENTE):
+            caminho = rng.choice([
+                "/produtos?limit=50",
+                "/produtos?search=caderno&limit=20",
+                "/produtos?sort=preco&order=desc&limit=50",
+                f"/produtos/{rng.randint(1, produtos)}",
+                "/categorias",
+            ])
+            inicio = time.perf_counter()
+            status = await requisitar(reader, writer, host, caminho)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            if status != 200:
+                erros.append(status)
+    finally:
+        writer.close()
+
+async def medir(host: str, porta: int, clientes: int, produtos: int):
+    latencias, erros = [], []
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        cliente(host, porta, produtos, latencias, erros) for _ in range(clientes)
+    ])
+    duracao = time.perf_counter() - inicio
+    quantis = statistics.quantiles(latencias, n=100)
+    return {
+        "clientes": clientes,
+        "req_s": len(latencias) / duracao,
+        "p50": quantis[49],
+        "p95": quantis[94],
+        "p99": quantis[98],
+        "erros": len(erros),
+    }
+
+# ========== EXECUÇÃO ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concorrência da API")
+    parser.add_argument("--backend", default=BACKEND_ATUAL, help="Pasta backend a testar")
+    parser.add_argument("--produtos", type=int, default=20_000)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--niveis", type=int, nargs="+", default=NIVEIS_PADRAO)
+    args = parser.parse_args()
+
+    print("⚡ BENCHMARK DE CONCORRÊNCIA")
+    print("=" * 50)
+    print(f"Backend: {args.backend}")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        criar_banco(pasta, args.produtos)
+        servidor = subir_servidor(args.backend, pasta, args.porta)
+        try:
+            print(f"\n{'clientes':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}")
+            for nivel in args.niveis:
+                r = asyncio.run(medir("127.0.0.1", args.porta, nivel, args.produtos))
+                print(f"{r['clientes']:>9}{r['req_s']:>10.0f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['erros']:>8}")
+        finally:
+            servidor.terminate()
+            servidor.wait()
@@ -0,0 +1,98 @@
+"""
+Custo das métricas por requisição, isolado do ruído do banco:
+- middleware: a mesma rota chamada direto pela interface ASGI, sem e com MetricasMiddleware
+- SQL: a mesma consulta no SQLite em memória, sem e com os eventos de instrumentar_engine
+Também mede o tempo de gerar o /metrics
+
+Execute a partir da pasta backend: python benchmarks/metricas_overhead.py [--requisicoes 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from metricas import MetricasMiddleware, instrumentar_engine, expor_metricas
+
+REPETICOES = 5  # melhor de N rodadas, alternando sem/com para diluir ruído
+
+def criar_app(com_metricas: bool):
+    app = FastAPI()
+
+    @app.get("/produtos/{produto_id}")
+    async def produto(produto_id: int):
+        return {"id": produto_id}
+
+    if com_metricas:
+        app.add_middleware(MetricasMiddleware, rotas=lambda: app.routes)
+    return app
+
+async def chamar(app, caminho: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": caminho, "raw_path": caminho.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensagem):
+        pass
+
+    await app(scope, receive, send)
+
+async def medir_http(app, requisicoes: int) -> float:
+    inicio = time.perf_counter()
+    for i in range(requisicoes):
+        await chamar(app, f"/produtos/{i}")
+    return (time.perf_counter() - inicio) / requisicoes
+
+def medir_sql(engine, consultas: int) -> float:
+    with engine.connect() as conn:
+        consulta = text("SELECT :id")
+        inicio = time.perf_counter()
+        for i in range(consultas):
+            conn.execute(consulta, {"id": i}).scalar()
+        return (time.perf_counter() - inicio) / consultas
+
+def comparar(titulo: str, sem: float, com: float):
+    print(f"{titulo:<11} {sem * 1e6:8.1f} µs {com * 1e6:8.1f} µs {(com - sem) * 1e6:+8.1f} µs ({(com / sem - 1) * 100:+.1f}%)")
+
+def main(requisicoes: int):
+    loop = asyncio.new_event_loop()
+    apps = {False: criar_app(False), True: criar_app(True)}
+    engines = {False: create_engine("sqlite://"), True: create_engine("sqlite://")}
+    instrumentar_engine(engines[True], "benchmark")
+
+    http = {False: float("inf"), True: float("inf")}
+    sql = {False: float("inf"), True: float("inf")}
+    loop.run_until_complete(medir_http(apps[True], 200))  # aquecimento
+    for _ in range(REPETICOES):
+        for com_metricas in (False, True):
+            http[com_metricas] = min(http[com_metricas], loop.run_until_complete(medir_http(apps[com_metricas], requisicoes)))
+            sql[com_metricas] = min(sql[com_metricas], medir_sql(engines[com_metricas], requisicoes))
+    loop.close()
+
+    print(f"{'':<11} {'sem':>11} {'com':>11} {'custo':>11}")
+    comparar("requisição", http[False], http[True])
+    comparar("consulta", sql[False], sql[True])
+
+    inicio = time.perf_counter()
+    corpo = expor_metricas()
+    print(f"/metrics: {(time.perf_counter() - inicio) * 1000:.2f} ms ({len(corpo):,} bytes)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Custo do middleware de métricas")
+    parser.add_argument("--requisicoes", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("📈 CUSTO DAS MÉTRICAS POR REQUISIÇÃO")
+    print("=" * 50)
+    main(args.requisicoes)
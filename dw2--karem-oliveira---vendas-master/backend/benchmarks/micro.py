@@ -0,0 +1,251 @@
+"""
+Microbenchmarks dos caminhos quentes da API, sem servidor nem rede
+Validação dos schemas (ProdutoBase, CarrinhoConfirmar), conversão orm_mode de
+ProdutoResponse, JWT (create/decode_access_token), montagem e execução da
+consulta de GET /produtos e os preços do checkout (precos.precificar, com
+CUPONS_EXTRAS regras de cupom compiladas além das do banco).
+Os dados vêm de um SQLite em memória gerado com semente fixa (dados_sinteticos.py)
+
+Para cada caso: operações por segundo (melhor de N rodadas com laço calibrado,
+GC desligado na medição) e alocações por operação via tracemalloc (pico e
+bytes que continuam alocados depois da operação)
+
+Execute a partir da pasta backend:
+    python benchmarks/micro.py                                  # grava benchmarks/baselines/micro-<commit>.json
+    python benchmarks/micro.py --filtro jwt --filtro consulta   # só os casos com esses trechos no nome
+    python benchmarks/micro.py --comparar benchmarks/baselines/micro-<outro>.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from decimal import Decimal
+from typing import Callable, Dict
+
+from carga_api import PASTA_BASELINES, commit_atual
+from concorrencia import BACKEND_ATUAL
+
+VERSAO_BASELINE = 1
+
+# Cupons a mais na busca compilada: o custo de precificar não deve depender deles
+CUPONS_EXTRAS = 1000
+
+# ========== MEDIÇÃO ==========
+
+def calibrar(funcao: Callable[[], object], tempo_alvo: float) -> int:
+    """Repetições para uma rodada durar ao menos tempo_alvo segundos"""
+    repeticoes = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        if time.perf_counter() - inicio >= tempo_alvo / 5:
+            duracao = time.perf_counter() - inicio
+            return max(1, int(repeticoes * tempo_alvo / duracao))
+        repeticoes *= 2
+
+def medir_tempo(funcao: Callable[[], object], rodadas: int, tempo_alvo: float) -> Dict[str, float]:
+    """Melhor rodada (menos ruído do sistema) e mediana das rodadas, em operações por segundo"""
+    repeticoes = calibrar(funcao, tempo_alvo)
+    taxas = []
+    gc_ativo = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rodadas):
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                funcao()
+            taxas.append(repeticoes / (time.perf_counter() - inicio))
+    finally:
+        if gc_ativo:
+            gc.enable()
+    taxas.sort()
+    return {"ops_s": taxas[-1], "ops_s_mediana": taxas[len(taxas) // 2], "repeticoes": repeticoes}
+
+def medir_alocacoes(funcao: Callable[[], object], repeticoes: int = 200) -> Dict[str, float]:
+    """
+    Bytes alocados por operação: pico durante uma chamada (média das repetições)
+    e bytes retidos depois das chamadas (crescimento, ex.: caches)
+    """
+    funcao()  # aquece caches de compilação antes de medir
+    gc.collect()
+    tracemalloc.start()
+    try:
+        picos = 0
+        antes, _ = tracemalloc.get_traced_memory()
+        for _ in range(repeticoes):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            funcao()
+            _, pico = tracemalloc.get_traced_memory()
+            picos += pico - base
+        gc.collect()
+        depois, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"pico_bytes_op": picos / repeticoes, "retido_bytes_op": max(0, depois - antes) / repeticoes}
+
+# ========== CASOS ==========
+
+def montar_casos(produtos: int, semente: int) -> Dict[str, Callable[[], object]]:
+    """Casos nomeados; a preparação (banco em memória, objetos de entrada) fica fora da medição"""
+    sys.path.insert(0, BACKEND_ATUAL)
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+
+    import busca
+    import precos
+    from auth import create_access_token, decode_access_token
+    from cupons import carregar_cupons
+    from dados_sinteticos import gerar_dados
+    from migracoes import aplicar_migracoes
+    from models import CarrinhoConfirmar, Produto, ProdutoCreate, ProdutoResponse
+    from paginacao import codificar_cursor, consulta_catalogo, consulta_pagina
+    from precos import precificar
+    from serializacao import COLUNAS_CATALOGO, produto_dict, serializar
+
+    engine = create_engine("sqlite://")  # em memória, uma conexão por thread
+    aplicar_migracoes(engine)
+    gerar_dados(engine, produtos=produtos, usuarios=1, pedidos=0, semente=semente)
+    busca.detectar_indice_busca(engine)
+    carregar_cupons(engine)
+    precos.instalar_regras({**precos._regras, **precos.compilar_regras(
+        SimpleNamespace(
+            codigo=f"PROMO{numero:04d}", tipo="fixo" if numero % 2 else "percentual", valor=Decimal(numero % 50 + 1),
+            categoria="Livros" if numero % 3 else None, minimo=Decimal("50.00"), valido_de=None, valido_ate=None,
+            limite_usos=None, usos=0, ativo=True,
+        )
+        for numero in range(CUPONS_EXTRAS)
+    )})
+    sessao = Session(engine)
+    conexao = engine.connect()
+
+    produto_orm = sessao.execute(
+        select(Produto).where(Produto.imagem_filename.isnot(None)).limit(1)
+    ).scalar_one()
+    linha_catalogo = conexao.execute(select(*COLUNAS_CATALOGO).where(Produto.id == produto_orm.id)).one()
+    pagina = conexao.execute(select(*COLUNAS_CATALOGO).order_by(Produto.nome).limit(100)).all()
+    cursor = codificar_cursor("nome", "asc", pagina[49].nome, pagina[49].id)
+
+    dados_produto = {
+        "nome": "  Caderno Universitário 200 folhas  ", "descricao": "Capa dura, 10 matérias",
+        "preco": "24.9", "estoque": 150, "categoria": " Material Escolar ", "sku": "CAD200",
+    }
+    dados_carrinho = {
+        "itens": [{"produto_id": produto_id, "quantidade": produto_id % 3 + 1} for produto_id in range(1, 11)],
+        "cupom": "aluno10",
+    }
+    token = create_access_token({"sub": "42", "email": "aluno@exemplo.com", "is_admin": False})
+    itens_preco = [
+        (Decimal("24.90"), 2, "Material Escolar"), (Decimal("189.00"), 1, "Livros"), (Decimal("3.49"), 12, "Material Escolar"),
+        (Decimal("57.35"), 3, "Livros"), (Decimal("0.99"), 40, "Arte"),
+    ]
+
+    def consulta_simples():
+        stmt, sort, order = consulta_catalogo(None, None, None, None)
+        return consulta_pagina(stmt, sort, order, 100)
+
+    def consulta_busca():
+        stmt, sort, order = consulta_catalogo("caderno", "Material Escolar", "nome", None)
+        return consulta_pagina(stmt, sort, order, 50, cursor)
+
+    return {
+        "schema.produto_create": lambda: ProdutoCreate(**dados_produto),
+        "schema.carrinho_10_itens": lambda: CarrinhoConfirmar(**dados_carrinho),
+        "schema.produto_response_from_orm": lambda: ProdutoResponse.from_orm(produto_orm),
+        "serializacao.produto_dict": lambda: serializar(produto_dict(linha_catalogo)),
+        "jwt.create_access_token": lambda: create_access_token({"sub": "42", "email": "aluno@exemplo.com"}),
+        "jwt.decode_access_token": lambda: decode_access_token(token),
+        "consulta.montar_catalogo": consulta_simples,
+        "consulta.montar_busca_cursor": consulta_busca,
+        "consulta.executar_catalogo_100": lambda: conexao.execute(consulta_simples()).all(),
+        "consulta.executar_busca_cursor": lambda: conexao.execute(consulta_busca()).all(),
+        "precos.carrinho_5_itens": lambda: precificar(itens_preco, "ALUNO10"),
+        "precos.cupom_categoria_5_itens": lambda: precificar(itens_preco, "PROMO0004"),
+    }
+
+# ========== COMPARAÇÃO ==========
+
+def comparar(atual: dict, anterior: dict, tolerancia: float) -> int:
+    """Regressão: ops/s abaixo de (1 - tolerância) do baseline ou pico de alocação acima de (1 + tolerância)"""
+    if atual["parametros"] != anterior.get("parametros"):
+        print("⚠️  Parâmetros diferentes do baseline: a comparação pode não ser justa")
+    print(f"\nComparando com {anterior.get('commit', '?')} ({anterior.get('data', '?')})")
+    print(f"{'caso':<36}{'ops/s antes':>13}{'ops/s agora':>13}{'Δ':>8}{'KB antes':>10}{'KB agora':>10}")
+
+    regressoes = 0
+    for caso, medida in atual["casos"].items():
+        base = anterior.get("casos", {}).get(caso)
+        if not base:
+            print(f"{caso:<36}{'-':>13}{medida['ops_s']:>13,.0f}{'novo':>8}")
+            continue
+        variacao = medida["ops_s"] / base["ops_s"] - 1
+        piorou = (
+            medida["ops_s"] < base["ops_s"] * (1 - tolerancia)
+            or medida["pico_bytes_op"] > base["pico_bytes_op"] * (1 + tolerancia) + 256
+        )
+        regressoes += piorou
+        print(
+            f"{caso:<36}{base['ops_s']:>13,.0f}{medida['ops_s']:>13,.0f}{variacao * 100:>+7.0f}%"
+            f"{base['pico_bytes_op'] / 1024:>10.1f}{medida['pico_bytes_op'] / 1024:>10.1f}  {'❌' if piorou else '✅'}"
+        )
+    return regressoes
+
+# ========== EXECUÇÃO ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos caminhos quentes da API")
+    parser.add_argument("--produtos", type=int, default=5000, help="Produtos sintéticos no banco em memória")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--tempo", type=float, default=0.2, help="Duração alvo de cada rodada (s)")
+    parser.add_argument("--filtro", action="append", help="Só casos cujo nome contém o trecho (repetível)")
+    parser.add_argument("--saida", help="Arquivo JSON do resultado (padrão: benchmarks/baselines/micro-<commit>.json)")
+    parser.add_argument("--comparar", help="Baseline anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Piora relativa aceita (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    print("🔬 MICROBENCHMARKS")
+    print("=" * 50)
+
+    casos = montar_casos(args.produtos, args.semente)
+    if args.filtro:
+        casos = {nome: funcao for nome, funcao in casos.items() if any(trecho in nome for trecho in args.filtro)}
+
+    print(f"{'caso':<36}{'ops/s':>13}{'mediana':>13}{'µs/op':>9}{'pico KB':>9}{'retido B':>10}")
+    medidas: Dict[str, Dict[str, float]] = {}
+    for nome, funcao in casos.items():
+        medida = {**medir_tempo(funcao, args.rodadas, args.tempo), **medir_alocacoes(funcao)}
+        medidas[nome] = medida
+        print(
+            f"{nome:<36}{medida['ops_s']:>13,.0f}{medida['ops_s_mediana']:>13,.0f}{1e6 / medida['ops_s']:>9.1f}"
+            f"{medida['pico_bytes_op'] / 1024:>9.1f}{medida['retido_bytes_op']:>10.0f}"
+        )
+
+    resultado = {
+        "versao": VERSAO_BASELINE,
+        **commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "parametros": {"produtos": args.produtos, "semente": args.semente, "rodadas": args.rodadas, "tempo": args.tempo},
+        "casos": {nome: {chave: round(valor, 1) for chave, valor in medida.items()} for nome, medida in medidas.items()},
+    }
+
+    saida = args.saida or os.path.join(PASTA_BASELINES, f"micro-{resultado['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"\n💾 Baseline gravado em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        print(f"\n❌ {regressoes} caso(s) com regressão" if regressoes else "\n✅ Sem regressões")
+        sys.exit(1 if regressoes else 0)
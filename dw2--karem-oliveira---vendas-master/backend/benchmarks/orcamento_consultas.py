@@ -0,0 +1,138 @@
+"""
+Verificação do orçamento de consultas SQL por endpoint (@orcamento_consultas)
+Sobe a API num banco temporário com SQL_DIAGNOSTICO=1 e SQL_ORCAMENTO_ESTRITO=1,
+percorre os fluxos principais e falha se algum endpoint passar do orçamento
+ou repetir a mesma consulta (N+1)
+
+Execute a partir da pasta backend: python benchmarks/orcamento_consultas.py
+"""
+
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASTA = tempfile.mkdtemp(prefix="orcamento-")
+os.environ.update(
+    DATABASE_PATH=os.path.join(PASTA, "orcamento.db"),
+    VARIANTES_DIR=os.path.join(PASTA, "imagens"),
+    SQL_DIAGNOSTICO="1",
+    SQL_ORCAMENTO_ESTRITO="1",
+)
+
+from fastapi.testclient import TestClient
+
+import app as api
+import seed
+from diagnostico_sql import CABECALHO_CONSULTAS, OrcamentoConsultasExcedido
+
+class AvisosN1(logging.Handler):
+    """Guarda os avisos de N+1 do middleware"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.avisos = []
+
+    def emit(self, registro):
+        if "N+1" in registro.getMessage():
+            self.avisos.append(registro.getMessage())
+
+def fluxos(cliente: TestClient):
+    """(descrição, chamada) na ordem de uma visita: catálogo, cadastro, reservas, compra, histórico, carrinho salvo"""
+    email = f"orcamento-{uuid.uuid4().hex[:8]}@exemplo.com"
+    sessao = {}
+
+    def login():
+        resposta = cliente.post("/auth/login", json={"email": email, "senha": "senha123"})
+        sessao["Authorization"] = f"Bearer {resposta.json()['access_token']}"
+        return resposta
+
+    return [
+        ("GET /produtos (sem cache)", lambda: cliente.get("/produtos?limit=20")),
+        ("GET /produtos?search", lambda: cliente.get("/produtos?search=caderno")),
+        ("GET /produtos?categoria", lambda: cliente.get("/produtos?categoria=Livros&sort=preco")),
+        ("GET /produtos/{id}", lambda: cliente.get("/produtos/1")),
+        ("GET /categorias", lambda: cliente.get("/categorias")),
+        ("POST /auth/register", lambda: cliente.post(
+            "/auth/register", json={"nome": "Orçamento", "email": email, "senha": "senha123"}
+        )),
+        ("POST /auth/login", login),
+        ("GET /users/me", lambda: cliente.get("/users/me", headers=sessao)),
+        ("PUT /users/me", lambda: cliente.put("/users/me", json={"nome": "Outro Nome"}, headers=sessao)),
+        ("GET /produtos/disponibilidade", lambda: cliente.get("/produtos/disponibilidade?ids=1&ids=2&ids=3")),
+        ("PUT /carrinho/reservas/{id}", lambda: cliente.put("/carrinho/reservas/1", json={"quantidade": 2}, headers=sessao)),
+        ("PUT /carrinho/reservas/{id} (outro)", lambda: cliente.put("/carrinho/reservas/7", json={"quantidade": 1}, headers=sessao)),
+        ("GET /carrinho/reservas", lambda: cliente.get("/carrinho/reservas", headers=sessao)),
+        ("POST /carrinho/confirmar (5 itens)", lambda: cliente.post("/carrinho/confirmar", json={
+            "itens": [{"produto_id": produto_id, "quantidade": 1} for produto_id in range(1, 6)],
+            "cupom": "ALUNO10",
+        }, headers=sessao)),
+        ("POST /carrinho/confirmar (Idempotency-Key)", lambda: cliente.post(
+            "/carrinho/confirmar", json={"itens": [{"produto_id": 6, "quantidade": 1}]},
+            headers={**sessao, "Idempotency-Key": str(uuid.uuid4())}
+        )),
+        ("GET /users/me/pedidos", lambda: cliente.get("/users/me/pedidos", headers=sessao)),
+        ("DELETE /carrinho/reservas", lambda: cliente.delete("/carrinho/reservas", headers=sessao)),
+        ("PATCH /carrinho (4 produtos)", lambda: cliente.patch("/carrinho", json={"operacoes": [
+            {"op": "adicionar", "produto_id": produto_id, "quantidade": 2} for produto_id in range(1, 5)
+        ]}, headers=sessao)),
+        ("PATCH /carrinho (remover, definir)", lambda: cliente.patch("/carrinho", json={"operacoes": [
+            {"op": "remover", "produto_id": 1, "quantidade": 1},
+            {"op": "definir", "produto_id": 2, "quantidade": 0},
+            {"op": "definir", "produto_id": 8, "quantidade": 3},
+        ]}, headers=sessao)),
+        ("PUT /carrinho/cupom", lambda: cliente.put("/carrinho/cupom", json={"cupom": "aluno10"}, headers=sessao)),
+        ("GET /carrinho", lambda: cliente.get("/carrinho", headers=sessao)),
+        ("POST /carrinho/checkout (Idempotency-Key)", lambda: cliente.post(
+            "/carrinho/checkout", headers={**sessao, "Idempotency-Key": str(uuid.uuid4())}
+        )),
+        ("PATCH /carrinho (novo carrinho)", lambda: cliente.patch("/carrinho", json={"operacoes": [
+            {"op": "adicionar", "produto_id": 9, "quantidade": 1},
+        ]}, headers=sessao)),
+        ("DELETE /carrinho", lambda: cliente.delete("/carrinho", headers=sessao)),
+    ]
+
+if __name__ == "__main__":
+    print("🧮 ORÇAMENTO DE CONSULTAS SQL POR ENDPOINT")
+    print("=" * 50)
+
+    avisos = AvisosN1()
+    logging.getLogger("diagnostico_sql").addHandler(avisos)
+
+    cliente = TestClient(api.app)
+    cliente.__enter__()
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed.criar_produtos()
+
+    falhas = 0
+    for descricao, chamada in fluxos(cliente):
+        quantidade_avisos = len(avisos.avisos)
+        try:
+            resposta = chamada()
+        except OrcamentoConsultasExcedido as e:
+            falhas += 1
+            print(f"❌ {descricao}: {e}")
+            continue
+        consultas = resposta.headers.get(CABECALHO_CONSULTAS, "?")
+        if len(avisos.avisos) > quantidade_avisos:
+            falhas += 1
+            print(f"❌ {descricao}: {consultas} consultas, N+1")
+            for aviso in avisos.avisos[quantidade_avisos:]:
+                print(f"      {aviso}")
+        elif resposta.status_code >= 400:
+            falhas += 1
+            print(f"❌ {descricao}: HTTP {resposta.status_code}")
+        else:
+            print(f"✅ {descricao}: {consultas} consultas")
+
+    cliente.__exit__(None, None, None)
+    print()
+    print(f"❌ {falhas} endpoint(s) acima do orçamento ou com N+1" if falhas
+          else "✅ Todos os endpoints dentro do orçamento de consultas")
+    sys.stdout.flush()
+    os._exit(1 if falhas else 0)  # não espera as threads do aiosqlite
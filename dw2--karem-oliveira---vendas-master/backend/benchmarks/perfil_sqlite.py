@@ -0,0 +1,103 @@
+"""
+Benchmark de leitura/escrita mista com e sem o perfil de produção do SQLite
+(WAL, synchronous=NORMAL, busy_timeout, cache_size, mmap_size, temp_store e pool)
+
+Execute a partir da pasta backend: python benchmarks/perfil_sqlite.py [--segundos 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, update, insert
+from database import criar_engine_async
+from models import Base, Produto, Pedido
+
+PRODUTOS = 20_000
+
+def criar_banco(caminho: str):
+    engine = create_engine(f"sqlite:///{caminho}")
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(3)
+    with engine.begin() as conn:
+        conn.execute(Produto.__table__.insert(), [
+            {
+                "nome": f"Produto {i:05d}",
+                "preco": round(rng.uniform(1, 300), 2),
+                "estoque": 1_000_000,
+                "categoria": rng.choice(["Livros", "Arte", "Esportes"]),
+            }
+            for i in range(PRODUTOS)
+        ])
+    engine.dispose()
+
+async def leitor(engine, fim: float, contagem: dict):
+    rng = random.Random()
+    while time.perf_counter() < fim:
+        try:
+            async with engine.connect() as conn:
+                if rng.random() < 0.5:
+                    await conn.execute(select(Produto).where(Produto.id == rng.randint(1, PRODUTOS)))
+                else:
+                    await conn.execute(select(Produto).order_by(Produto.nome).limit(50))
+            contagem["leituras"] += 1
+        except Exception:
+            contagem["erros"] += 1
+
+async def escritor(engine, fim: float, contagem: dict):
+    rng = random.Random()
+    while time.perf_counter() < fim:
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    update(Produto)
+                    .where(Produto.id == rng.randint(1, PRODUTOS), Produto.estoque >= 1)
+                    .values(estoque=Produto.estoque - 1)
+                )
+                await conn.execute(insert(Pedido).values(total_bruto=10, desconto=0, total_final=10))
+            contagem["escritas"] += 1
+        except Exception:
+            contagem["erros"] += 1
+
+async def executar(perfil: str, leitores: int, escritores: int, segundos: float):
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "bench.db")
+        criar_banco(caminho)
+        url = f"sqlite+aiosqlite:///{caminho}"
+        engine_escrita = criar_engine_async(url, perfil)
+        engine_leitura = criar_engine_async(url, perfil, somente_leitura=True)
+
+        contagem = {"leituras": 0, "escritas": 0, "erros": 0}
+        fim = time.perf_counter() + segundos
+        await asyncio.gather(
+            *[leitor(engine_leitura, fim, contagem) for _ in range(leitores)],
+            *[escritor(engine_escrita, fim, contagem) for _ in range(escritores)],
+        )
+        await engine_escrita.dispose()
+        await engine_leitura.dispose()
+
+    print(
+        f"{perfil:<10}{contagem['leituras'] / segundos:>12.0f}"
+        f"{contagem['escritas'] / segundos:>12.0f}{contagem['erros']:>8}"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do perfil de produção do SQLite")
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--leitores", type=int, default=16)
+    parser.add_argument("--escritores", type=int, default=4)
+    args = parser.parse_args()
+
+    print("🗄️  BENCHMARK PERFIL SQLITE (leitura/escrita mista)")
+    print("=" * 50)
+    print(f"{args.leitores} leitores, {args.escritores} escritores, {args.segundos:.0f}s por perfil\n")
+    print(f"{'perfil':<10}{'leituras/s':>12}{'escritas/s':>12}{'erros':>8}")
+
+    for perfil in ("padrao", "producao"):
+        asyncio.run(executar(perfil, args.leitores, args.escritores, args.segundos))
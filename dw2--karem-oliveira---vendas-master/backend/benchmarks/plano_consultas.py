@@ -0,0 +1,146 @@
+"""
+Verificação de regressão dos planos de consulta (EXPLAIN QUERY PLAN)
+Monta as consultas dos endpoints como a API faz e falha se algum plano
+tiver varredura completa de tabela ou ordenação em B-tree temporária
+
+Execute a partir da pasta backend: python benchmarks/plano_consultas.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, func
+from models import Produto, Pedido, ItemPedido, User
+from migracoes import aplicar_migracoes
+from busca import detectar_indice_busca, montar_expressao_busca, filtrar_busca
+from paginacao import aplicar_ordenacao, aplicar_cursor, consulta_pedidos
+from serializacao import COLUNAS_CATALOGO
+from reservas import consulta_reservaveis, baixa_estoque
+from carrinhos import consulta_checkout
+
+LIMITE = 101  # limit + 1, como em buscar_pagina
+
+def listagem(categoria=None, sort="nome", order="asc", cursor=None, search=None):
+    """Consulta de GET /produtos (mesmos passos de listar_produtos/buscar_pagina)"""
+    stmt = select(*COLUNAS_CATALOGO)
+    if search:
+        stmt = filtrar_busca(stmt, montar_expressao_busca(search))
+    if categoria:
+        stmt = stmt.filter(Produto.categoria == categoria)
+    if cursor is not None:
+        stmt = aplicar_cursor(stmt, sort, order, cursor, 50)
+    return aplicar_ordenacao(stmt, sort, order).limit(LIMITE)
+
+# (descrição, consulta, motivo quando a ordenação temporária é esperada)
+CONSULTAS = [
+    ("listagem nome asc", listagem(), None),
+    ("listagem nome desc", listagem(order="desc"), None),
+    ("listagem preco asc", listagem(sort="preco"), None),
+    ("listagem preco desc", listagem(sort="preco", order="desc"), None),
+    ("listagem nome + cursor", listagem(cursor="Produto 00050"), None),
+    ("listagem preco + cursor", listagem(sort="preco", cursor=Decimal("10.00")), None),
+    ("categoria + nome", listagem(categoria="Livros"), None),
+    ("categoria + nome desc", listagem(categoria="Livros", order="desc"), None),
+    ("categoria + preco asc", listagem(categoria="Livros", sort="preco"), None),
+    ("categoria + preco desc", listagem(categoria="Livros", sort="preco", order="desc"), None),
+    ("categoria + preco + cursor", listagem(categoria="Livros", sort="preco", cursor=Decimal("10.00")), None),
+    ("busca fts + relevancia", listagem(search="produto", sort="relevancia"),
+     "bm25 só existe para as linhas que casam com a busca"),
+    ("produto por id", select(Produto).where(Produto.id == 1), None),
+    ("produto por sku", select(Produto).where(Produto.sku == "SKU00001"), None),
+    ("categorias", select(Produto.categoria).distinct(), None),
+    # Checkout: os mesmos construtores que a API executa
+    ("checkout: produtos do carrinho", consulta_reservaveis("sessao-plano", [1, 2, 3]), None),
+    ("checkout: baixa de estoque", baixa_estoque({1: 1, 2: 2}, {1: 1}), None),
+    ("checkout: baixa sem reservas", baixa_estoque({1: 1, 2: 2}, {}), None),
+    ("checkout do carrinho salvo: carrinho e reservas", consulta_checkout("sessao-plano"), None),
+    ("checkout do carrinho salvo: baixa com preços",
+     baixa_estoque({1: 1, 2: 2}, {1: 1, 2: 2}, {1: Decimal("10.00"), 2: Decimal("20.00")}), None),
+    ("itens de um pedido", select(ItemPedido).where(ItemPedido.pedido_id == 1), None),
+    ("itens de vários pedidos (selectinload)",
+     select(ItemPedido).where(ItemPedido.pedido_id.in_([1, 2, 3])), None),
+    ("unidades vendidas por produto",
+     select(func.coalesce(func.sum(ItemPedido.quantidade), 0)).where(ItemPedido.produto_id == 1), None),
+    ("historico de pedidos do usuario", consulta_pedidos(1, 21), None),
+    ("historico de pedidos + cursor", consulta_pedidos(1, 21, "2026-01-01 12:00:00", 50), None),
+    ("usuario por email", select(User).where(User.email == "admin@loja.com"), None),
+]
+
+def criar_banco(caminho: str):
+    engine = create_engine(f"sqlite:///{caminho}")
+    aplicar_migracoes(engine)
+    if not detectar_indice_busca(engine):
+        print("⚠️  SQLite sem FTS5: consulta de busca ignorada")
+    rng = random.Random(11)
+    with engine.begin() as conn:
+        conn.execute(Produto.__table__.insert(), [
+            {
+                "nome": f"Produto {i:05d}",
+                "preco": round(rng.uniform(1, 300), 2),
+                "estoque": 100,
+                "categoria": rng.choice(["Livros", "Arte", "Esportes", "Tecnologia"]),
+                "sku": f"SKU{i:05d}",
+            }
+            for i in range(2000)
+        ])
+        conn.execute(Pedido.__table__.insert(), [
+            {"total_bruto": 10, "desconto": 0, "total_final": 10} for _ in range(200)
+        ])
+        conn.execute(ItemPedido.__table__.insert(), [
+            {
+                "pedido_id": p, "produto_id": rng.randint(1, 2000), "nome_produto": "x",
+                "preco_unitario": 5, "quantidade": 2, "subtotal": 10,
+            }
+            for p in range(1, 201) for _ in range(3)
+        ])
+    return engine
+
+def problemas_do_plano(linhas) -> list:
+    """Varredura completa (SCAN sem índice) e ordenação temporária"""
+    problemas = []
+    for detalhe in linhas:
+        if detalhe.startswith("SCAN ") and " USING " not in detalhe and "VIRTUAL TABLE" not in detalhe:
+            problemas.append(detalhe)
+        elif "USE TEMP B-TREE" in detalhe:
+            problemas.append(detalhe)
+    return problemas
+
+def explicar(conn, stmt) -> list:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    return [linha[-1] for linha in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+if __name__ == "__main__":
+    print("🔎 REGRESSÃO DOS PLANOS DE CONSULTA")
+    print("=" * 50)
+
+    falhas = 0
+    with tempfile.TemporaryDirectory() as pasta:
+        engine = criar_banco(os.path.join(pasta, "plano.db"))
+        with engine.connect() as conn:
+            for descricao, stmt, excecao in CONSULTAS:
+                try:
+                    plano = explicar(conn, stmt)
+                except Exception as e:
+                    print(f"⏭️  {descricao}: {e.__class__.__name__}")
+                    continue
+                problemas = problemas_do_plano(plano)
+                if problemas and excecao:
+                    print(f"➖ {descricao} (permitido: {excecao})")
+                elif problemas:
+                    falhas += 1
+                    print(f"❌ {descricao}")
+                else:
+                    print(f"✅ {descricao}")
+                for detalhe in plano:
+                    print(f"      {detalhe}")
+        engine.dispose()
+
+    print()
+    print(f"❌ {falhas} consulta(s) com varredura completa ou ordenação temporária" if falhas
+          else "✅ Nenhuma varredura completa ou ordenação temporária")
+    sys.exit(1 if falhas else 0)
@@ -0,0 +1,98 @@
+"""
+Microbenchmark da serialização do catálogo: caminho antigo x caminho rápido
+Antigo: ProdutoResponse.from_orm + jsonable_encoder + revalidação do
+response_model (serialize_response do FastAPI) + json.dumps do JSONResponse
+Rápido: linhas de COLUNAS_CATALOGO + produto_dict + orjson
+Também mede os bytes na rede sem compressão, com gzip e com brotli (se instalado)
+
+Execute a partir da pasta backend: python benchmarks/serializacao_catalogo.py [--tamanhos 1000 10000 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from decimal import Decimal
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import Produto, ProdutoResponse
+from serializacao import (
+    COLUNAS_CATALOGO, ORJSON_DISPONIVEL, produto_dict, serializar, comprimir, brotli
+)
+
+CATEGORIAS = ["Livros", "Material Escolar", "Uniformes", "Eletrônicos", "Esportes", "Arte"]
+CAMPO_RESPOSTA = create_response_field(name="Response_listar_produtos", type_=List[ProdutoResponse])
+
+def criar_catalogo(engine, quantidade: int):
+    Base.metadata.create_all(engine, tables=[Produto.__table__])
+    with Session(engine) as sessao:
+        sessao.bulk_insert_mappings(Produto, [
+            {
+                "nome": f"Produto {i:06d}",
+                "descricao": "Item do catálogo escolar usado no benchmark de serialização",
+                "preco": Decimal(f"{(i % 300) + 0.99:.2f}"),
+                "estoque": i % 100,
+                "categoria": CATEGORIAS[i % len(CATEGORIAS)],
+                "sku": f"SKU{i:06d}",
+                "imagem_filename": "mochila-escolar-grande.png" if i % 2 else None,
+            }
+            for i in range(quantidade)
+        ])
+        sessao.commit()
+
+def caminho_antigo(produtos) -> bytes:
+    itens = [jsonable_encoder(ProdutoResponse.from_orm(p)) for p in produtos]
+    conteudo = asyncio.run(serialize_response(field=CAMPO_RESPOSTA, response_content=itens))
+    return JSONResponse(conteudo).body
+
+def caminho_rapido(linhas) -> bytes:
+    return serializar([produto_dict(linha) for linha in linhas])
+
+def medir(funcao, *args, repeticoes: int):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da serialização do catálogo")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print("⚡ BENCHMARK SERIALIZAÇÃO DO CATÁLOGO")
+    print("=" * 50)
+    print(f"orjson: {'sim' if ORJSON_DISPONIVEL else 'não (json)'}   brotli: {'sim' if brotli else 'não instalado'}\n")
+    print(f"{'produtos':>9} {'antigo':>10} {'rápido':>10} {'ganho':>7} {'json':>12} {'gzip':>11} {'brotli':>11}")
+
+    for quantidade in args.tamanhos:
+        engine = create_engine("sqlite://")
+        criar_catalogo(engine, quantidade)
+        repeticoes = 3 if quantidade <= 10000 else 1
+
+        with Session(engine) as sessao:
+            produtos = sessao.execute(select(Produto).order_by(Produto.nome)).scalars().all()
+            linhas = sessao.execute(select(*COLUNAS_CATALOGO).order_by(Produto.nome)).all()
+
+        tempo_antigo, corpo_antigo = medir(caminho_antigo, produtos, repeticoes=repeticoes)
+        tempo_rapido, corpo_rapido = medir(caminho_rapido, linhas, repeticoes=repeticoes)
+
+        gzip_bytes = len(comprimir(corpo_rapido, "gzip"))
+        brotli_bytes = f"{len(comprimir(corpo_rapido, 'br')):,}" if brotli else "-"
+        print(
+            f"{quantidade:>9,} {tempo_antigo * 1000:>8.0f}ms {tempo_rapido * 1000:>8.0f}ms "
+            f"{tempo_antigo / tempo_rapido:>6.1f}x {len(corpo_rapido):>12,} {gzip_bytes:>11,} {brotli_bytes:>11}"
+        )
+        engine.dispose()
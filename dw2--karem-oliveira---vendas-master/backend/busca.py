@@ -0,0 +1,123 @@
+"""
+Índice de busca textual de produtos (SQLite FTS5)
+Tabela virtual produtos_fts espelhando nome/descricao/categoria, mantida por triggers
+"""
+
+import logging
+import re
+from typing import Optional
+from sqlalchemy import text, literal_column
+from sqlalchemy.sql import table, column
+from models import Produto
+
+logger = logging.getLogger(__name__)
+
+# Indica se o banco tem o índice FTS5 (definido em detectar_indice_busca)
+FTS_DISPONIVEL = False
+
+# remove_diacritics 2: "matematica" encontra "Matemática"
+DDL_TABELA = """
+CREATE VIRTUAL TABLE produtos_fts USING fts5(
+    nome, descricao, categoria,
+    content='produtos', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+# Triggers no formato recomendado para tabelas FTS5 com external content
+DDL_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN
+        INSERT INTO produtos_fts(rowid, nome, descricao, categoria)
+        VALUES (new.id, new.nome, new.descricao, new.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN
+        INSERT INTO produtos_fts(produtos_fts, rowid, nome, descricao, categoria)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_au AFTER UPDATE OF nome, descricao, categoria ON produtos BEGIN
+        INSERT INTO produtos_fts(produtos_fts, rowid, nome, descricao, categoria)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+        INSERT INTO produtos_fts(rowid, nome, descricao, categoria)
+        VALUES (new.id, new.nome, new.descricao, new.categoria);
+    END
+    """,
+]
+
+# Referências à tabela virtual para uso nas consultas do ORM
+produtos_fts = table("produtos_fts", column("rowid"))
+
+# Expressão de ranking (bm25: quanto menor, mais relevante)
+RANK = literal_column("bm25(produtos_fts)")
+
+# Triggers suspensos durante cargas grandes (reindexação única no final)
+TRIGGERS_CARGA = ("produtos_fts_ai", "produtos_fts_au")
+
+def suspender_indice_busca(engine) -> bool:
+    """
+    Remove os triggers de inserção/atualização do índice FTS
+    Indexar linha a linha domina o custo de cargas grandes; o 'rebuild'
+    em reconstruir_indice_busca refaz o índice de uma vez.
+    Retorna False se o banco não tem índice de busca.
+    """
+    with engine.begin() as conn:
+        existe = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+        )).first()
+        if not existe:
+            return False
+        for nome in TRIGGERS_CARGA:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {nome}"))
+    return True
+
+def reconstruir_indice_busca(engine):
+    """Reindexa todos os produtos e recria os triggers de sincronização"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO produtos_fts(produtos_fts) VALUES ('rebuild')"))
+        for ddl in DDL_TRIGGERS:
+            conn.execute(text(ddl))
+    logger.info("Índice de busca produtos_fts reconstruído")
+
+def detectar_indice_busca(engine) -> bool:
+    """
+    Verifica se a migração criou produtos_fts (sem FTS5 ela é pulada)
+    Chamada na inicialização da API, depois de verificar_schema
+    """
+    global FTS_DISPONIVEL
+
+    with engine.connect() as conn:
+        FTS_DISPONIVEL = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+        )).first() is not None
+
+    if not FTS_DISPONIVEL:
+        logger.warning("Índice produtos_fts ausente, busca usará ILIKE")
+    return FTS_DISPONIVEL
+
+def indice_disponivel() -> bool:
+    """Indica se as buscas devem usar o índice FTS5"""
+    return FTS_DISPONIVEL
+
+# ========== CONSULTAS ==========
+
+def montar_expressao_busca(termo: str) -> Optional[str]:
+    """
+    Converte o texto digitado em expressão MATCH segura
+    Cada palavra vira um prefixo entre aspas ("mat"* "6"*), combinadas com AND
+    """
+    palavras = re.findall(r"\w+", termo or "")
+    if not palavras:
+        return None
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+def filtrar_busca(stmt, expressao: str):
+    """Restringe a consulta de produtos aos que casam com a expressão no índice FTS"""
+    return stmt.join(
+        produtos_fts, produtos_fts.c.rowid == Produto.id
+    ).where(
+        literal_column("produtos_fts").match(expressao)
+    )
@@ -0,0 +1,222 @@
+"""
+Cache em memória do catálogo (read-through com TTL e LRU)
+Invalidação por chave e por tag, stale-while-revalidate e uma única carga por chave
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configurações do cache do catálogo
+CACHE_TTL = float(os.getenv("CATALOGO_CACHE_TTL", "30"))
+CACHE_STALE = float(os.getenv("CATALOGO_CACHE_STALE", "60"))
+CACHE_MAX_ITENS = int(os.getenv("CATALOGO_CACHE_MAX_ITENS", "2000"))
+
+# Cache HTTP (navegador e proxy reverso) das respostas do catálogo
+CATALOGO_MAX_AGE = int(os.getenv("CATALOGO_MAX_AGE", "10"))
+CACHE_CONTROL_CATALOGO = f"public, max-age={CATALOGO_MAX_AGE}, must-revalidate"
+
+# Função de carga: retorna (valor, tags) ao consultar o banco
+Carregador = Callable[[], Awaitable[Tuple[Any, Iterable[str]]]]
+
+class _Entrada:
+    """Valor armazenado com instantes de expiração e tags"""
+    __slots__ = ("valor", "fresco_ate", "valido_ate", "tags")
+
+    def __init__(self, valor: Any, ttl: float, stale: float, tags: Set[str]):
+        agora = time.monotonic()
+        self.valor = valor
+        self.fresco_ate = agora + ttl
+        self.valido_ate = agora + ttl + stale
+        self.tags = tags
+
+class CacheTTL:
+    """
+    Cache LRU com TTL
+    - fresco: devolve direto
+    - vencido, mas dentro da janela stale: devolve o antigo e recarrega em segundo plano
+    - ausente: uma única carga por chave, as demais requisições aguardam o mesmo resultado
+    """
+
+    def __init__(self, nome: str, ttl: float = CACHE_TTL, stale: float = CACHE_STALE, max_itens: int = CACHE_MAX_ITENS):
+        self.nome = nome
+        self.ttl = ttl
+        self.stale = stale
+        self.max_itens = max_itens
+        self._dados: "OrderedDict[Any, _Entrada]" = OrderedDict()
+        self._por_tag: Dict[str, Set[Any]] = {}
+        self._cargas: Dict[Any, asyncio.Future] = {}
+        # Incrementada a cada invalidação: cargas iniciadas antes não são gravadas
+        self._geracao = 0
+        self.metricas = {"hits": 0, "misses": 0, "stale_hits": 0, "evictions": 0, "invalidacoes": 0}
+
+    # ========== LEITURA ==========
+
+    async def obter(self, chave: Any, carregar: Carregador) -> Any:
+        """Busca no cache ou carrega (read-through)"""
+        entrada = self._dados.get(chave)
+        agora = time.monotonic()
+
+        if entrada is not None and agora < entrada.valido_ate:
+            self._dados.move_to_end(chave)
+            if agora < entrada.fresco_ate:
+                self.metricas["hits"] += 1
+            else:
+                self.metricas["stale_hits"] += 1
+                if chave not in self._cargas:
+                    asyncio.ensure_future(self._recarregar(chave, carregar))
+            return entrada.valor
+
+        self.metricas["misses"] += 1
+        carga = self._cargas.get(chave)
+        if carga is not None:
+            return await asyncio.shield(carga)
+        return await self._carregar(chave, carregar)
+
+    async def _carregar(self, chave: Any, carregar: Carregador) -> Any:
+        """Executa a carga uma única vez e compartilha o resultado"""
+        futuro = asyncio.get_running_loop().create_future()
+        self._cargas[chave] = futuro
+        geracao = self._geracao
+        try:
+            valor, tags = await carregar()
+            if geracao == self._geracao:
+                self._gravar(chave, valor, set(tags))
+            futuro.set_result(valor)
+            return valor
+        except Exception as e:
+            futuro.set_exception(e)
+            # Evita aviso de exceção não lida quando ninguém aguardava
+            futuro.exception()
+            if chave in self._dados:
+                logger.warning(f"Falha ao recarregar cache {self.nome}[{chave}]: {e}")
+            raise
+        finally:
+            self._cargas.pop(chave, None)
+
+    async def _recarregar(self, chave: Any, carregar: Carregador):
+        """Recarga em segundo plano (stale-while-revalidate); falhas só vão para o log"""
+        try:
+            await self._carregar(chave, carregar)
+        except Exception:
+            pass
+
+    def _gravar(self, chave: Any, valor: Any, tags: Set[str]):
+        self._remover(chave)
+        self._dados[chave] = _Entrada(valor, self.ttl, self.stale, tags)
+        for tag in tags:
+            self._por_tag.setdefault(tag, set()).add(chave)
+
+        while len(self._dados) > self.max_itens:
+            chave_antiga = next(iter(self._dados))
+            self._remover(chave_antiga)
+            self.metricas["evictions"] += 1
+
+    def _remover(self, chave: Any):
+        entrada = self._dados.pop(chave, None)
+        if entrada is None:
+            return
+        for tag in entrada.tags:
+            chaves = self._por_tag.get(tag)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._por_tag[tag]
+
+    # ========== INVALIDAÇÃO ==========
+
+    def invalidar(self, *chaves: Any):
+        """Remove chaves específicas"""
+        self._geracao += 1
+        for chave in chaves:
+            self._remover(chave)
+        self.metricas["invalidacoes"] += 1
+
+    def invalidar_tags(self, *tags: str):
+        """Remove todas as entradas marcadas com alguma das tags"""
+        self._geracao += 1
+        for tag in tags:
+            for chave in list(self._por_tag.get(tag, ())):
+                self._remover(chave)
+        self.metricas["invalidacoes"] += 1
+
+    def limpar(self):
+        """Remove todas as entradas"""
+        self._geracao += 1
+        self._dados.clear()
+        self._por_tag.clear()
+        self.metricas["invalidacoes"] += 1
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {**self.metricas, "itens": len(self._dados)}
+
+# ========== CACHES DO CATÁLOGO ==========
+
+cache_produtos = CacheTTL("produtos")      # chave: produto_id
+cache_listagens = CacheTTL("listagens")    # chave: parâmetros da listagem; tags: "produto:<id>"
+cache_categorias = CacheTTL("categorias")  # chave única
+
+def tag_produto(produto_id: int) -> str:
+    return f"produto:{produto_id}"
+
+def invalidar_produtos(produto_ids: Iterable[int], mudou_catalogo: bool = False):
+    """
+    Invalida o cache após escrita em produtos
+    Mudança só de estoque afeta apenas as listagens que contêm o produto.
+    Criação, exclusão ou mudança de nome/preço/categoria pode mover o produto
+    para outras listagens, então todas são descartadas.
+    """
+    produto_ids = list(produto_ids)
+    cache_produtos.invalidar(*produto_ids)
+    if mudou_catalogo:
+        cache_listagens.limpar()
+        cache_categorias.limpar()
+    else:
+        cache_listagens.invalidar_tags(*[tag_produto(pid) for pid in produto_ids])
+
+def invalidar_catalogo():
+    """Descarta todo o cache do catálogo (cargas em lote, sem lista de ids)"""
+    cache_produtos.limpar()
+    cache_listagens.limpar()
+    cache_categorias.limpar()
+
+def estatisticas_cache() -> Dict[str, Any]:
+    return {
+        "produtos": cache_produtos.estatisticas(),
+        "listagens": cache_listagens.estatisticas(),
+        "categorias": cache_categorias.estatisticas(),
+    }
+
+# ========== ETAG ==========
+
+def calcular_etag(valor: Any) -> str:
+    """ETag forte a partir do conteúdo serializado (calculada uma vez, na carga)"""
+    if isinstance(valor, bytes):
+        conteudo = valor
+    else:
+        conteudo = json.dumps(valor, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return '"' + hashlib.sha1(conteudo).hexdigest()[:24] + '"'
+
+def _etag_opaca(etag: str) -> str:
+    """ETag sem o prefixo W/ de validador fraco"""
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Verifica se o If-None-Match do cliente contém a ETag atual
+    Comparação fraca (RFC 7232 §2.3.2): W/"x" confere com "x" (proxies que recomprimem enfraquecem a ETag)
+    """
+    if not if_none_match:
+        return False
+    candidatos = [item.strip() for item in if_none_match.split(",")]
+    if "*" in candidatos:
+        return True
+    atual = _etag_opaca(etag)
+    return any(_etag_opaca(candidato) == atual for candidato in candidatos)
@@ -0,0 +1,261 @@
+"""
+Importação e exportação do catálogo em lote (CSV ou JSONL)
+Linhas validadas com as regras de ProdutoCreate, upsert por sku em transações
+por lote e erros reportados por linha. Leitura e escrita em streaming.
+
+Uso pela linha de comando (pasta backend):
+    python carga_produtos.py importar fornecedor.csv [--lote 5000]
+    python carga_produtos.py exportar catalogo.jsonl
+"""
+
+import argparse
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Produto, ProdutoCreate
+from busca import suspender_indice_busca, reconstruir_indice_busca
+
+logger = logging.getLogger(__name__)
+
+# Configurações da carga
+LOTE_IMPORTACAO = int(os.getenv("IMPORTACAO_LOTE", "5000"))
+LOTE_EXPORTACAO = int(os.getenv("EXPORTACAO_LOTE", "5000"))
+# Acima disso a busca FTS é reindexada uma vez no final, não linha a linha
+REINDEXAR_APOS = int(os.getenv("IMPORTACAO_REINDEXAR_APOS", "50000"))
+# Os demais erros só entram na contagem (memória limitada em arquivos grandes)
+MAX_ERROS_RELATORIO = 1000
+
+# Colunas do arquivo (mesma ordem na importação e na exportação)
+CAMPOS = ["sku", "nome", "descricao", "preco", "estoque", "categoria", "imagem_filename"]
+
+FORMATOS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# Upsert por sku; sem sku a linha é sempre inserida (NULL não conflita no UNIQUE)
+# O estoque nunca fica abaixo do que os carrinhos já reservaram (disponível negativo)
+_insert = sqlite_insert(Produto.__table__)
+UPSERT_PRODUTO = _insert.on_conflict_do_update(
+    index_elements=["sku"],
+    set_={
+        **{campo: _insert.excluded[campo] for campo in CAMPOS if campo not in ("sku", "estoque")},
+        "estoque": func.max(_insert.excluded.estoque, Produto.__table__.c.reservado),
+        "atualizado_em": func.now(),
+    },
+)
+
+def formato_do_arquivo(nome: str) -> str:
+    """Formato pela extensão (.csv, .jsonl ou .ndjson)"""
+    extensao = os.path.splitext(nome or "")[1].lower().lstrip(".")
+    return "jsonl" if extensao == "ndjson" else extensao
+
+# ========== LEITURA ==========
+
+def ler_csv(linhas: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """(número da linha, registro) para cada linha de dados; cabeçalho obrigatório"""
+    leitor = csv.DictReader(linhas)
+    for registro in leitor:
+        # Células vazias valem como campo ausente (descricao, sku, imagem)
+        yield leitor.line_num, {chave: valor for chave, valor in registro.items() if valor not in ("", None)}
+
+def ler_jsonl(linhas: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """(número da linha, objeto); JSON inválido vira erro da própria linha"""
+    for numero, linha in enumerate(linhas, 1):
+        if not linha.strip():
+            continue
+        try:
+            yield numero, json.loads(linha)
+        except json.JSONDecodeError as e:
+            yield numero, ValueError(f"JSON inválido: {e.msg}")
+
+def ler_registros(arquivo_binario, formato: str) -> Iterator[Tuple[int, Any]]:
+    """Decodifica o arquivo (UTF-8, com ou sem BOM) linha a linha"""
+    linhas = codecs.iterdecode(arquivo_binario, "utf-8-sig")
+    return ler_csv(linhas) if formato == "csv" else ler_jsonl(linhas)
+
+# ========== IMPORTAÇÃO ==========
+
+def _mensagens(erro: Exception) -> List[str]:
+    if isinstance(erro, ValidationError):
+        return [f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in erro.errors()]
+    return [str(erro)]
+
+def _registrar_erro(relatorio: Dict[str, Any], numero: int, sku: Any, mensagens: List[str]):
+    if len(relatorio["erros"]) < MAX_ERROS_RELATORIO:
+        relatorio["erros"].append({"linha": numero, "sku": sku, "erros": mensagens})
+
+def _gravar_lote(engine, linhas: List[Dict[str, Any]], numeros: List[int], relatorio: Dict[str, Any]):
+    """
+    Um lote por transação: conta atualizações pelos skus já existentes e faz o upsert
+    Estoque abaixo do reservado é gravado igual ao reservado e a linha vai para os erros
+    """
+    skus = {linha["sku"] for linha in linhas if linha["sku"]}
+    with engine.begin() as conn:
+        reservados = {}
+        if skus:
+            reservados = dict(conn.execute(
+                select(Produto.sku, Produto.reservado).where(Produto.sku.in_(skus))
+            ).all())
+        conn.execute(UPSERT_PRODUTO, linhas)
+
+    for numero, linha in zip(numeros, linhas):
+        sku = linha["sku"]
+        if sku and sku in reservados:
+            relatorio["atualizados"] += 1
+            if linha["estoque"] < reservados[sku]:
+                relatorio["estoque_ajustado"] += 1
+                _registrar_erro(relatorio, numero, sku, [
+                    f"estoque: {linha['estoque']} é menor que as {reservados[sku]} unidades "
+                    f"reservadas em carrinhos; gravado {reservados[sku]}"
+                ])
+        else:
+            relatorio["criados"] += 1
+            if sku:
+                reservados[sku] = 0  # repetido no mesmo arquivo: a segunda linha atualiza
+    relatorio["lotes"] += 1
+
+def importar_produtos(
+    engine,
+    registros: Iterable[Tuple[int, Any]],
+    lote: int = LOTE_IMPORTACAO,
+    reindexar_apos: int = REINDEXAR_APOS
+) -> Dict[str, Any]:
+    """
+    Valida e grava os registros em lotes (engine síncrono)
+    Cada linha substitui todos os campos do produto com o mesmo sku.
+    Linhas inválidas não interrompem a carga: vão para o relatório de erros.
+    Estoque menor que o já reservado em carrinhos sobe até o reservado
+    (contado em estoque_ajustado e listado nos erros, mas a linha é gravada).
+    Lotes já gravados permanecem se uma falha de banco interromper a carga.
+    """
+    relatorio = {
+        "linhas": 0, "criados": 0, "atualizados": 0, "lotes": 0,
+        "estoque_ajustado": 0, "total_erros": 0, "erros": [],
+    }
+    pendentes: List[Dict[str, Any]] = []
+    numeros: List[int] = []
+    indice_suspenso = False
+
+    try:
+        for numero, dados in registros:
+            relatorio["linhas"] += 1
+            try:
+                if isinstance(dados, Exception):
+                    raise dados
+                if not isinstance(dados, dict):
+                    raise ValueError("Registro deve ser um objeto")
+                pendentes.append(ProdutoCreate(**dados).dict())
+                numeros.append(numero)
+            except (ValidationError, ValueError, TypeError) as e:
+                relatorio["total_erros"] += 1
+                sku = dados.get("sku") if isinstance(dados, dict) else None
+                _registrar_erro(relatorio, numero, sku, _mensagens(e))
+                continue
+
+            if len(pendentes) >= lote:
+                _gravar_lote(engine, pendentes, numeros, relatorio)
+                pendentes, numeros = [], []
+                gravados = relatorio["criados"] + relatorio["atualizados"]
+                if not indice_suspenso and gravados >= reindexar_apos:
+                    indice_suspenso = suspender_indice_busca(engine)
+
+        if pendentes:
+            _gravar_lote(engine, pendentes, numeros, relatorio)
+    finally:
+        if indice_suspenso:
+            reconstruir_indice_busca(engine)
+
+    return relatorio
+
+# ========== EXPORTAÇÃO ==========
+
+def consulta_exportacao(ultimo_id: int, lote: int = LOTE_EXPORTACAO):
+    """Próximo lote keyset por id, só as colunas do arquivo (sem ORM)"""
+    colunas = [Produto.id] + [getattr(Produto, campo) for campo in CAMPOS]
+    return select(*colunas).where(Produto.id > ultimo_id).order_by(Produto.id).limit(lote)
+
+def cabecalho(formato: str) -> str:
+    if formato != "csv":
+        return ""
+    saida = io.StringIO()
+    csv.writer(saida, lineterminator="\n").writerow(CAMPOS)
+    return saida.getvalue()
+
+def formatar_lote(linhas, formato: str) -> str:
+    """Serializa um lote de linhas (id + CAMPOS) no formato pedido"""
+    if formato == "csv":
+        saida = io.StringIO()
+        escritor = csv.writer(saida, lineterminator="\n")
+        escritor.writerows(
+            ["" if valor is None else valor for valor in linha[1:]] for linha in linhas
+        )
+        return saida.getvalue()
+    return "".join(
+        json.dumps(dict(zip(CAMPOS, linha[1:])), ensure_ascii=False, default=str) + "\n"
+        for linha in linhas
+    )
+
+def exportar_produtos(engine, arquivo, formato: str) -> int:
+    """Grava o catálogo inteiro no arquivo texto, lote a lote; retorna a quantidade"""
+    total = 0
+    ultimo_id = 0
+    arquivo.write(cabecalho(formato))
+    with engine.connect() as conn:
+        while True:
+            linhas = conn.execute(consulta_exportacao(ultimo_id)).all()
+            if not linhas:
+                break
+            arquivo.write(formatar_lote(linhas, formato))
+            total += len(linhas)
+            ultimo_id = linhas[-1].id
+    return total
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from database import engine
+    from migracoes import verificar_schema
+
+    parser = argparse.ArgumentParser(description="Importação/exportação do catálogo em lote")
+    parser.add_argument("operacao", choices=["importar", "exportar"])
+    parser.add_argument("arquivo", help="Arquivo .csv, .jsonl ou .ndjson")
+    parser.add_argument("--lote", type=int, default=LOTE_IMPORTACAO)
+    args = parser.parse_args()
+
+    formato = formato_do_arquivo(args.arquivo)
+    if formato not in FORMATOS:
+        print("❌ Formato não suportado: use .csv, .jsonl ou .ndjson")
+        sys.exit(1)
+
+    verificar_schema(engine)
+    inicio = time.perf_counter()
+
+    if args.operacao == "importar":
+        print(f"📥 IMPORTANDO {args.arquivo}")
+        with open(args.arquivo, "rb") as arquivo:
+            relatorio = importar_produtos(engine, ler_registros(arquivo, formato), args.lote)
+        duracao = time.perf_counter() - inicio
+        print(f"✅ {relatorio['linhas']} linhas em {duracao:.1f}s: "
+              f"{relatorio['criados']} criados, {relatorio['atualizados']} atualizados, "
+              f"{relatorio['total_erros']} com erro, {relatorio['estoque_ajustado']} com estoque ajustado")
+        for erro in relatorio["erros"][:20]:
+            print(f"   ❌ linha {erro['linha']} (sku {erro['sku']}): {'; '.join(erro['erros'])}")
+        listadas = relatorio["total_erros"] + relatorio["estoque_ajustado"]
+        if listadas > 20:
+            print(f"   ... e mais {listadas - 20} linhas com erro")
+    else:
+        print(f"📤 EXPORTANDO para {args.arquivo}")
+        with open(args.arquivo, "w", encoding="utf-8", newline="") as arquivo:
+            total = exportar_produtos(engine, arquivo, formato)
+        print(f"✅ {total} produtos exportados em {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,368 @@
+"""
+Carrinhos salvos no servidor (usuário logado ou sessão de visitante)
+Uma linha por carrinho: os itens ficam num JSON compacto com a foto de cada
+produto (preço em centavos, categoria e nome) e o total bruto é mantido a cada
+operação, sem recalcular o carrinho inteiro. Cada alteração de quantidade
+reserva o estoque (reservas.py), então o checkout só grava a foto já validada;
+a baixa confere que estoque e preços continuam os mesmos.
+
+A gravação é condicionada à versão lida (duas abas editando o mesmo carrinho
+não se sobrescrevem) e carrinhos parados por CARRINHO_TTL_HORAS são apagados
+em lotes por uma tarefa de fundo.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metricas import registrar_reserva
+from models import Produto, Carrinho, ReservaEstoque
+from precos import ZERO, buscar_regra, calcular_desconto, cupom_valido
+from reservas import (
+    agora, carregar_reservaveis, reservar, renovar_reservas, prazo_reserva, registrar_movimento, soltar_reservas
+)
+from serializacao import serializar
+
+logger = logging.getLogger(__name__)
+
+# Prazo de um carrinho sem atividade e intervalo/lote da limpeza dos abandonados
+CARRINHO_TTL_HORAS = int(os.getenv("CARRINHO_TTL_HORAS", "72"))
+CARRINHO_LIMPEZA_MINUTOS = int(os.getenv("CARRINHO_LIMPEZA_MINUTOS", "10"))
+CARRINHO_LOTE_LIMPEZA = 500
+CARRINHO_MAX_PRODUTOS = int(os.getenv("CARRINHO_MAX_PRODUTOS", "100"))
+# Produtos alterados por requisição (as reservas saem em lote, mas a lista vai no IN)
+CARRINHO_MAX_PRODUTOS_OPERACAO = 50
+
+class ItemCarrinho(NamedTuple):
+    """Item gravado no JSON do carrinho, na mesma ordem da lista"""
+    produto_id: int
+    quantidade: int
+    centavos: int  # preço unitário no momento em que o item foi alterado
+    categoria: str
+    nome: str
+
+def centavos(valor: Decimal) -> int:
+    return int((Decimal(valor) * 100).to_integral_value())
+
+def reais(valor_centavos: int) -> Decimal:
+    return Decimal(valor_centavos).scaleb(-2)
+
+def _conflito():
+    return HTTPException(
+        status_code=409,
+        detail="Carrinho alterado por outra requisição. Recarregue e tente novamente."
+    )
+
+# ========== LEITURA E GRAVAÇÃO ==========
+
+def codificar_itens(itens: Dict[int, ItemCarrinho]) -> str:
+    return serializar([list(item) for item in itens.values()]).decode()
+
+def decodificar_itens(texto: str) -> Dict[int, ItemCarrinho]:
+    return {linha[0]: ItemCarrinho(*linha) for linha in json.loads(texto)}
+
+def carrinho_vazio() -> Dict[str, Any]:
+    return {"itens": {}, "cupom": None, "total_centavos": 0, "expira_em": None, "versao": None}
+
+def estado_carrinho(linha) -> Dict[str, Any]:
+    """Linha de carrinhos como estado editável; vencido (e ainda não apagado) volta vazio"""
+    if linha is None:
+        return carrinho_vazio()
+    if linha.expira_em <= agora():
+        return {**carrinho_vazio(), "versao": linha.versao}
+    return {
+        "itens": decodificar_itens(linha.itens),
+        "cupom": linha.cupom,
+        "total_centavos": linha.total_centavos,
+        "expira_em": linha.expira_em,
+        "versao": linha.versao,
+    }
+
+async def carregar_carrinho(db: AsyncSession, dono: str) -> Dict[str, Any]:
+    """Carrinho do dono pela chave primária (vazio se não existe)"""
+    result = await db.execute(
+        select(Carrinho.itens, Carrinho.cupom, Carrinho.total_centavos, Carrinho.expira_em, Carrinho.versao)
+        .where(Carrinho.dono == dono)
+    )
+    return estado_carrinho(result.first())
+
+_inserir = sqlite_insert(Carrinho.__table__).on_conflict_do_nothing(index_elements=["dono"])
+
+async def gravar_carrinho(db: AsyncSession, dono: str, estado: Dict[str, Any]):
+    """
+    Grava o carrinho condicionado à versão lida, sem commit (sem itens: apaga a linha)
+    Se outra requisição gravou antes, desfaz a transação inteira e levanta 409
+    """
+    versao = estado["versao"]
+    if not estado["itens"]:
+        if versao is None:
+            return
+        result = await db.execute(
+            delete(Carrinho).where(Carrinho.dono == dono, Carrinho.versao == versao)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        estado["expira_em"] = agora() + CARRINHO_TTL_HORAS * 3600
+        valores = {
+            "itens": codificar_itens(estado["itens"]),
+            "cupom": estado["cupom"],
+            "total_centavos": estado["total_centavos"],
+            "expira_em": estado["expira_em"],
+            "versao": (versao or 0) + 1,
+        }
+        if versao is None:
+            result = await db.execute(_inserir.values(dono=dono, **valores))
+        else:
+            result = await db.execute(
+                update(Carrinho).where(Carrinho.dono == dono, Carrinho.versao == versao)
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+        estado["versao"] = valores["versao"]
+    if result.rowcount != 1:
+        await db.rollback()
+        raise _conflito()
+
+# ========== OPERAÇÕES ==========
+
+def quantidades_finais(estado: Dict[str, Any], operacoes: Iterable) -> Dict[int, int]:
+    """Aplica as operações na ordem e retorna só os produtos cuja quantidade mudou"""
+    atuais = {produto_id: item.quantidade for produto_id, item in estado["itens"].items()}
+    finais = dict(atuais)
+    for operacao in operacoes:
+        atual = finais.get(operacao.produto_id, 0)
+        if operacao.op == "adicionar":
+            finais[operacao.produto_id] = atual + operacao.quantidade
+        elif operacao.op == "remover":
+            finais[operacao.produto_id] = max(atual - operacao.quantidade, 0)
+        else:
+            finais[operacao.produto_id] = operacao.quantidade
+    return {
+        produto_id: quantidade for produto_id, quantidade in finais.items()
+        if quantidade != atuais.get(produto_id, 0)
+    }
+
+async def alterar_carrinho(db: AsyncSession, dono: str, operacoes: List) -> Dict[str, Any]:
+    """
+    Aplica as operações (adicionar, remover, definir) numa transação: reserva o
+    estoque de cada produto alterado, atualiza a foto dele e o total bruto pela
+    diferença, renova o prazo das reservas e grava o carrinho
+    """
+    estado = await carregar_carrinho(db, dono)
+    alterados = quantidades_finais(estado, operacoes)
+    if len(alterados) > CARRINHO_MAX_PRODUTOS_OPERACAO:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No máximo {CARRINHO_MAX_PRODUTOS_OPERACAO} produtos diferentes por requisição"
+        )
+    if not alterados:
+        return resposta_carrinho(estado)
+    novos = sum(1 for produto_id, quantidade in alterados.items() if quantidade and produto_id not in estado["itens"])
+    if len(estado["itens"]) + novos > CARRINHO_MAX_PRODUTOS:
+        raise HTTPException(status_code=400, detail=f"O carrinho aceita até {CARRINHO_MAX_PRODUTOS} produtos")
+
+    linhas = await carregar_reservaveis(db, dono, alterados.keys())
+    itens = estado["itens"]
+    for produto_id in [produto_id for produto_id, quantidade in alterados.items() if quantidade == 0]:
+        if produto_id not in linhas:
+            # Produto excluído do catálogo: só sai do carrinho
+            del alterados[produto_id]
+            anterior = itens.pop(produto_id, None)
+            if anterior:
+                estado["total_centavos"] -= anterior.centavos * anterior.quantidade
+
+    expira_em = prazo_reserva()
+    movimentos = await reservar(db, dono, alterados, expira_em, linhas) if alterados else []
+    for reserva in movimentos:
+        anterior = itens.pop(reserva["produto_id"], None)
+        if anterior:
+            estado["total_centavos"] -= anterior.centavos * anterior.quantidade
+        if reserva["quantidade"]:
+            item = ItemCarrinho(
+                reserva["produto_id"], reserva["quantidade"], centavos(reserva["preco"]),
+                reserva["categoria"], reserva["nome"]
+            )
+            itens[item.produto_id] = item
+            estado["total_centavos"] += item.centavos * item.quantidade
+
+    if itens:
+        await renovar_reservas(db, dono, expira_em)
+    else:
+        estado["cupom"] = None
+    await gravar_carrinho(db, dono, estado)
+    await db.commit()
+    for reserva in movimentos:
+        registrar_movimento(reserva)
+    return resposta_carrinho(estado)
+
+async def definir_cupom(db: AsyncSession, dono: str, cupom: Optional[str]) -> Dict[str, Any]:
+    """Aplica (ou remove, com None) o cupom do carrinho; renova os prazos"""
+    codigo = None
+    if cupom:
+        codigo = cupom_valido(cupom)
+        if codigo is None:
+            raise HTTPException(status_code=422, detail="Cupom inválido")
+    estado = await carregar_carrinho(db, dono)
+    if not estado["itens"]:
+        raise HTTPException(status_code=400, detail="Carrinho não pode estar vazio")
+    estado["cupom"] = codigo
+    await renovar_reservas(db, dono, prazo_reserva())
+    await gravar_carrinho(db, dono, estado)
+    await db.commit()
+    return resposta_carrinho(estado)
+
+async def esvaziar_carrinho(db: AsyncSession, dono: str) -> int:
+    """Apaga o carrinho e solta as reservas dele; retorna as unidades devolvidas"""
+    unidades = await soltar_reservas(db, dono)
+    await db.execute(
+        delete(Carrinho).where(Carrinho.dono == dono).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if unidades:
+        registrar_reserva("soltas", unidades)
+    return unidades
+
+def resposta_carrinho(estado: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Itens e totais do carrinho; o desconto sai do total mantido, sem somar os itens
+    de novo (cupom de uma categoria soma só os itens dela)
+    """
+    total_bruto = reais(estado["total_centavos"])
+    regra = buscar_regra(estado["cupom"])
+    base = None
+    if regra and regra.categoria is not None:
+        base = sum(
+            (reais(item.centavos * item.quantidade) for item in estado["itens"].values() if item.categoria == regra.categoria),
+            ZERO
+        )
+    desconto, cupom_usado = calcular_desconto(total_bruto, regra, base)
+    return {
+        "itens": [
+            {
+                "produto_id": item.produto_id,
+                "nome": item.nome,
+                "preco_unitario": float(reais(item.centavos)),
+                "quantidade": item.quantidade,
+                "subtotal": float(reais(item.centavos * item.quantidade)),
+            }
+            for item in estado["itens"].values()
+        ],
+        "cupom": cupom_usado,
+        "total_bruto": float(total_bruto),
+        "desconto": float(desconto),
+        "total_final": float(total_bruto - desconto),
+        "expira_em": datetime.utcfromtimestamp(estado["expira_em"]) if estado["expira_em"] else None,
+    }
+
+# ========== CHECKOUT ==========
+
+def consulta_checkout(dono: str):
+    """Carrinho com uma linha por reserva do dono (colunas da reserva nulas sem reservas)"""
+    return (
+        select(
+            Carrinho.itens, Carrinho.cupom, Carrinho.total_centavos, Carrinho.expira_em, Carrinho.versao,
+            ReservaEstoque.id.label("reserva_id"), ReservaEstoque.produto_id, ReservaEstoque.quantidade
+        )
+        .outerjoin(ReservaEstoque, ReservaEstoque.dono == Carrinho.dono)
+        .where(Carrinho.dono == dono)
+    )
+
+async def carregar_checkout(db: AsyncSession, dono: str) -> Tuple[Dict[str, Any], Dict[int, Tuple[int, int]]]:
+    """
+    Carrinho e as reservas dele numa consulta
+    Retorna (estado, produto_id -> (reserva_id, quantidade reservada))
+    """
+    result = await db.execute(consulta_checkout(dono))
+    linhas = result.all()
+    if not linhas:
+        return carrinho_vazio(), {}
+    reservas = {
+        linha.produto_id: (linha.reserva_id, linha.quantidade)
+        for linha in linhas if linha.reserva_id is not None
+    }
+    return estado_carrinho(linhas[0]), reservas
+
+def itens_pedido(estado: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Foto do carrinho no formato dos itens do checkout (preço em Decimal)"""
+    return [
+        {
+            "produto_id": item.produto_id,
+            "nome": item.nome,
+            "preco": reais(item.centavos),
+            "categoria": item.categoria,
+            "quantidade": item.quantidade,
+        }
+        for item in estado["itens"].values()
+    ]
+
+async def atualizar_carrinho(db: AsyncSession, dono: str) -> Dict[str, Any]:
+    """
+    Checkout recusado: refaz a foto com preço, nome e categoria atuais de cada
+    produto (os excluídos do catálogo saem) e recalcula o total bruto
+    """
+    estado = await carregar_carrinho(db, dono)
+    if not estado["itens"]:
+        return resposta_carrinho(estado)
+    result = await db.execute(
+        select(Produto.id, Produto.nome, Produto.preco, Produto.categoria)
+        .where(Produto.id.in_(list(estado["itens"].keys())))
+    )
+    produtos = {linha.id: linha for linha in result}
+    itens = {}
+    for produto_id, item in estado["itens"].items():
+        produto = produtos.get(produto_id)
+        if produto:
+            itens[produto_id] = ItemCarrinho(
+                produto_id, item.quantidade, centavos(produto.preco), produto.categoria, produto.nome
+            )
+    estado["itens"] = itens
+    estado["total_centavos"] = sum(item.centavos * item.quantidade for item in itens.values())
+    await gravar_carrinho(db, dono, estado)
+    await db.commit()
+    return resposta_carrinho(estado)
+
+# ========== LIMPEZA ==========
+
+async def apagar_abandonados(sessionmaker, lote: int = CARRINHO_LOTE_LIMPEZA) -> int:
+    """
+    Apaga os carrinhos vencidos em lotes (índice em expira_em), uma transação
+    curta por lote. As reservas deles vencem antes e voltam pela varredura de reservas.py
+    """
+    apagados = 0
+    while True:
+        async with sessionmaker() as sessao:
+            vencidos = (
+                select(Carrinho.dono).where(Carrinho.expira_em <= agora())
+                .order_by(Carrinho.expira_em).limit(lote)
+            )
+            result = await sessao.execute(
+                delete(Carrinho).where(Carrinho.dono.in_(vencidos.scalar_subquery()))
+                .execution_options(synchronize_session=False)
+            )
+            await sessao.commit()
+        apagados += result.rowcount
+        if result.rowcount < lote:
+            return apagados
+
+async def limpeza_carrinhos_periodica(sessionmaker):
+    """
+    Tarefa de fundo iniciada no startup da API
+    Espera antes de limpar: cancelada no shutdown, nunca fica no meio de uma transação
+    """
+    while True:
+        await asyncio.sleep(CARRINHO_LIMPEZA_MINUTOS * 60)
+        try:
+            apagados = await apagar_abandonados(sessionmaker)
+            if apagados:
+                logger.info(f"Carrinhos abandonados removidos: {apagados}")
+        except Exception as e:
+            logger.error(f"Erro na limpeza de carrinhos: {e}")
@@ -0,0 +1,102 @@
+"""
+Cupons de desconto cadastrados no banco (tabela cupons)
+As regras são compiladas em memória por precos.py e recarregadas quando mudam:
+na hora, no worker que editou; nos demais, pela tarefa de fundo que compara
+um carimbo (contagem e soma das versões) a cada CUPONS_RECARGA_SEGUNDOS.
+
+O limite de usos é conferido no próprio UPDATE que conta o uso, na transação
+do pedido: dois checkouts simultâneos nunca passam do limite.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Tuple
+
+from sqlalchemy import select, update, func, or_, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Cupom
+from precos import compilar_regras, instalar_regras, retirar_regra
+
+logger = logging.getLogger(__name__)
+
+CUPONS_RECARGA_SEGUNDOS = int(os.getenv("CUPONS_RECARGA_SEGUNDOS", "15"))
+
+CONSULTA_REGRAS = select(
+    Cupom.codigo, Cupom.tipo, Cupom.valor, Cupom.categoria, Cupom.minimo,
+    Cupom.valido_de, Cupom.valido_ate, Cupom.limite_usos, Cupom.usos, Cupom.ativo
+)
+CONSULTA_CARIMBO = select(func.count(Cupom.id), func.coalesce(func.sum(Cupom.versao), 0))
+
+# Carimbo das regras instaladas neste processo
+_carimbo: Tuple[int, int] = (-1, -1)
+
+# ========== CARGA ==========
+
+def carregar_cupons(engine) -> int:
+    """Compila as regras na inicialização da API, depois de verificar_schema"""
+    global _carimbo
+    with engine.connect() as conn:
+        carimbo = tuple(conn.execute(CONSULTA_CARIMBO).one())
+        regras = compilar_regras(conn.execute(CONSULTA_REGRAS))
+    instalar_regras(regras)
+    _carimbo = carimbo
+    logger.info(f"Cupons em vigor carregados: {len(regras)}")
+    return len(regras)
+
+async def recarregar_cupons(db: AsyncSession):
+    """Recompila as regras (depois de editar um cupom ou quando o carimbo mudou)"""
+    global _carimbo
+    carimbo = tuple((await db.execute(CONSULTA_CARIMBO)).one())
+    instalar_regras(compilar_regras(await db.execute(CONSULTA_REGRAS)))
+    _carimbo = carimbo
+
+async def verificar_mudancas(sessionmaker) -> bool:
+    """Recarrega só se outro worker editou algum cupom; True se recarregou"""
+    async with sessionmaker() as sessao:
+        carimbo = tuple((await sessao.execute(CONSULTA_CARIMBO)).one())
+        if carimbo == _carimbo:
+            return False
+        await recarregar_cupons(sessao)
+    return True
+
+async def recarga_periodica(sessionmaker):
+    """
+    Tarefa de fundo iniciada no startup da API
+    Espera antes de consultar: cancelada no shutdown, nunca fica no meio de uma transação
+    """
+    while True:
+        await asyncio.sleep(CUPONS_RECARGA_SEGUNDOS)
+        try:
+            if await verificar_mudancas(sessionmaker):
+                logger.info("Regras de cupons recarregadas")
+        except Exception as e:
+            logger.error(f"Erro na recarga de cupons: {e}")
+
+# ========== USO NO CHECKOUT ==========
+
+async def registrar_uso(db: AsyncSession, codigo: str) -> bool:
+    """
+    Conta um uso do cupom na transação do pedido (sem commit)
+    O uso que atinge o limite também muda a versão: o carimbo muda e os outros
+    workers tiram o cupom esgotado na próxima recarga
+    False: o cupom foi desativado ou chegou ao limite (sai da busca deste worker)
+    """
+    result = await db.execute(
+        update(Cupom)
+        .where(
+            Cupom.codigo == codigo,
+            Cupom.ativo.is_(True),
+            or_(Cupom.limite_usos.is_(None), Cupom.usos < Cupom.limite_usos)
+        )
+        .values(
+            usos=Cupom.usos + 1,
+            versao=case((Cupom.usos + 1 >= Cupom.limite_usos, Cupom.versao + 1), else_=Cupom.versao)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        retirar_regra(codigo)
+        return False
+    return True
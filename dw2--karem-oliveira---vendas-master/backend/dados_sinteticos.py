@@ -0,0 +1,239 @@
+"""
+Gerador determinístico de dados sintéticos em escala (produtos, usuários e pedidos)
+A mesma semente gera sempre o mesmo banco: base para os testes de carga
+(benchmarks/carga_api.py) e para comparar desempenho entre commits
+
+Uso pela linha de comando (pasta backend, banco em DATABASE_PATH):
+    python dados_sinteticos.py [--produtos 10000] [--usuarios 1000] [--pedidos 50000] [--semente 42]
+
+Todos os usuários têm a senha SENHA_SINTETICA; e-mails: usuario<n>@sintetico.loja
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import text
+
+from auth import hash_password
+from busca import suspender_indice_busca, reconstruir_indice_busca
+from relatorios import reconstruir_agregados
+
+logger = logging.getLogger(__name__)
+
+SEMENTE_PADRAO = 42
+SENHA_SINTETICA = "senha123"
+LOTE_INSERCAO = 5000
+
+# Datas fixas (não dependem do relógio): pedidos nos DIAS_HISTORICO dias antes de DATA_BASE
+DATA_BASE = datetime(2025, 1, 1)
+DIAS_HISTORICO = 365
+CUPOM = "ALUNO10"
+CHANCE_CUPOM = 0.2
+
+# Vocabulário por categoria: nomes variados o bastante para a busca ter seletividade real
+VOCABULARIO = {
+    "Livros": (
+        ["Livro", "Apostila", "Atlas", "Dicionário", "Caderno de Exercícios"],
+        ["Matemática", "Português", "História", "Geografia", "Ciências", "Inglês", "Física", "Química"],
+    ),
+    "Material Escolar": (
+        ["Caderno", "Lápis", "Caneta", "Borracha", "Régua", "Estojo", "Mochila", "Cola", "Tesoura"],
+        ["Universitário", "Colorido", "Escolar", "Premium", "Reciclado", "Infantil", "Grande", "Compacto"],
+    ),
+    "Uniformes": (
+        ["Camisa Polo", "Camiseta", "Bermuda", "Calça", "Agasalho", "Meia", "Boné"],
+        ["Azul", "Branca", "Cinza", "Infantil", "Juvenil", "Adulto", "Manga Longa"],
+    ),
+    "Eletrônicos": (
+        ["Calculadora", "Tablet", "Fone de Ouvido", "Pen Drive", "Mouse", "Teclado", "Carregador"],
+        ["Científica", "Educacional", "Bluetooth", "USB", "Sem Fio", "Gráfica", "Portátil"],
+    ),
+    "Esportes": (
+        ["Bola", "Tênis", "Garrafa", "Corda", "Kimono", "Rede", "Raquete"],
+        ["Futebol", "Vôlei", "Basquete", "Oficial", "Treino", "Infantil", "Profissional"],
+    ),
+    "Arte": (
+        ["Tinta Guache", "Pincel", "Giz de Cera", "Massinha", "Papel Canson", "Aquarela", "Lápis de Cor"],
+        ["12 Cores", "24 Cores", "Atóxico", "Escolar", "Profissional", "A3", "A4"],
+    ),
+}
+CATEGORIAS = list(VOCABULARIO)
+FAIXA_PRECO = {
+    "Livros": (25, 180), "Material Escolar": (2, 120), "Uniformes": (20, 150),
+    "Eletrônicos": (30, 1500), "Esportes": (15, 400), "Arte": (3, 90),
+}
+IMAGENS = [
+    "kit-cadernos-universitarios.png", "mochila-escolar-grande.png", "kit-canetas-coloridas.png",
+    "calculadora-cientifica.png", "camisa-polo-azul.png", "bola-futebol-oficial.png",
+    "tablet-educacional.png", "fones-ouvido-microfone.png", "matematica-6-ano.jpg",
+]
+
+def _data_texto(momento: datetime) -> str:
+    """Mesmo formato do CURRENT_TIMESTAMP do SQLite (server_default das colunas de data)"""
+    return momento.strftime("%Y-%m-%d %H:%M:%S")
+
+def _lotes(linhas: Iterator[tuple], tamanho: int = LOTE_INSERCAO) -> Iterator[List[tuple]]:
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+# ========== GERAÇÃO ==========
+
+def gerar_produtos(rng: random.Random, quantidade: int) -> Iterator[tuple]:
+    """(id, nome, descricao, preco, estoque, categoria, sku, imagem_filename, criado_em)"""
+    for produto_id in range(1, quantidade + 1):
+        categoria = CATEGORIAS[rng.randrange(len(CATEGORIAS))]
+        nomes, complementos = VOCABULARIO[categoria]
+        nome = f"{rng.choice(nomes)} {rng.choice(complementos)} {produto_id}"[:60]
+        minimo, maximo = FAIXA_PRECO[categoria]
+        criado_em = DATA_BASE - timedelta(days=rng.randrange(DIAS_HISTORICO * 2), seconds=rng.randrange(86400))
+        yield (
+            produto_id,
+            nome,
+            f"{nome} - {categoria.lower()} para o ano letivo",
+            round(rng.uniform(minimo, maximo), 2),
+            rng.randrange(50, 5000),
+            categoria,
+            f"SIN{produto_id:07d}",
+            rng.choice(IMAGENS) if rng.random() < 0.3 else None,
+            _data_texto(criado_em),
+        )
+
+def gerar_usuarios(quantidade: int, senha_hash: str) -> Iterator[tuple]:
+    """(id, email, senha_hash, nome, criado_em); o hash bcrypt é o mesmo para todos (gerado uma vez)"""
+    for usuario_id in range(1, quantidade + 1):
+        criado_em = DATA_BASE - timedelta(days=DIAS_HISTORICO, minutes=usuario_id)
+        yield usuario_id, email_sintetico(usuario_id), senha_hash, f"Usuário Sintético {usuario_id}", _data_texto(criado_em)
+
+def email_sintetico(usuario_id: int) -> str:
+    return f"usuario{usuario_id}@sintetico.loja"
+
+def gerar_pedidos(
+    rng: random.Random, quantidade: int, produtos: List[tuple], usuarios: int
+) -> Iterator[Tuple[tuple, List[tuple]]]:
+    """
+    Pedidos com 1 a 5 itens (produtos mais populares primeiro: distribuição de Pareto)
+    Retorna ((id, total_bruto, desconto, total_final, cupom, data, user_id), [itens])
+    """
+    inicio = DATA_BASE - timedelta(days=DIAS_HISTORICO)
+    passo = DIAS_HISTORICO * 86400 / max(quantidade, 1)
+    item_id = 0
+    for pedido_id in range(1, quantidade + 1):
+        escolhidos: Dict[int, int] = {}
+        for _ in range(rng.randint(1, 5)):
+            indice = min(int(rng.paretovariate(1.2)) - 1, len(produtos) - 1)
+            escolhidos[indice] = escolhidos.get(indice, 0) + rng.randint(1, 3)
+
+        itens = []
+        total_bruto = 0.0
+        for indice, quantidade_item in escolhidos.items():
+            produto_id, nome, preco = produtos[indice]
+            subtotal = round(preco * quantidade_item, 2)
+            total_bruto += subtotal
+            item_id += 1
+            itens.append((item_id, pedido_id, produto_id, nome, preco, quantidade_item, subtotal))
+
+        total_bruto = round(total_bruto, 2)
+        cupom = CUPOM if rng.random() < CHANCE_CUPOM else None
+        desconto = round(total_bruto * 0.10, 2) if cupom else 0.0
+        user_id = rng.randint(1, usuarios) if usuarios and rng.random() < 0.8 else None
+        data = inicio + timedelta(seconds=int(pedido_id * passo) + rng.randrange(60))
+        yield (pedido_id, total_bruto, desconto, round(total_bruto - desconto, 2), cupom, _data_texto(data), user_id), itens
+
+# ========== CARGA ==========
+
+def gerar_dados(
+    engine, produtos: int = 10000, usuarios: int = 1000, pedidos: int = 50000, semente: int = SEMENTE_PADRAO
+) -> Dict[str, float]:
+    """
+    Grava os dados sintéticos num banco vazio (já migrado) e refaz índice de busca e agregados
+    Retorna as quantidades e o tempo de cada etapa
+    """
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT 1 FROM produtos LIMIT 1")).first():
+            raise ValueError("O banco já tem produtos; gere os dados sintéticos num banco vazio")
+
+    rng = random.Random(semente)
+    tempos = {}
+    inicio = time.perf_counter()
+    indice_suspenso = suspender_indice_busca(engine)
+    with engine.begin() as conn:
+        for lote in _lotes(gerar_produtos(rng, produtos)):
+            conn.exec_driver_sql(
+                "INSERT INTO produtos (id, nome, descricao, preco, estoque, categoria, sku, imagem_filename, "
+                "criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [linha + (linha[-1],) for linha in lote]
+            )
+    if indice_suspenso:
+        reconstruir_indice_busca(engine)
+    tempos["produtos_s"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    senha_hash = hash_password(SENHA_SINTETICA)
+    with engine.begin() as conn:
+        for lote in _lotes(gerar_usuarios(usuarios, senha_hash)):
+            conn.exec_driver_sql(
+                "INSERT INTO users (id, email, senha_hash, nome, is_admin, criado_em, atualizado_em) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                [linha + (linha[-1],) for linha in lote]
+            )
+    tempos["usuarios_s"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with engine.connect() as conn:
+        catalogo = [tuple(linha) for linha in conn.exec_driver_sql("SELECT id, nome, preco FROM produtos ORDER BY id")]
+    rng_popularidade = random.Random(semente + 1)
+    rng_popularidade.shuffle(catalogo)  # os "populares" não são os primeiros ids
+    itens_total = 0
+    with engine.begin() as conn:
+        for lote in _lotes(gerar_pedidos(rng, pedidos, catalogo, usuarios), LOTE_INSERCAO // 5):
+            conn.exec_driver_sql(
+                "INSERT INTO pedidos (id, total_bruto, desconto, total_final, cupom_usado, data, user_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [pedido for pedido, _ in lote]
+            )
+            itens = [item for _, itens_pedido in lote for item in itens_pedido]
+            conn.exec_driver_sql(
+                "INSERT INTO itens_pedido (id, pedido_id, produto_id, nome_produto, preco_unitario, quantidade, subtotal) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                itens
+            )
+            itens_total += len(itens)
+    reconstruir_agregados(engine)
+    tempos["pedidos_s"] = time.perf_counter() - inicio
+
+    return {"produtos": produtos, "usuarios": usuarios, "pedidos": pedidos, "itens_pedido": itens_total, **tempos}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos determinísticos")
+    parser.add_argument("--produtos", type=int, default=10000)
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--pedidos", type=int, default=50000)
+    parser.add_argument("--semente", type=int, default=SEMENTE_PADRAO)
+    args = parser.parse_args()
+
+    from database import engine
+    from migracoes import aplicar_migracoes
+
+    logging.basicConfig(level=logging.INFO)
+    print("🧪 DADOS SINTÉTICOS")
+    print("=" * 50)
+    aplicar_migracoes(engine)
+    try:
+        resultado = gerar_dados(engine, args.produtos, args.usuarios, args.pedidos, args.semente)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {resultado['produtos']:,} produtos em {resultado['produtos_s']:.1f}s")
+    print(f"✅ {resultado['usuarios']:,} usuários em {resultado['usuarios_s']:.1f}s (senha: {SENHA_SINTETICA})")
+    print(f"✅ {resultado['pedidos']:,} pedidos ({resultado['itens_pedido']:,} itens) em {resultado['pedidos_s']:.1f}s")
@@ -1,43 +1,134 @@
 """
 Configuração do banco de dados SQLite
 Engine, SessionLocal e Base para SQLAlchemy
+Engine assíncrono (aiosqlite) e AsyncSessionLocal para os endpoints da API
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
 
 # Caminho do arquivo de banco SQLite
-DATABASE_URL = "sqlite:///./app.db"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "./app.db")
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# Perfil de ajuste do SQLite: "producao" (WAL + pragmas + pool) ou "padrao" (sem ajustes)
+SQLITE_PERFIL = os.getenv("SQLITE_PERFIL", "producao")
+
+# Pool de conexões (perfil producao)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# PRAGMAs aplicados em cada nova conexão
+PERFIS_SQLITE = {
+    "padrao": {},
+    "producao": {
+        "journal_mode": "WAL",       # leitores não bloqueiam o escritor (e vice-versa)
+        "synchronous": "NORMAL",     # seguro com WAL; fsync só no checkpoint
+        "busy_timeout": 5000,        # espera até 5s pelo lock em vez de falhar
+        "cache_size": -20000,        # ~20 MB de page cache por conexão
+        "mmap_size": 268435456,      # 256 MB de leitura via mmap
+        "temp_store": "MEMORY",
+    },
+}
+
+def configurar_conexao(engine_sync, perfil: str = SQLITE_PERFIL, somente_leitura: bool = False):
+    """Registra os PRAGMAs do perfil para cada conexão aberta pelo engine"""
+    pragmas = dict(PERFIS_SQLITE[perfil])
+    if somente_leitura:
+        pragmas["query_only"] = "ON"
+    if not pragmas:
+        return
+
+    @event.listens_for(engine_sync, "connect")
+    def aplicar_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+        cursor.close()
+
+def opcoes_pool(perfil: str, poolclass) -> dict:
+    """Pool dimensionado no perfil producao; no padrao mantém o pool do dialeto"""
+    if perfil == "padrao":
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+    }
+
+def criar_engine_async(url: str = ASYNC_DATABASE_URL, perfil: str = SQLITE_PERFIL, somente_leitura: bool = False):
+    """Cria engine assíncrono com o pool e os PRAGMAs do perfil"""
+    async_engine = create_async_engine(url, echo=False, **opcoes_pool(perfil, AsyncAdaptedQueuePool))
+    configurar_conexao(async_engine.sync_engine, perfil, somente_leitura)
+    return async_engine
 
 # Engine do SQLAlchemy
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},  # Necessário para SQLite
-    echo=False  # Alterar para True se quiser ver as queries SQL no log
+    echo=False,  # Alterar para True se quiser ver as queries SQL no log
+    **opcoes_pool(SQLITE_PERFIL, QueuePool)
 )
+configurar_conexao(engine)
 
-# SessionLocal para criar sessões de banco
+# SessionLocal para criar sessões de banco (scripts: seed.py)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrono: as queries não bloqueiam o event loop do uvicorn
+async_engine = criar_engine_async()
+
+# Engine só de leitura (PRAGMA query_only) para os endpoints GET: pool
+# separado, assim leituras não disputam conexões com o checkout
+async_engine_leitura = criar_engine_async(somente_leitura=True)
+
+# AsyncSessionLocal para os endpoints (expire_on_commit=False evita
+# recarregar atributos de forma implícita depois do commit)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+AsyncSessionLeitura = sessionmaker(
+    bind=async_engine_leitura,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base para modelos declarativos
 Base = declarative_base()
 
-def get_db():
+async def get_db():
     """
-    Dependency para obter sessão do banco de dados
+    Dependency para obter sessão assíncrona do banco de dados
     Usado nos endpoints FastAPI com Depends(get_db)
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_db_leitura():
+    """
+    Dependency para sessão somente leitura
+    Usado nos endpoints GET com Depends(get_db_leitura)
+    """
+    async with AsyncSessionLeitura() as db:
         yield db
-    finally:
-        db.close()
 
 def init_db():
     """
-    Função para inicializar o banco (criar tabelas)
+    Função para inicializar o banco (aplica as migrações pendentes)
     Chamada quando necessário criar estrutura inicial
     """
-    Base.metadata.create_all(bind=engine)
+    from migracoes import aplicar_migracoes
+    aplicar_migracoes(engine)
@@ -0,0 +1,210 @@
+"""
+Diagnóstico de SQL para desenvolvimento e staging (opt-in: SQL_DIAGNOSTICO=1)
+Registra as consultas de cada requisição, aponta N+1 (a mesma consulta
+repetida mudando só os parâmetros), loga consultas lentas com o
+EXPLAIN QUERY PLAN e confere o orçamento de consultas declarado por endpoint
+
+Em testes: SQL_ORCAMENTO_ESTRITO=1 faz o estouro do orçamento levantar
+OrcamentoConsultasExcedido (o TestClient repassa a exceção ao teste)
+"""
+
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SQL_DIAGNOSTICO = os.getenv("SQL_DIAGNOSTICO", "0") == "1"
+# Consultas acima disso (ms) são logadas com o plano
+SQL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", "100"))
+# Repetições da mesma consulta na requisição a partir das quais é N+1
+SQL_N_MAIS_1_MINIMO = int(os.getenv("SQL_N_MAIS_1_MINIMO", "3"))
+SQL_ORCAMENTO_ESTRITO = os.getenv("SQL_ORCAMENTO_ESTRITO", "0") == "1"
+
+CABECALHO_CONSULTAS = "X-Consultas-SQL"
+
+# Normalização: listas IN expandidas e literais viram "?"
+_LISTA_PARAMETROS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_ESPACOS = re.compile(r"\s+")
+
+class OrcamentoConsultasExcedido(AssertionError):
+    """Endpoint (ou bloco) executou mais consultas que o orçamento declarado"""
+
+class Consulta(NamedTuple):
+    normalizada: str
+    sql: str
+    parametros: object
+    duracao: float
+
+class RegistroConsultas:
+    """Consultas executadas em uma requisição (ou bloco capturar_consultas)"""
+
+    def __init__(self):
+        self.consultas: List[Consulta] = []
+
+    def __len__(self) -> int:
+        return len(self.consultas)
+
+    @property
+    def tempo_total(self) -> float:
+        return sum(consulta.duracao for consulta in self.consultas)
+
+    def repetidas(self, minimo: int = SQL_N_MAIS_1_MINIMO) -> List[Tuple[str, int]]:
+        """Consultas iguais a menos dos parâmetros, executadas `minimo` vezes ou mais"""
+        contagem = {}
+        for consulta in self.consultas:
+            contagem[consulta.normalizada] = contagem.get(consulta.normalizada, 0) + 1
+        return sorted(
+            ((sql, vezes) for sql, vezes in contagem.items() if vezes >= minimo),
+            key=lambda item: -item[1]
+        )
+
+_registro_atual: ContextVar[Optional[RegistroConsultas]] = ContextVar("registro_consultas", default=None)
+
+def normalizar(sql: str) -> str:
+    sql = _LITERAL_TEXTO.sub("?", sql)
+    sql = _LITERAL_NUMERO.sub("?", sql)
+    sql = _LISTA_PARAMETROS.sub("(?)", sql)
+    return _ESPACOS.sub(" ", sql).strip()
+
+# ========== ORÇAMENTO POR ENDPOINT ==========
+
+def orcamento_consultas(maximo: int):
+    """
+    Declara o máximo de consultas SQL de um endpoint (decorador, abaixo do @app.get)
+    Só é conferido com o diagnóstico ativo
+    """
+    def decorar(endpoint):
+        endpoint.orcamento_consultas = maximo
+        return endpoint
+    return decorar
+
+# ========== EVENTOS DO ENGINE ==========
+
+def plano_consulta(conn, sql: str, parametros) -> List[str]:
+    """EXPLAIN QUERY PLAN pelo cursor do DBAPI (fora dos eventos do SQLAlchemy)"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros or ())
+        return [linha[-1] for linha in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def ativar_diagnostico(engines: Iterable):
+    """Registra os eventos de diagnóstico nos engines (no async: async_engine.sync_engine)"""
+    for engine_sync in engines:
+        _instrumentar(engine_sync)
+    logger.warning(
+        f"Diagnóstico de SQL ativo (lenta > {SQL_LENTA_MS:g}ms, N+1 a partir de {SQL_N_MAIS_1_MINIMO}x); "
+        "não use em produção"
+    )
+
+def _instrumentar(engine_sync):
+
+    @event.listens_for(engine_sync, "before_cursor_execute")
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("diagnostico_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine_sync, "after_cursor_execute")
+    def depois(conn, cursor, statement, parameters, context, executemany):
+        duracao = time.perf_counter() - conn.info["diagnostico_inicio"].pop()
+        registro = _registro_atual.get()
+        if registro is not None:
+            registro.consultas.append(Consulta(normalizar(statement), statement, parameters, duracao))
+
+        if duracao * 1000 >= SQL_LENTA_MS:
+            plano = []
+            if not executemany and statement.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+                try:
+                    plano = plano_consulta(conn, statement, parameters)
+                except Exception as e:
+                    plano = [f"(sem plano: {e})"]
+            logger.warning(
+                f"Consulta lenta ({duracao * 1000:.1f}ms): {_ESPACOS.sub(' ', statement)} "
+                f"parâmetros={parameters!r}" + "".join(f"\n    plano: {linha}" for linha in plano)
+            )
+
+    @event.listens_for(engine_sync, "handle_error")
+    def erro(contexto):
+        inicios = contexto.connection.info.get("diagnostico_inicio") if contexto.connection is not None else None
+        if inicios:
+            inicios.pop()
+
+# ========== CAPTURA ==========
+
+@contextmanager
+def capturar_consultas():
+    """Registra as consultas executadas no bloco (scripts e testes)"""
+    registro = RegistroConsultas()
+    token = _registro_atual.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro_atual.reset(token)
+
+@contextmanager
+def limite_consultas(maximo: int, descricao: str = "bloco"):
+    """Falha com OrcamentoConsultasExcedido se o bloco executar mais de `maximo` consultas"""
+    with capturar_consultas() as registro:
+        yield registro
+    conferir_orcamento(registro, maximo, descricao)
+
+def conferir_orcamento(registro: RegistroConsultas, maximo: int, descricao: str):
+    if len(registro) > maximo:
+        consultas = "".join(f"\n    {consulta.normalizada}" for consulta in registro.consultas)
+        raise OrcamentoConsultasExcedido(
+            f"{descricao}: {len(registro)} consultas SQL, orçamento {maximo}{consultas}"
+        )
+
+class DiagnosticoSQLMiddleware:
+    """
+    Middleware ASGI que registra as consultas de cada requisição
+    Ao final: loga N+1 e estouro de orçamento, e informa a contagem
+    no cabeçalho X-Consultas-SQL (respostas montadas antes do envio)
+    """
+
+    def __init__(self, app, estrito: bool = SQL_ORCAMENTO_ESTRITO):
+        self.app = app
+        self.estrito = estrito
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registro = RegistroConsultas()
+
+        async def send_com_contagem(mensagem):
+            if mensagem["type"] == "http.response.start":
+                headers = list(mensagem.get("headers", []))
+                headers.append((CABECALHO_CONSULTAS.lower().encode(), str(len(registro)).encode()))
+                mensagem = {**mensagem, "headers": headers}
+            await send(mensagem)
+
+        token = _registro_atual.set(registro)
+        try:
+            await self.app(scope, receive, send_com_contagem)
+        finally:
+            _registro_atual.reset(token)
+
+        endpoint = scope.get("endpoint")
+        requisicao = f"{scope['method']} {scope['path']}"
+        for sql, vezes in registro.repetidas():
+            logger.warning(f"Possível N+1 em {requisicao}: {vezes}x {sql}")
+
+        maximo = getattr(endpoint, "orcamento_consultas", None)
+        if maximo is not None:
+            try:
+                conferir_orcamento(registro, maximo, requisicao)
+            except OrcamentoConsultasExcedido as e:
+                if self.estrito:
+                    raise
+                logger.warning(str(e))
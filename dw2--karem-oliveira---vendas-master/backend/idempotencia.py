@@ -0,0 +1,128 @@
+"""
+Checkout idempotente (cabeçalho Idempotency-Key)
+A resposta do pedido é gravada na mesma transação do pedido; uma repetição
+com a mesma chave recebe a resposta gravada sem validar estoque nem escrever.
+Só respostas de sucesso são gravadas: após um erro o cliente pode tentar de novo.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import select, delete, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import ChaveIdempotencia
+
+logger = logging.getLogger(__name__)
+
+# Por quanto tempo uma chave vale e de quanto em quanto tempo as vencidas são apagadas
+IDEMPOTENCIA_TTL_HORAS = int(os.getenv("IDEMPOTENCIA_TTL_HORAS", "24"))
+IDEMPOTENCIA_LIMPEZA_MINUTOS = int(os.getenv("IDEMPOTENCIA_LIMPEZA_MINUTOS", "60"))
+CHAVE_MAX_CARACTERES = 255
+
+# Cabeçalho das respostas repetidas (o corpo é idêntico ao da primeira)
+CABECALHO_REPETIDA = "Idempotent-Replayed"
+
+def agora() -> int:
+    return int(time.time())
+
+def validar_chave(chave: str):
+    if not chave or len(chave) > CHAVE_MAX_CARACTERES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key deve ter de 1 a {CHAVE_MAX_CARACTERES} caracteres"
+        )
+
+def impressao_digital(corpo) -> str:
+    """sha256 do corpo normalizado: a mesma chave não vale para outro carrinho"""
+    normalizado = json.dumps(corpo, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(normalizado.encode("utf-8")).hexdigest()
+
+async def buscar_resposta(db: AsyncSession, escopo: int, chave: str) -> Optional[ChaveIdempotencia]:
+    """Registro ainda válido da chave (busca pela chave primária)"""
+    result = await db.execute(
+        select(ChaveIdempotencia).where(
+            ChaveIdempotencia.escopo == escopo,
+            ChaveIdempotencia.chave == chave,
+            ChaveIdempotencia.expira_em > agora()
+        )
+    )
+    return result.scalars().first()
+
+def resposta_repetida(registro: ChaveIdempotencia, impressao: str) -> Response:
+    """Devolve a resposta gravada, sem serializar de novo"""
+    if registro.impressao != impressao:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key já usada com outro carrinho"
+        )
+    return Response(
+        content=registro.resposta,
+        status_code=registro.status_code,
+        media_type="application/json",
+        headers={CABECALHO_REPETIDA: "true"}
+    )
+
+# Uma chave vencida que a limpeza ainda não apagou é reaproveitada;
+# uma chave válida não é tocada (rowcount 0: outro pedido já a gravou)
+_insert = sqlite_insert(ChaveIdempotencia.__table__)
+GRAVAR_CHAVE = _insert.on_conflict_do_update(
+    index_elements=["escopo", "chave"],
+    set_={
+        coluna: _insert.excluded[coluna]
+        for coluna in ("impressao", "status_code", "resposta", "expira_em")
+    },
+    where=ChaveIdempotencia.__table__.c.expira_em <= bindparam("agora"),
+)
+
+async def gravar_resposta(
+    db: AsyncSession, escopo: int, chave: str, impressao: str, resposta: str, status_code: int = 200
+) -> bool:
+    """
+    Grava a resposta na transação do pedido (antes do commit)
+    False: um pedido concorrente com a mesma chave terminou primeiro
+    """
+    momento = agora()
+    result = await db.execute(GRAVAR_CHAVE, {
+        "agora": momento,
+        "escopo": escopo,
+        "chave": chave,
+        "impressao": impressao,
+        "status_code": status_code,
+        "resposta": resposta,
+        "expira_em": momento + IDEMPOTENCIA_TTL_HORAS * 3600,
+    })
+    return result.rowcount == 1
+
+# ========== LIMPEZA ==========
+
+async def apagar_expiradas(sessionmaker) -> int:
+    """Remove as chaves vencidas (índice em expira_em)"""
+    async with sessionmaker() as sessao:
+        result = await sessao.execute(
+            delete(ChaveIdempotencia).where(ChaveIdempotencia.expira_em <= agora())
+        )
+        await sessao.commit()
+    return result.rowcount
+
+async def limpeza_periodica(sessionmaker):
+    """
+    Tarefa de fundo iniciada no startup da API
+    Espera antes de apagar: cancelada no shutdown, nunca fica no meio de uma transação
+    (chaves vencidas já são ignoradas na busca)
+    """
+    while True:
+        await asyncio.sleep(IDEMPOTENCIA_LIMPEZA_MINUTOS * 60)
+        try:
+            removidas = await apagar_expiradas(sessionmaker)
+            if removidas:
+                logger.info(f"Chaves de idempotência expiradas removidas: {removidas}")
+        except Exception as e:
+            logger.error(f"Erro na limpeza de chaves de idempotência: {e}")
@@ -0,0 +1,191 @@
+"""
+Imagens dos produtos em variantes redimensionadas (WebP e AVIF)
+Geradas antes do uso em pool de workers, com o hash do conteúdo no nome:
+a URL muda quando a imagem muda, então podem ser cacheadas para sempre.
+
+Gerar na implantação (opcional, o startup também gera): python imagens.py
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from starlette.responses import FileResponse
+
+logger = logging.getLogger(__name__)
+
+# Origem (imagem_filename aponta para cá) e destino das variantes
+IMAGENS_DIR = os.getenv(
+    "IMAGENS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "images")
+)
+VARIANTES_DIR = os.getenv("VARIANTES_DIR", "uploads/imagens")
+IMAGENS_WORKERS = int(os.getenv("IMAGENS_WORKERS", "2"))
+
+# Larguras para o card (280px) em telas 1x e 2x e para a página de detalhe
+LARGURAS = (160, 320, 640)
+QUALIDADE = {"webp": 80, "avif": 55}
+EXTENSOES_ORIGEM = (".png", ".jpg", ".jpeg", ".webp")
+
+# Variantes com hash no nome nunca mudam de conteúdo
+CACHE_CONTROL_IMAGENS = "public, max-age=31536000, immutable"
+PREFIXO_URL = "/imagens"
+
+NOME_VARIANTE = re.compile(r"^[\w-]+-[0-9a-f]{12}-\d+\.(webp|avif)$")
+
+try:
+    from PIL import Image, features
+    PILLOW_DISPONIVEL = True
+except ImportError:  # Pillow é opcional: sem ele o catálogo usa só as imagens originais
+    PILLOW_DISPONIVEL = False
+
+# imagem_filename -> formato -> largura -> nome da variante
+_variantes: Dict[str, Dict[str, Dict[int, str]]] = {}
+# Nomes servidos pela rota -> stat do arquivo (nada fora daqui é lido do disco)
+_nomes_validos: Dict[str, os.stat_result] = {}
+
+def formatos_disponiveis() -> List[str]:
+    """AVIF primeiro (menor) quando o Pillow tiver o codificador"""
+    if not PILLOW_DISPONIVEL:
+        return []
+    return [formato for formato in ("avif", "webp") if features.check(formato)]
+
+# ========== GERAÇÃO ==========
+
+def _nome_variante(filename: str, digest: str, largura: int, formato: str) -> str:
+    base = re.sub(r"[^\w-]", "-", os.path.splitext(filename)[0])
+    return f"{base}-{digest}-{largura}.{formato}"
+
+def gerar_variantes(filename: str, formatos: List[str]) -> Tuple[str, Dict[str, Dict[int, str]]]:
+    """
+    Gera as variantes que faltam de uma imagem (executa no pool de workers)
+    Já existentes (mesmo hash) não são refeitas: um restart só lê e faz o hash da origem
+    """
+    origem = os.path.join(IMAGENS_DIR, filename)
+    with open(origem, "rb") as arquivo:
+        digest = hashlib.sha256(arquivo.read()).hexdigest()[:12]
+
+    variantes: Dict[str, Dict[int, str]] = {}
+    with Image.open(origem) as imagem:
+        # Não amplia: larguras maiores que a original viram uma variante no tamanho original
+        larguras = sorted({min(largura, imagem.width) for largura in LARGURAS})
+        pendentes = [
+            (formato, largura, _nome_variante(filename, digest, largura, formato))
+            for formato in formatos for largura in larguras
+        ]
+        if any(not os.path.exists(os.path.join(VARIANTES_DIR, nome)) for _, _, nome in pendentes):
+            imagem = imagem.convert("RGBA" if "A" in imagem.getbands() or "transparency" in imagem.info else "RGB")
+
+        for formato, largura, nome in pendentes:
+            destino = os.path.join(VARIANTES_DIR, nome)
+            if not os.path.exists(destino):
+                altura = max(1, round(imagem.height * largura / imagem.width))
+                reduzida = imagem.resize((largura, altura), Image.LANCZOS)
+                reduzida.save(f"{destino}.part", format=formato.upper(), quality=QUALIDADE[formato])
+                os.replace(f"{destino}.part", destino)
+            variantes.setdefault(formato, {})[largura] = nome
+
+    return filename, variantes
+
+def registrar(filename: str, variantes: Dict[str, Dict[int, str]]):
+    for por_largura in variantes.values():
+        for nome in por_largura.values():
+            _nomes_validos[nome] = os.stat(os.path.join(VARIANTES_DIR, nome))
+    _variantes[filename] = variantes
+
+def imagens_de_origem() -> List[str]:
+    if not os.path.isdir(IMAGENS_DIR):
+        return []
+    return sorted(
+        nome for nome in os.listdir(IMAGENS_DIR)
+        if nome.lower().endswith(EXTENSOES_ORIGEM)
+    )
+
+async def preparar_variantes() -> int:
+    """
+    Gera/registra as variantes de todas as imagens no pool (startup da API)
+    Retorna quantas imagens ficaram com variantes
+    """
+    formatos = formatos_disponiveis()
+    if not formatos:
+        logger.info("Pillow sem WebP/AVIF: catálogo servido só com as imagens originais")
+        return 0
+
+    os.makedirs(VARIANTES_DIR, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=IMAGENS_WORKERS, thread_name_prefix="imagens") as executor:
+        tarefas = [
+            loop.run_in_executor(executor, gerar_variantes, filename, formatos)
+            for filename in imagens_de_origem()
+        ]
+        for tarefa in asyncio.as_completed(tarefas):
+            try:
+                registrar(*await tarefa)
+            except Exception as e:
+                logger.warning(f"Não foi possível gerar variantes: {e}")
+
+    logger.info(f"Variantes de imagem prontas para {len(_variantes)} imagens ({', '.join(formatos)})")
+    return len(_variantes)
+
+# ========== CONSULTA ==========
+
+def urls_variantes(filename: Optional[str]) -> Optional[Dict[str, Dict[int, str]]]:
+    """URLs por formato e largura; None se a imagem (ainda) não tiver variantes"""
+    variantes = _variantes.get(filename) if filename else None
+    if not variantes:
+        return None
+    return {
+        formato: {largura: f"{PREFIXO_URL}/{nome}" for largura, nome in por_largura.items()}
+        for formato, por_largura in variantes.items()
+    }
+
+def caminho_variante(nome: str) -> Optional[str]:
+    """Caminho no disco de uma variante conhecida (evita path traversal)"""
+    if not NOME_VARIANTE.match(nome) or nome not in _nomes_validos:
+        return None
+    return os.path.join(VARIANTES_DIR, nome)
+
+class RespostaArquivo(FileResponse):
+    """
+    FileResponse que usa a extensão ASGI zero-copy (sendfile) quando o servidor
+    a oferece; nos demais envia em blocos de 64KB (o padrão do Starlette é 4KB)
+    """
+    chunk_size = 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if "http.response.zerocopy" not in scope.get("extensions", {}) or self.stat_result is None:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        with open(self.path, "rb") as arquivo:
+            await send({"type": "http.response.zerocopy", "file": arquivo, "more_body": False})
+
+def resposta_variante(nome: str, method: str) -> Optional[RespostaArquivo]:
+    """Resposta da variante, com o stat guardado no registro (sem syscall por requisição)"""
+    caminho = caminho_variante(nome)
+    if caminho is None:
+        return None
+    return RespostaArquivo(
+        caminho,
+        media_type=f"image/{nome.rsplit('.', 1)[1]}",
+        headers={"Cache-Control": CACHE_CONTROL_IMAGENS},
+        stat_result=_nomes_validos[nome],
+        method=method,
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("🖼️  GERANDO VARIANTES DAS IMAGENS DE PRODUTOS")
+    print("=" * 50)
+    total = asyncio.run(preparar_variantes())
+    for filename, variantes in sorted(_variantes.items()):
+        print(f"✅ {filename}: {', '.join(f'{f} {sorted(l)}' for f, l in variantes.items())}")
+    print(f"{total} imagens em {VARIANTES_DIR}")
@@ -0,0 +1,270 @@
+"""
+Métricas no formato de exposição do Prometheus (texto 0.0.4), sem dependências
+Latência por rota, requisições em andamento, consultas SQL por requisição
+(eventos do engine), uso dos pools de conexão, resultado dos checkouts e
+unidades movimentadas pelas reservas de estoque
+
+Custo por requisição: dois perf_counter, uma busca em dicionário e alguns
+incrementos; as métricas dos pools e caches são lidas só na coleta (/metrics)
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# Limites dos buckets (segundos): latência HTTP e duração de consultas SQL
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Rótulo das requisições que não casaram com nenhuma rota (evita cardinalidade alta)
+ROTA_DESCONHECIDA = "desconhecida"
+
+# [consultas, segundos] da requisição atual, preenchido pelos eventos do engine
+_sql_requisicao: ContextVar[Optional[List[float]]] = ContextVar("sql_requisicao", default=None)
+
+# ========== TIPOS DE MÉTRICA ==========
+
+def _formatar_rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class Metrica:
+    """
+    Série de valores por combinação de rótulos
+    coletar: função lida só na coleta, para valores que já existem em outro
+    lugar (pools, caches), sem custo no caminho da requisição
+    """
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 coletar: Optional[Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]] = None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._coletar = coletar
+        self._lock = threading.Lock()  # eventos do engine síncrono rodam em threads
+
+    def inc(self, *valores_rotulos: str, valor: float = 1):
+        with self._lock:
+            self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + valor
+
+    def valor(self, *valores_rotulos: str) -> float:
+        return self._valores.get(valores_rotulos, 0)
+
+    def cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+    def expor(self) -> List[str]:
+        valores = dict(self._coletar()) if self._coletar else self._valores
+        linhas = self.cabecalho()
+        for rotulos, valor in sorted(valores.items()):
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {_numero(valor)}")
+        return linhas
+
+class Contador(Metrica):
+    tipo = "counter"
+
+class Medidor(Metrica):
+    """Gauge: valor atual (sobe e desce)"""
+    tipo = "gauge"
+
+    def dec(self, *valores_rotulos: str, valor: float = 1):
+        self.inc(*valores_rotulos, valor=-valor)
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS_HTTP):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+        # rótulos -> [contagem por bucket (não acumulada), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observar(self, valor: float, *valores_rotulos: str):
+        indice = bisect_left(self.buckets, valor)  # valor <= limite (le)
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def expor(self) -> List[str]:
+        linhas = self.cabecalho()
+        for rotulos, (contagens, soma, total) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                le = f'le="{_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {total}")
+        return linhas
+
+# ========== REGISTRO ==========
+
+_registro: List[Metrica] = []
+
+def registrar(metrica):
+    _registro.append(metrica)
+    return metrica
+
+def expor_metricas() -> str:
+    linhas: List[str] = []
+    for metrica in _registro:
+        linhas.extend(metrica.expor())
+    return "\n".join(linhas) + "\n"
+
+# HTTP
+requisicoes_total = registrar(Contador(
+    "http_requisicoes_total", "Requisições HTTP atendidas", ("metodo", "rota", "status")
+))
+latencia_requisicao = registrar(Histograma(
+    "http_requisicao_duracao_segundos", "Latência das requisições HTTP por rota", ("metodo", "rota")
+))
+requisicoes_em_andamento = registrar(Medidor(
+    "http_requisicoes_em_andamento", "Requisições HTTP sendo atendidas agora"
+))
+consultas_por_requisicao = registrar(Histograma(
+    "http_consultas_sql_por_requisicao", "Consultas SQL executadas por requisição",
+    ("metodo", "rota"), buckets=BUCKETS_CONSULTAS
+))
+tempo_banco_requisicao = registrar(Histograma(
+    "http_tempo_sql_segundos", "Tempo em consultas SQL por requisição", ("metodo", "rota")
+))
+
+# Banco
+# (o _count do histograma é o total de consultas por engine)
+duracao_consulta_sql = registrar(Histograma(
+    "db_consulta_duracao_segundos", "Duração das consultas SQL", ("engine",), buckets=BUCKETS_SQL
+))
+
+# Checkout
+checkouts_total = registrar(Contador(
+    "checkout_total", "Checkouts por resultado (sucesso, repetido ou motivo da falha)", ("resultado",)
+))
+
+def registrar_checkout(resultado: str):
+    """sucesso, repetido, carrinho_vazio, produto_inexistente, estoque_insuficiente, conflito_estoque, ..."""
+    checkouts_total.inc(resultado)
+
+# Reservas de estoque dos carrinhos
+reservas_unidades_total = registrar(Contador(
+    "reservas_estoque_unidades_total", "Unidades reservadas, soltas, expiradas ou convertidas em venda", ("evento",)
+))
+
+def registrar_reserva(evento: str, unidades: int):
+    """reservadas, soltas, expiradas, convertidas"""
+    if unidades:
+        reservas_unidades_total.inc(evento, valor=unidades)
+
+# ========== SQL (EVENTOS DO ENGINE) ==========
+
+def instrumentar_engine(engine_sync, nome: str):
+    """Conta e cronometra cada consulta do engine (no async: async_engine.sync_engine)"""
+
+    @event.listens_for(engine_sync, "before_cursor_execute")
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine_sync, "after_cursor_execute")
+    def depois(conn, cursor, statement, parameters, context, executemany):
+        duracao = time.perf_counter() - conn.info["metricas_inicio"].pop()
+        duracao_consulta_sql.observar(duracao, nome)
+        atual = _sql_requisicao.get()
+        if atual is not None:
+            atual[0] += 1
+            atual[1] += duracao
+
+    @event.listens_for(engine_sync, "handle_error")
+    def erro(contexto):
+        inicios = contexto.connection.info.get("metricas_inicio") if contexto.connection is not None else None
+        if inicios:
+            inicios.pop()
+
+def medidor_pools(engines: Dict[str, object]) -> Medidor:
+    """Conexões do pool por engine e estado (em_uso, ociosas, overflow), lidas na coleta"""
+
+    def coletar():
+        for nome, engine_sync in engines.items():
+            pool = engine_sync.pool
+            if not hasattr(pool, "checkedout"):
+                continue
+            yield (nome, "em_uso"), pool.checkedout()
+            yield (nome, "ociosas"), pool.checkedin()
+            yield (nome, "overflow"), max(pool.overflow(), 0)
+            yield (nome, "tamanho"), pool.size()
+
+    return registrar(Medidor(
+        "db_pool_conexoes", "Conexões do pool por engine e estado", ("engine", "estado"), coletar=coletar
+    ))
+
+# ========== MIDDLEWARE ==========
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI que mede latência, status e consultas SQL de cada requisição
+    A rota é o caminho declarado (/produtos/{produto_id}), não a URL, para
+    manter poucas séries por métrica
+    """
+
+    def __init__(self, app, rotas: Callable[[], Iterable]):
+        self.app = app
+        self._rotas = rotas
+        self._caminhos: Optional[Dict[object, str]] = None
+
+    def _rota(self, scope) -> str:
+        if self._caminhos is None:
+            self._caminhos = {
+                rota.endpoint: rota.path for rota in self._rotas() if hasattr(rota, "endpoint")
+            }
+        return self._caminhos.get(scope.get("endpoint"), ROTA_DESCONHECIDA)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_com_status(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status[0] = mensagem["status"]
+            await send(mensagem)
+
+        sql = [0, 0.0]
+        token = _sql_requisicao.set(sql)
+        requisicoes_em_andamento.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            duracao = time.perf_counter() - inicio
+            requisicoes_em_andamento.dec()
+            _sql_requisicao.reset(token)
+
+            metodo = scope["method"]
+            rota = self._rota(scope)
+            requisicoes_total.inc(metodo, rota, str(status[0]))
+            latencia_requisicao.observar(duracao, metodo, rota)
+            consultas_por_requisicao.observar(sql[0], metodo, rota)
+            tempo_banco_requisicao.observar(sql[1], metodo, rota)
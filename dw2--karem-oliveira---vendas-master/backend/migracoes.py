@@ -0,0 +1,393 @@
+"""
+Migrações versionadas do schema SQLite
+Histórico na tabela schema_version e versão atual em PRAGMA user_version
+(lida no cabeçalho do arquivo: a verificação na inicialização é constante)
+
+Aplicar manualmente: python migracoes.py        (status: python migracoes.py --status)
+"""
+
+import logging
+import os
+import sys
+from typing import Callable, List, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# Sem esta flag a API recusa subir com schema desatualizado (migrar antes do deploy)
+MIGRAR_NA_INICIALIZACAO = os.getenv("MIGRAR_NA_INICIALIZACAO", "1") == "1"
+
+# Um passo é SQL ou uma função que recebe a conexão sqlite3
+Passo = Union[str, Callable]
+
+class Migracao:
+    """
+    Uma versão do schema
+    online=True: cada passo roda em transação própria, assim um CREATE INDEX
+    segura o lock de escrita só durante a própria construção (leitores
+    continuam no WAL). Os passos devem ser idempotentes (IF NOT EXISTS).
+    """
+
+    def __init__(self, versao: int, descricao: str, passos: Sequence[Passo], online: bool = False):
+        self.versao = versao
+        self.descricao = descricao
+        self.passos = list(passos)
+        self.online = online
+
+# ========== MIGRAÇÕES ==========
+# Nunca altere uma migração já publicada: crie a próxima versão.
+
+def _criar_indice_busca(conn):
+    """Tabela FTS5 da busca; sem FTS5 a busca continua pelo caminho ILIKE"""
+    from busca import DDL_TABELA, DDL_TRIGGERS
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+    ).fetchone()
+    if not existe:
+        try:
+            conn.execute(DDL_TABELA)
+        except Exception as e:
+            logger.warning(f"FTS5 indisponível, busca usará ILIKE: {e}")
+            return
+        conn.execute("INSERT INTO produtos_fts(produtos_fts) VALUES ('rebuild')")
+    for ddl in DDL_TRIGGERS:
+        conn.execute(ddl)
+
+def _preencher_agregados_vendas(conn):
+    """Agregados de vendas a partir dos pedidos já existentes"""
+    from relatorios import SQL_BACKFILL
+    for sql in SQL_BACKFILL:
+        conn.execute(sql)
+
+def _completar_produtos(conn):
+    """Bancos criados antes do upload de imagens não têm produtos.imagem_filename"""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(produtos)")}
+    if "imagem_filename" not in colunas:
+        conn.execute("ALTER TABLE produtos ADD COLUMN imagem_filename VARCHAR(255)")
+
+MIGRACOES: List[Migracao] = [
+    Migracao(1, "Schema inicial: produtos, pedidos, itens_pedido e users", [
+        """
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER NOT NULL,
+            nome VARCHAR(60) NOT NULL,
+            descricao TEXT,
+            preco NUMERIC(10, 2) NOT NULL,
+            estoque INTEGER NOT NULL,
+            categoria VARCHAR(50) NOT NULL,
+            sku VARCHAR(50),
+            imagem_filename VARCHAR(255),
+            criado_em DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            atualizado_em DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (id),
+            UNIQUE (sku)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_produtos_categoria ON produtos (categoria)",
+        "CREATE INDEX IF NOT EXISTS ix_produtos_id ON produtos (id)",
+        "CREATE INDEX IF NOT EXISTS ix_produtos_nome ON produtos (nome)",
+        """
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER NOT NULL,
+            total_bruto NUMERIC(10, 2) NOT NULL,
+            desconto NUMERIC(10, 2) NOT NULL,
+            total_final NUMERIC(10, 2) NOT NULL,
+            cupom_usado VARCHAR(20),
+            data DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_id ON pedidos (id)",
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            senha_hash VARCHAR(255) NOT NULL,
+            nome VARCHAR(100) NOT NULL,
+            telefone VARCHAR(20),
+            endereco TEXT,
+            avatar_filename VARCHAR(255),
+            is_admin BOOLEAN NOT NULL,
+            criado_em DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            atualizado_em DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+        """
+        CREATE TABLE IF NOT EXISTS itens_pedido (
+            id INTEGER NOT NULL,
+            pedido_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nome_produto VARCHAR(60) NOT NULL,
+            preco_unitario NUMERIC(10, 2) NOT NULL,
+            quantidade INTEGER NOT NULL,
+            subtotal NUMERIC(10, 2) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(pedido_id) REFERENCES pedidos (id),
+            FOREIGN KEY(produto_id) REFERENCES produtos (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_itens_pedido_id ON itens_pedido (id)",
+    ]),
+    Migracao(2, "Índices compostos de listagem e de itens de pedido", [
+        "CREATE INDEX IF NOT EXISTS ix_produtos_preco ON produtos (preco)",
+        "CREATE INDEX IF NOT EXISTS ix_produtos_categoria_nome ON produtos (categoria, nome)",
+        "CREATE INDEX IF NOT EXISTS ix_produtos_categoria_preco ON produtos (categoria, preco)",
+        "CREATE INDEX IF NOT EXISTS ix_itens_pedido_pedido_id ON itens_pedido (pedido_id)",
+        "CREATE INDEX IF NOT EXISTS ix_itens_pedido_produto_quantidade ON itens_pedido (produto_id, quantidade)",
+        # Coberto por ix_produtos_categoria_nome
+        "DROP INDEX IF EXISTS ix_produtos_categoria",
+    ], online=True),
+    Migracao(3, "Índice de busca textual FTS5 (produtos_fts)", [_criar_indice_busca]),
+    # O id já é a chave da B-tree (rowid): estes índices só custam escrita
+    Migracao(4, "Remove índices redundantes sobre as chaves primárias", [
+        "DROP INDEX IF EXISTS ix_produtos_id",
+        "DROP INDEX IF EXISTS ix_pedidos_id",
+        "DROP INDEX IF EXISTS ix_itens_pedido_id",
+        "DROP INDEX IF EXISTS ix_users_id",
+    ], online=True),
+    # Chave (dia, ...) agrupada fisicamente (WITHOUT ROWID): um intervalo de
+    # datas é uma leitura contígua, independente do tamanho do histórico
+    Migracao(5, "Agregados de vendas por dia, produto, categoria e cupom", [
+        """
+        CREATE TABLE IF NOT EXISTS vendas_diarias (
+            dia DATE NOT NULL,
+            pedidos INTEGER NOT NULL,
+            unidades INTEGER NOT NULL,
+            receita_bruta NUMERIC(12, 2) NOT NULL,
+            descontos NUMERIC(12, 2) NOT NULL,
+            receita NUMERIC(12, 2) NOT NULL,
+            PRIMARY KEY (dia)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS vendas_produto_dia (
+            dia DATE NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nome_produto VARCHAR(60) NOT NULL,
+            unidades INTEGER NOT NULL,
+            receita_bruta NUMERIC(12, 2) NOT NULL,
+            PRIMARY KEY (dia, produto_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS vendas_categoria_dia (
+            dia DATE NOT NULL,
+            categoria VARCHAR(50) NOT NULL,
+            unidades INTEGER NOT NULL,
+            receita_bruta NUMERIC(12, 2) NOT NULL,
+            PRIMARY KEY (dia, categoria)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS uso_cupom_dia (
+            dia DATE NOT NULL,
+            cupom VARCHAR(20) NOT NULL,
+            pedidos INTEGER NOT NULL,
+            descontos NUMERIC(12, 2) NOT NULL,
+            PRIMARY KEY (dia, cupom)
+        ) WITHOUT ROWID
+        """,
+        _preencher_agregados_vendas,
+    ]),
+    # Pedidos antigos ficam sem dono (NULL), como as compras de visitantes
+    Migracao(6, "Dono do pedido (pedidos.user_id)", [
+        "ALTER TABLE pedidos ADD COLUMN user_id INTEGER REFERENCES users (id)",
+    ]),
+    Migracao(7, "Índice do histórico de pedidos por usuário", [
+        "CREATE INDEX IF NOT EXISTS ix_pedidos_user_data ON pedidos (user_id, data)",
+    ], online=True),
+    Migracao(8, "Respostas gravadas do checkout idempotente", [
+        """
+        CREATE TABLE IF NOT EXISTS chaves_idempotencia (
+            escopo INTEGER NOT NULL,
+            chave VARCHAR(255) NOT NULL,
+            impressao VARCHAR(64) NOT NULL,
+            status_code INTEGER NOT NULL,
+            resposta TEXT NOT NULL,
+            expira_em INTEGER NOT NULL,
+            PRIMARY KEY (escopo, chave)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_chaves_idempotencia_expira_em ON chaves_idempotencia (expira_em)",
+    ]),
+    # produtos.reservado é a soma das reservas do produto, mantida na mesma
+    # transação de cada reserva: disponível = estoque - reservado sem agregar
+    Migracao(9, "Reservas temporárias de estoque dos carrinhos", [
+        "ALTER TABLE produtos ADD COLUMN reservado INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS reservas_estoque (
+            id INTEGER NOT NULL,
+            dono VARCHAR(80) NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            expira_em INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(produto_id) REFERENCES produtos (id)
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_reservas_estoque_dono_produto ON reservas_estoque (dono, produto_id)",
+        "CREATE INDEX IF NOT EXISTS ix_reservas_estoque_expira_em ON reservas_estoque (expira_em)",
+    ]),
+    # Uma linha por carrinho: os itens ficam num JSON compacto, lido e gravado inteiro
+    Migracao(10, "Carrinhos salvos no servidor", [
+        """
+        CREATE TABLE IF NOT EXISTS carrinhos (
+            dono VARCHAR(80) NOT NULL,
+            itens TEXT NOT NULL,
+            cupom VARCHAR(20),
+            total_centavos INTEGER NOT NULL,
+            expira_em INTEGER NOT NULL,
+            versao INTEGER NOT NULL,
+            PRIMARY KEY (dono)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_carrinhos_expira_em ON carrinhos (expira_em)",
+    ]),
+    # O cupom que era fixo no código vira a primeira linha da tabela
+    Migracao(11, "Regras de desconto dos cupons", [
+        """
+        CREATE TABLE IF NOT EXISTS cupons (
+            id INTEGER NOT NULL,
+            codigo VARCHAR(20) NOT NULL,
+            tipo VARCHAR(10) NOT NULL,
+            valor NUMERIC(10, 2) NOT NULL,
+            categoria VARCHAR(50),
+            minimo NUMERIC(10, 2),
+            valido_de DATETIME,
+            valido_ate DATETIME,
+            limite_usos INTEGER,
+            usos INTEGER NOT NULL DEFAULT 0,
+            ativo BOOLEAN NOT NULL DEFAULT 1,
+            versao INTEGER NOT NULL DEFAULT 1,
+            atualizado_em DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (id),
+            UNIQUE (codigo)
+        )
+        """,
+        "INSERT OR IGNORE INTO cupons (codigo, tipo, valor) VALUES ('ALUNO10', 'percentual', 10)",
+    ]),
+    # A v1 adota bancos antigos como estão (CREATE TABLE IF NOT EXISTS)
+    Migracao(12, "Coluna produtos.imagem_filename em bancos adotados", [_completar_produtos]),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1].versao
+
+DDL_SCHEMA_VERSION = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    versao INTEGER PRIMARY KEY,
+    descricao TEXT NOT NULL,
+    aplicada_em DATETIME DEFAULT (CURRENT_TIMESTAMP)
+)
+"""
+
+# ========== EXECUÇÃO ==========
+
+def versao_do_banco(conn) -> int:
+    """Versão aplicada (PRAGMA user_version: cabeçalho do arquivo, sem consultar tabelas)"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _executar_passo(conn, passo: Passo):
+    if callable(passo):
+        passo(conn)
+    else:
+        conn.execute(passo)
+
+def _aplicar(conn, migracao: Migracao) -> bool:
+    """
+    Aplica uma migração sob BEGIN IMMEDIATE (um escritor por vez)
+    A versão é relida dentro do lock: workers subindo juntos não repetem a migração.
+    """
+    def dentro_do_lock(passos) -> bool:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if versao_do_banco(conn) >= migracao.versao:
+                conn.execute("ROLLBACK")
+                return False
+            for passo in passos:
+                _executar_passo(conn, passo)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    if migracao.online:
+        for passo in migracao.passos:
+            if not dentro_do_lock([passo]):
+                return False
+
+    registrar = [
+        DDL_SCHEMA_VERSION,
+        lambda c: c.execute(
+            "INSERT INTO schema_version (versao, descricao) VALUES (?, ?)",
+            (migracao.versao, migracao.descricao)
+        ),
+        f"PRAGMA user_version = {migracao.versao}",
+    ]
+    passos = registrar if migracao.online else migracao.passos + registrar
+    return dentro_do_lock(passos)
+
+def aplicar_migracoes(engine) -> List[int]:
+    """Aplica as migrações pendentes em ordem; retorna as versões aplicadas"""
+    aplicadas = []
+    conexao = engine.raw_connection()
+    sqlite = conexao.connection
+    isolamento = sqlite.isolation_level
+    # Transações controladas aqui (o sqlite3 não abre BEGIN antes de DDL)
+    sqlite.isolation_level = None
+    try:
+        for migracao in MIGRACOES:
+            if versao_do_banco(sqlite) >= migracao.versao:
+                continue
+            if _aplicar(sqlite, migracao):
+                aplicadas.append(migracao.versao)
+                logger.info(f"Migração {migracao.versao} aplicada: {migracao.descricao}")
+    finally:
+        sqlite.isolation_level = isolamento
+        conexao.close()
+    return aplicadas
+
+def verificar_schema(engine):
+    """
+    Verificação da inicialização: só lê PRAGMA user_version
+    Banco desatualizado é migrado (ou a API não sobe, com MIGRAR_NA_INICIALIZACAO=0)
+    """
+    with engine.connect() as conn:
+        versao = conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+    if versao == VERSAO_ATUAL:
+        return
+    if versao > VERSAO_ATUAL:
+        raise RuntimeError(
+            f"Banco na versão {versao}, mais nova que a deste código ({VERSAO_ATUAL})"
+        )
+    if not MIGRAR_NA_INICIALIZACAO:
+        raise RuntimeError(
+            f"Schema na versão {versao}, esperado {VERSAO_ATUAL}. Execute: python migracoes.py"
+        )
+    aplicar_migracoes(engine)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from database import engine
+
+    print("🔄 MIGRAÇÕES DO BANCO DE DADOS")
+    print("=" * 50)
+
+    with engine.connect() as conn:
+        versao = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    print(f"Versão do banco: {versao} | Versão do código: {VERSAO_ATUAL}")
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--status":
+        for migracao in MIGRACOES:
+            marca = "✅" if migracao.versao <= versao else "⏳"
+            print(f"   {marca} {migracao.versao}: {migracao.descricao}")
+        sys.exit(0)
+
+    aplicadas = aplicar_migracoes(engine)
+    if aplicadas:
+        print(f"\n✅ Migrações aplicadas: {', '.join(map(str, aplicadas))}")
+    else:
+        print("\n✅ Banco já está atualizado")
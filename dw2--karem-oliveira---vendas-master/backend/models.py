@@ -1,16 +1,22 @@
 """
 Modelos SQLAlchemy para o banco de dados
 Entidades: Produto, Pedido, ItemPedido e User
+Agregados de vendas por dia (relatórios): VendaDiaria, VendaProdutoDia, VendaCategoriaDia e UsoCupomDia
+Respostas gravadas do checkout idempotente: ChaveIdempotencia
+Reservas temporárias de estoque dos carrinhos: ReservaEstoque
+Carrinhos salvos no servidor: Carrinho
+Regras de desconto dos cupons: Cupom
 """
 
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 from decimal import Decimal
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, validator, EmailStr
-from datetime import datetime
+from datetime import datetime, timezone
+from imagens import urls_variantes
 
 # ========== MODELOS SQLALCHEMY ==========
 
@@ -18,36 +24,51 @@ class Produto(Base):
     """Modelo de Produto para o banco de dados"""
     __tablename__ = "produtos"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     nome = Column(String(60), nullable=False, index=True)
     descricao = Column(Text, nullable=True)
     preco = Column(Numeric(10, 2), nullable=False)
     estoque = Column(Integer, nullable=False, default=0)
-    categoria = Column(String(50), nullable=False, index=True)
+    reservado = Column(Integer, nullable=False, default=0, server_default="0")  # soma das reservas (ReservaEstoque)
+    categoria = Column(String(50), nullable=False)
     sku = Column(String(50), nullable=True, unique=True)
     imagem_filename = Column(String(255), nullable=True)
     criado_em = Column(DateTime(timezone=True), server_default=func.now())
     atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Índices no formato das listagens (o SQLite acrescenta o id, usado como
+    # desempate do keyset). categoria + nome também cobre o DISTINCT de /categorias
+    __table_args__ = (
+        Index("ix_produtos_preco", "preco"),
+        Index("ix_produtos_categoria_nome", "categoria", "nome"),
+        Index("ix_produtos_categoria_preco", "categoria", "preco"),
+    )
 
 class Pedido(Base):
     """Modelo de Pedido para histórico de compras"""
     __tablename__ = "pedidos"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     total_bruto = Column(Numeric(10, 2), nullable=False)
     desconto = Column(Numeric(10, 2), nullable=False, default=0)
     total_final = Column(Numeric(10, 2), nullable=False)
     cupom_usado = Column(String(20), nullable=True)
     data = Column(DateTime(timezone=True), server_default=func.now())
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL: compra de visitante
     
     # Relacionamento com itens do pedido
     itens = relationship("ItemPedido", back_populates="pedido")
+    
+    # Histórico do usuário em ordem de data sem ordenação temporária
+    __table_args__ = (
+        Index("ix_pedidos_user_data", "user_id", "data"),
+    )
 
 class ItemPedido(Base):
     """Modelo de Item do Pedido (produto + quantidade)"""
     __tablename__ = "itens_pedido"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     pedido_id = Column(Integer, ForeignKey("pedidos.id"), nullable=False)
     produto_id = Column(Integer, ForeignKey("produtos.id"), nullable=False)
     nome_produto = Column(String(60), nullable=False)  # Nome no momento da compra
@@ -58,12 +79,19 @@ class ItemPedido(Base):
     # Relacionamentos
     pedido = relationship("Pedido", back_populates="itens")
     produto = relationship("Produto")
+    
+    # pedido_id: carregamento de Pedido.itens; produto_id + quantidade cobre
+    # as somas de unidades vendidas sem ler a linha
+    __table_args__ = (
+        Index("ix_itens_pedido_pedido_id", "pedido_id"),
+        Index("ix_itens_pedido_produto_quantidade", "produto_id", "quantidade"),
+    )
 
 class User(Base):
     """Modelo de Usuário para autenticação e perfil"""
     __tablename__ = "users"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     senha_hash = Column(String(255), nullable=False)
     nome = Column(String(100), nullable=False)
@@ -74,6 +102,123 @@ class User(Base):
     criado_em = Column(DateTime(timezone=True), server_default=func.now())
     atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+# ========== AGREGADOS DE VENDAS ==========
+# Atualizados na mesma transação do checkout; recalculáveis com
+# python relatorios.py --backfill
+
+class VendaDiaria(Base):
+    """Totais de vendas por dia"""
+    __tablename__ = "vendas_diarias"
+    
+    dia = Column(Date, primary_key=True)
+    pedidos = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+    receita_bruta = Column(Numeric(12, 2), nullable=False, default=0)
+    descontos = Column(Numeric(12, 2), nullable=False, default=0)
+    receita = Column(Numeric(12, 2), nullable=False, default=0)
+
+class VendaProdutoDia(Base):
+    """Unidades e receita bruta por produto e dia (mais vendidos)"""
+    __tablename__ = "vendas_produto_dia"
+    
+    dia = Column(Date, primary_key=True)
+    produto_id = Column(Integer, primary_key=True)
+    nome_produto = Column(String(60), nullable=False)
+    unidades = Column(Integer, nullable=False, default=0)
+    receita_bruta = Column(Numeric(12, 2), nullable=False, default=0)
+
+class VendaCategoriaDia(Base):
+    """Unidades e receita bruta por categoria e dia"""
+    __tablename__ = "vendas_categoria_dia"
+    
+    dia = Column(Date, primary_key=True)
+    categoria = Column(String(50), primary_key=True)
+    unidades = Column(Integer, nullable=False, default=0)
+    receita_bruta = Column(Numeric(12, 2), nullable=False, default=0)
+
+class UsoCupomDia(Base):
+    """Pedidos com cupom e desconto concedido por cupom e dia"""
+    __tablename__ = "uso_cupom_dia"
+    
+    dia = Column(Date, primary_key=True)
+    cupom = Column(String(20), primary_key=True)
+    pedidos = Column(Integer, nullable=False, default=0)
+    descontos = Column(Numeric(12, 2), nullable=False, default=0)
+
+# ========== IDEMPOTÊNCIA ==========
+
+class ChaveIdempotencia(Base):
+    """Resposta gravada de um checkout com Idempotency-Key"""
+    __tablename__ = "chaves_idempotencia"
+    
+    escopo = Column(Integer, primary_key=True)  # user_id, ou 0 para visitantes
+    chave = Column(String(255), primary_key=True)
+    impressao = Column(String(64), nullable=False)  # sha256 do corpo da requisição
+    status_code = Column(Integer, nullable=False)
+    resposta = Column(Text, nullable=False)  # JSON pronto para reenviar
+    expira_em = Column(Integer, nullable=False)  # epoch em segundos
+    
+    __table_args__ = (
+        Index("ix_chaves_idempotencia_expira_em", "expira_em"),
+        {"sqlite_with_rowid": False},
+    )
+
+# ========== RESERVAS DE ESTOQUE ==========
+
+class ReservaEstoque(Base):
+    """Quantidade de um produto segurada por um carrinho até expira_em"""
+    __tablename__ = "reservas_estoque"
+    
+    id = Column(Integer, primary_key=True)
+    dono = Column(String(80), nullable=False)  # "u:<user_id>" ou "s:<sessão do carrinho>"
+    produto_id = Column(Integer, ForeignKey("produtos.id"), nullable=False)
+    quantidade = Column(Integer, nullable=False)
+    expira_em = Column(Integer, nullable=False)  # epoch em segundos
+    
+    # Uma reserva por produto em cada carrinho; a varredura percorre por expira_em
+    __table_args__ = (
+        Index("ux_reservas_estoque_dono_produto", "dono", "produto_id", unique=True),
+        Index("ix_reservas_estoque_expira_em", "expira_em"),
+    )
+
+# ========== CARRINHOS ==========
+
+class Carrinho(Base):
+    """Carrinho salvo no servidor: itens compactados e total corrente"""
+    __tablename__ = "carrinhos"
+    
+    dono = Column(String(80), primary_key=True)  # "u:<user_id>" ou "s:<sessão do carrinho>"
+    itens = Column(Text, nullable=False)  # JSON: [[produto_id, quantidade, preço em centavos, categoria, nome], ...]
+    cupom = Column(String(20), nullable=True)
+    total_centavos = Column(Integer, nullable=False)  # total bruto, atualizado a cada operação
+    expira_em = Column(Integer, nullable=False)  # epoch em segundos
+    versao = Column(Integer, nullable=False)  # gravação condicionada à versão lida
+    
+    __table_args__ = (
+        Index("ix_carrinhos_expira_em", "expira_em"),
+        {"sqlite_with_rowid": False},
+    )
+
+# ========== CUPONS ==========
+
+class Cupom(Base):
+    """Regra de desconto aplicada pelo código do cupom (compilada em memória por precos.py)"""
+    __tablename__ = "cupons"
+    
+    id = Column(Integer, primary_key=True)
+    codigo = Column(String(20), nullable=False, unique=True)  # em maiúsculas
+    tipo = Column(String(10), nullable=False)  # "percentual" (valor em %) ou "fixo" (valor em R$)
+    valor = Column(Numeric(10, 2), nullable=False)
+    categoria = Column(String(50), nullable=True)  # desconto só sobre os itens da categoria
+    minimo = Column(Numeric(10, 2), nullable=True)  # total bruto mínimo do carrinho
+    valido_de = Column(DateTime, nullable=True)  # UTC
+    valido_ate = Column(DateTime, nullable=True)  # UTC, exclusivo
+    limite_usos = Column(Integer, nullable=True)
+    usos = Column(Integer, nullable=False, default=0, server_default="0")  # incrementado no checkout
+    ativo = Column(Boolean, nullable=False, default=True, server_default="1")
+    versao = Column(Integer, nullable=False, default=1, server_default="1")  # muda a cada edição: recarga das regras
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # ========== SCHEMAS PYDANTIC ==========
 
 class ProdutoBase(BaseModel):
@@ -123,6 +268,12 @@ class ProdutoResponse(ProdutoBase):
     id: int
     criado_em: datetime
     atualizado_em: datetime
+    # URLs das variantes redimensionadas: formato -> largura -> URL
+    imagens: Optional[Dict[str, Dict[int, str]]] = None
+    
+    @validator('imagens', always=True)
+    def preencher_imagens(cls, v, values):
+        return v or urls_variantes(values.get('imagem_filename'))
     
     class Config:
         orm_mode = True
@@ -149,6 +300,161 @@ class CarrinhoConfirmar(BaseModel):
             raise ValueError('Carrinho não pode estar vazio')
         return v
 
+class OperacaoCarrinho(BaseModel):
+    """Schema de uma alteração no carrinho salvo: adicionar, remover ou definir a quantidade"""
+    op: str
+    produto_id: int
+    quantidade: int
+
+    @validator('op')
+    def validar_op(cls, v):
+        if v not in ('adicionar', 'remover', 'definir'):
+            raise ValueError("Operação deve ser 'adicionar', 'remover' ou 'definir'")
+        return v
+
+    @validator('quantidade')
+    def validar_quantidade(cls, v, values):
+        if v < 0 or (v == 0 and values.get('op') != 'definir'):
+            raise ValueError('Quantidade deve ser maior que zero (ou 0 ao definir, para tirar o produto)')
+        return v
+
+class CarrinhoOperacoes(BaseModel):
+    """Schema para aplicar alterações ao carrinho salvo, na ordem"""
+    operacoes: List[OperacaoCarrinho]
+
+    @validator('operacoes')
+    def validar_operacoes(cls, v):
+        if not v:
+            raise ValueError('Informe ao menos uma operação')
+        return v
+
+class CarrinhoCupom(BaseModel):
+    """Schema para aplicar (ou remover, com null) o cupom do carrinho salvo"""
+    cupom: Optional[str] = None
+
+class ItemCarrinhoResponse(BaseModel):
+    """Schema de item do carrinho salvo"""
+    produto_id: int
+    nome: str
+    preco_unitario: Decimal
+    quantidade: int
+    subtotal: Decimal
+
+class CarrinhoResponse(BaseModel):
+    """Schema do carrinho salvo com o total corrente"""
+    itens: List[ItemCarrinhoResponse]
+    cupom: Optional[str]
+    total_bruto: Decimal
+    desconto: Decimal
+    total_final: Decimal
+    expira_em: Optional[datetime]
+
+class ReservaAjuste(BaseModel):
+    """Schema para reservar (ou soltar, com 0) a quantidade de um produto no carrinho"""
+    quantidade: int
+
+    @validator('quantidade')
+    def validar_quantidade(cls, v):
+        if v < 0:
+            raise ValueError('Quantidade não pode ser negativa')
+        return v
+
+class ReservaResponse(BaseModel):
+    """Schema de reserva de estoque do carrinho"""
+    produto_id: int
+    nome: str
+    quantidade: int
+    expira_em: datetime
+    disponivel: int  # livre para outros carrinhos
+
+class DisponibilidadeResponse(BaseModel):
+    """Schema de estoque disponível (estoque menos as reservas dos carrinhos)"""
+    produto_id: int
+    estoque: int
+    reservado: int
+    disponivel: int
+
+class CupomBase(BaseModel):
+    """Schema base de Cupom"""
+    codigo: str
+    tipo: str
+    valor: Decimal
+    categoria: Optional[str] = None
+    minimo: Optional[Decimal] = None
+    valido_de: Optional[datetime] = None
+    valido_ate: Optional[datetime] = None
+    limite_usos: Optional[int] = None
+    ativo: bool = True
+    
+    @validator('codigo')
+    def validar_codigo(cls, v):
+        v = v.strip().upper()
+        if not 3 <= len(v) <= 20 or not all(c.isalnum() or c in '-_' for c in v):
+            raise ValueError("Código deve ter de 3 a 20 letras, números, '-' ou '_'")
+        return v
+    
+    @validator('tipo')
+    def validar_tipo(cls, v):
+        if v not in ('percentual', 'fixo'):
+            raise ValueError("Tipo deve ser 'percentual' ou 'fixo'")
+        return v
+    
+    @validator('valor')
+    def validar_valor(cls, v, values):
+        if v < Decimal('0.01'):
+            raise ValueError('Valor deve ser maior que zero')
+        if values.get('tipo') == 'percentual' and v > 100:
+            raise ValueError('Percentual não pode passar de 100')
+        return round(v, 2)
+    
+    @validator('categoria')
+    def validar_categoria(cls, v):
+        if v is None or not v.strip():
+            return None  # vale para o carrinho todo
+        return v.strip()
+    
+    @validator('minimo')
+    def validar_minimo(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('Valor mínimo não pode ser negativo')
+        return round(v, 2) if v is not None else None
+    
+    @validator('valido_de', 'valido_ate')
+    def validar_utc(cls, v):
+        # Gravado sem fuso, em UTC
+        if v is not None and v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+    
+    @validator('valido_ate')
+    def validar_janela(cls, v, values):
+        if v is not None and values.get('valido_de') is not None and v <= values['valido_de']:
+            raise ValueError('Fim da validade deve ser depois do início')
+        return v
+    
+    @validator('limite_usos')
+    def validar_limite(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('Limite de usos deve ser maior que zero')
+        return v
+
+class CupomCreate(CupomBase):
+    """Schema para criação de Cupom"""
+    pass
+
+class CupomUpdate(CupomBase):
+    """Schema para atualização de Cupom"""
+    pass
+
+class CupomResponse(CupomBase):
+    """Schema para resposta de Cupom"""
+    id: int
+    usos: int
+    atualizado_em: datetime
+    
+    class Config:
+        orm_mode = True
+
 class PedidoResponse(BaseModel):
     """Schema para resposta do pedido confirmado"""
     id: int
@@ -162,6 +468,30 @@ class PedidoResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class ItemPedidoResponse(BaseModel):
+    """Schema de item no histórico de pedidos"""
+    produto_id: int
+    nome_produto: str
+    preco_unitario: Decimal
+    quantidade: int
+    subtotal: Decimal
+    
+    class Config:
+        orm_mode = True
+
+class PedidoHistoricoResponse(BaseModel):
+    """Schema de pedido no histórico do usuário"""
+    id: int
+    total_bruto: Decimal
+    desconto: Decimal
+    total_final: Decimal
+    cupom_usado: Optional[str]
+    data: datetime
+    itens: List[ItemPedidoResponse]
+    
+    class Config:
+        orm_mode = True
+
 # ========== SCHEMAS DE AUTENTICAÇÃO ==========
 
 class UserBase(BaseModel):
@@ -215,6 +545,12 @@ class UserResponse(UserBase):
     class Config:
         orm_mode = True
 
+class Principal(BaseModel):
+    """Schema do usuário autenticado montado a partir dos claims do token"""
+    user_id: int
+    email: Optional[str] = None
+    is_admin: bool = False
+
 class Token(BaseModel):
     """Schema para resposta do token JWT"""
     access_token: str
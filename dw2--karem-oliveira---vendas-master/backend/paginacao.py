@@ -0,0 +1,184 @@
+"""
+Paginação por cursor (keyset) para listagens de produtos e histórico de pedidos
+Cursores opacos sobre (nome, id), (preco, id) e (data, id) dos pedidos
+"""
+
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Any, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, asc, desc, select, String, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from models import Produto, Pedido
+from busca import RANK, indice_disponivel, montar_expressao_busca, filtrar_busca
+from serializacao import COLUNAS_CATALOGO
+
+# Tamanho de página padrão e máximo aceito no parâmetro limit
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 500
+
+# Histórico de pedidos do usuário
+LIMITE_PEDIDOS_PADRAO = 20
+LIMITE_PEDIDOS_MAXIMO = 100
+
+# Tamanho do lote usado no modo streaming (NDJSON)
+LOTE_STREAMING = 500
+
+# Colunas aceitas para ordenação
+COLUNAS_ORDENACAO = {
+    "nome": Produto.nome,
+    "preco": Produto.preco,
+    "relevancia": RANK,  # Só válida em buscas pelo índice FTS
+}
+
+# ========== CURSORES ==========
+
+def normalizar_ordenacao(sort: Optional[str], order: Optional[str]) -> Tuple[str, str]:
+    """Normaliza sort/order para valores conhecidos (padrão: nome asc)"""
+    sort = sort if sort in COLUNAS_ORDENACAO and sort != "relevancia" else "nome"
+    order = "desc" if order == "desc" else "asc"
+    return sort, order
+
+def codificar_cursor(sort: str, order: str, valor: Any, produto_id: int) -> str:
+    """Gera cursor opaco a partir da chave do último produto da página"""
+    if isinstance(valor, Decimal):
+        valor = str(valor)
+    payload = json.dumps([sort, order, valor, produto_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """Decodifica cursor e valida se pertence à mesma ordenação"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(cursor + padding).decode("utf-8"))
+        cursor_sort, cursor_order, valor, produto_id = payload
+        if cursor_sort != sort or cursor_order != order or not isinstance(produto_id, int):
+            raise ValueError("Cursor de outra ordenação")
+        if sort == "preco":
+            valor = Decimal(valor)
+        elif sort == "relevancia":
+            valor = float(valor)
+        elif not isinstance(valor, str):
+            raise ValueError("Cursor com valor inválido")
+        return valor, produto_id
+    except (ValueError, TypeError, InvalidOperation, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+# ========== CONSULTAS ==========
+
+def aplicar_ordenacao(stmt, sort: str, order: str):
+    """Ordena pela coluna escolhida com id como desempate (ordem total)"""
+    coluna = COLUNAS_ORDENACAO[sort]
+    direcao = desc if order == "desc" else asc
+    return stmt.order_by(direcao(coluna), direcao(Produto.id))
+
+def aplicar_cursor(stmt, sort: str, order: str, valor: Any, produto_id: int):
+    """Filtra apenas produtos posteriores à chave (valor, id) do cursor"""
+    coluna = COLUNAS_ORDENACAO[sort]
+    if order == "desc":
+        condicao = or_(coluna < valor, and_(coluna == valor, Produto.id < produto_id))
+    else:
+        condicao = or_(coluna > valor, and_(coluna == valor, Produto.id > produto_id))
+    return stmt.where(condicao)
+
+def consulta_catalogo(search: Optional[str], categoria: Optional[str], sort: Optional[str], order: Optional[str]):
+    """
+    Consulta de GET /produtos com busca e filtro de categoria
+    Retorna (stmt, sort, order) normalizados; relevância (bm25) é o padrão
+    das buscas pelo índice FTS, nome nas demais
+    """
+    stmt = select(*COLUNAS_CATALOGO)
+
+    # Busca por nome, descrição ou categoria: índice FTS ou LIKE se não houver índice
+    expressao_busca = montar_expressao_busca(search) if search and indice_disponivel() else None
+    if expressao_busca is not None:
+        stmt = filtrar_busca(stmt, expressao_busca)
+    elif search:
+        termo = f"%{search.lower()}%"
+        stmt = stmt.where(or_(Produto.nome.ilike(termo), Produto.descricao.ilike(termo)))
+
+    if categoria:
+        stmt = stmt.where(Produto.categoria == categoria)
+
+    if expressao_busca is not None and sort in (None, "relevancia"):
+        return stmt, "relevancia", "desc" if order == "desc" else "asc"
+    sort, order = normalizar_ordenacao(sort, order)
+    return stmt, sort, order
+
+def consulta_pagina(stmt, sort: str, order: str, limit: int, cursor: Optional[str] = None):
+    """Página keyset de stmt: após o cursor, ordenada e com limit + 1 linhas"""
+    if cursor:
+        valor, produto_id = decodificar_cursor(cursor, sort, order)
+        stmt = aplicar_cursor(stmt, sort, order, valor, produto_id)
+
+    # Relevância não é coluna do produto: vem como coluna extra da linha
+    if sort == "relevancia":
+        stmt = stmt.add_columns(RANK.label("relevancia"))
+
+    return aplicar_ordenacao(stmt, sort, order).limit(limit + 1)
+
+async def buscar_pagina(db: AsyncSession, stmt, sort: str, order: str, limit: int, cursor: Optional[str] = None):
+    """
+    Retorna (linhas, proximo_cursor) de uma página keyset
+    stmt seleciona colunas de Produto (incluindo id e a coluna de ordenação)
+    Busca limit + 1 linhas para saber se existe próxima página sem COUNT
+    """
+    resultado = await db.execute(consulta_pagina(stmt, sort, order, limit, cursor))
+    linhas = resultado.all()
+
+    proximo_cursor = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        ultimo = linhas[-1]
+        proximo_cursor = codificar_cursor(sort, order, getattr(ultimo, sort), ultimo.id)
+
+    return linhas, proximo_cursor
+
+async def iterar_lotes(db: AsyncSession, stmt, sort: str, order: str, cursor: Optional[str] = None, lote: int = LOTE_STREAMING):
+    """Percorre todo o resultado em lotes keyset (memória constante por lote)"""
+    while True:
+        linhas, cursor = await buscar_pagina(db, stmt, sort, order, lote, cursor)
+        if linhas:
+            yield linhas
+        if not cursor:
+            break
+
+# ========== HISTÓRICO DE PEDIDOS ==========
+
+# pedidos.data como o texto gravado pelo SQLite (CURRENT_TIMESTAMP): o cursor
+# compara texto com texto; um datetime seria reformatado com microssegundos
+# e deixaria de casar na igualdade do desempate
+DATA_PEDIDO = type_coerce(Pedido.data, String).label("data_texto")
+
+def consulta_pedidos(user_id: int, limit: int, data: Optional[str] = None, pedido_id: Optional[int] = None):
+    """Pedidos do usuário após a chave (data, id), mais recentes primeiro (ix_pedidos_user_data)"""
+    stmt = (
+        select(Pedido, DATA_PEDIDO)
+        .where(Pedido.user_id == user_id)
+        .order_by(desc(Pedido.data), desc(Pedido.id))
+        .limit(limit)
+    )
+    if data is not None:
+        data = type_coerce(data, String)
+        stmt = stmt.where(or_(Pedido.data < data, and_(Pedido.data == data, Pedido.id < pedido_id)))
+    return stmt
+
+async def buscar_pagina_pedidos(db: AsyncSession, user_id: int, limit: int, cursor: Optional[str] = None):
+    """
+    Retorna (pedidos com itens, proximo_cursor)
+    Duas consultas por página, qualquer que seja o limit: a dos pedidos
+    e a dos itens de todos eles (selectinload)
+    """
+    data, pedido_id = decodificar_cursor(cursor, "data", "desc") if cursor else (None, None)
+    stmt = consulta_pedidos(user_id, limit + 1, data, pedido_id).options(selectinload(Pedido.itens))
+    linhas = (await db.execute(stmt)).all()
+
+    proximo_cursor = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        pedido, data = linhas[-1]
+        proximo_cursor = codificar_cursor("data", "desc", data, pedido.id)
+
+    return [linha[0] for linha in linhas], proximo_cursor
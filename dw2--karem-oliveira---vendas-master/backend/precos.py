@@ -0,0 +1,128 @@
+"""
+Preços do checkout: subtotais, total bruto, desconto do cupom e total final
+Funções puras (sem banco), chamadas por confirmar_carrinho com os preços já carregados
+
+As regras dos cupons vêm da tabela cupons (cupons.py) e ficam compiladas num
+dicionário código -> RegraCupom: aplicar um cupom é uma busca no dicionário e
+uma comparação por item, qualquer que seja o número de cupons cadastrados
+"""
+
+import calendar
+import math
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+ZERO = Decimal("0.00")
+CENTAVO = Decimal("0.01")
+
+# Tipos de desconto de um cupom
+TIPO_PERCENTUAL = "percentual"  # valor em % sobre a base (10 = 10%)
+TIPO_FIXO = "fixo"  # valor em R$, limitado à base
+
+class RegraCupom(NamedTuple):
+    """Cupom ativo já convertido para a avaliação (percentual como fração, janela em epoch)"""
+    codigo: str
+    percentual: Optional[Decimal]
+    fixo: Optional[Decimal]
+    categoria: Optional[str]  # desconto só sobre os itens da categoria; None: carrinho todo
+    minimo: Decimal  # total bruto mínimo do carrinho
+    inicio: float
+    fim: float
+
+class Precificacao(NamedTuple):
+    subtotais: List[Decimal]
+    total_bruto: Decimal
+    desconto: Decimal
+    total_final: Decimal
+    cupom_usado: Optional[str]
+
+# ========== REGRAS COMPILADAS ==========
+
+# Trocado inteiro a cada recarga (uma atribuição: quem já leu continua com o antigo)
+_regras: Dict[str, RegraCupom] = {}
+
+def _epoch(momento: Optional[datetime], padrao: float) -> float:
+    """Datetime UTC sem fuso (como gravado no SQLite) em segundos"""
+    return calendar.timegm(momento.timetuple()) if momento else padrao
+
+def compilar_regras(linhas: Iterable) -> Dict[str, RegraCupom]:
+    """
+    Linhas da tabela cupons -> dicionário por código
+    Inativos e esgotados ficam de fora; a janela de validade é conferida na avaliação
+    """
+    regras = {}
+    for linha in linhas:
+        if not linha.ativo or (linha.limite_usos is not None and linha.usos >= linha.limite_usos):
+            continue
+        valor = Decimal(linha.valor)
+        regras[linha.codigo] = RegraCupom(
+            codigo=linha.codigo,
+            percentual=valor / 100 if linha.tipo == TIPO_PERCENTUAL else None,
+            fixo=valor if linha.tipo == TIPO_FIXO else None,
+            categoria=linha.categoria,
+            minimo=Decimal(linha.minimo or 0),
+            inicio=_epoch(linha.valido_de, -math.inf),
+            fim=_epoch(linha.valido_ate, math.inf),
+        )
+    return regras
+
+def instalar_regras(regras: Dict[str, RegraCupom]):
+    global _regras
+    _regras = regras
+
+def retirar_regra(codigo: str):
+    """Cupom esgotado no checkout: sai da busca até a próxima recarga"""
+    instalar_regras({chave: regra for chave, regra in _regras.items() if chave != codigo})
+
+def buscar_regra(cupom: Optional[str], momento: Optional[float] = None) -> Optional[RegraCupom]:
+    """Regra do cupom em vigor agora, ou None (desconhecido, inativo ou fora da validade)"""
+    if not cupom:
+        return None
+    regra = _regras.get(cupom.strip().upper())
+    if regra is None:
+        return None
+    momento = time.time() if momento is None else momento
+    return regra if regra.inicio <= momento < regra.fim else None
+
+def cupom_valido(cupom: Optional[str]) -> Optional[str]:
+    """Código do cupom como é gravado no pedido, ou None se o cupom não vale agora"""
+    regra = buscar_regra(cupom)
+    return regra.codigo if regra else None
+
+# ========== CÁLCULO ==========
+
+def calcular_desconto(
+    total_bruto: Decimal, regra: Optional[RegraCupom], base: Optional[Decimal] = None
+) -> Tuple[Decimal, Optional[str]]:
+    """
+    (desconto, cupom_usado); sem regra, abaixo do mínimo ou sem itens da categoria não há desconto
+    base: subtotal dos itens da categoria da regra (regras sem categoria usam o total bruto)
+    """
+    if regra is None or total_bruto < regra.minimo:
+        return ZERO, None
+    if regra.categoria is None or base is None:
+        base = total_bruto
+    if base <= 0:
+        return ZERO, None
+    if regra.percentual is not None:
+        desconto = (base * regra.percentual).quantize(CENTAVO, ROUND_HALF_UP)
+    else:
+        desconto = min(regra.fixo, base)
+    return desconto, regra.codigo
+
+def precificar(itens: Iterable[Tuple[Decimal, int, str]], cupom: Optional[str] = None) -> Precificacao:
+    """Itens como (preço unitário, quantidade, categoria), na ordem do carrinho"""
+    regra = buscar_regra(cupom)
+    categoria_regra = regra.categoria if regra else None
+    subtotais = []
+    total_bruto = base = ZERO
+    for preco, quantidade, categoria in itens:
+        subtotal = preco * quantidade
+        subtotais.append(subtotal)
+        total_bruto += subtotal
+        if categoria == categoria_regra:
+            base += subtotal
+    desconto, cupom_usado = calcular_desconto(total_bruto, regra, base)
+    return Precificacao(subtotais, total_bruto, desconto, total_bruto - desconto, cupom_usado)
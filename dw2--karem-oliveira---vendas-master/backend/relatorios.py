@@ -0,0 +1,244 @@
+"""
+Relatórios de vendas servidos por agregados diários
+Agregados atualizados de forma incremental no checkout (registrar_venda);
+as consultas leem só os dias do intervalo, não o histórico de pedidos
+
+Reconstruir os agregados a partir do histórico: python relatorios.py --backfill
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, desc, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import VendaDiaria, VendaProdutoDia, VendaCategoriaDia, UsoCupomDia
+
+logger = logging.getLogger(__name__)
+
+# Intervalo padrão e máximo dos relatórios (dias)
+RELATORIO_DIAS_PADRAO = 30
+RELATORIO_MAX_DIAS = int(os.getenv("RELATORIO_MAX_DIAS", "366"))
+
+# ========== ATUALIZAÇÃO INCREMENTAL ==========
+
+def _upsert_somando(modelo, chaves: List[str], somar: List[str], substituir: Tuple[str, ...] = ()):
+    """INSERT ... ON CONFLICT DO UPDATE que soma os contadores à linha existente"""
+    tabela = modelo.__table__
+    stmt = sqlite_insert(tabela)
+    valores = {coluna: tabela.c[coluna] + stmt.excluded[coluna] for coluna in somar}
+    valores.update({coluna: stmt.excluded[coluna] for coluna in substituir})
+    return stmt.on_conflict_do_update(index_elements=chaves, set_=valores)
+
+SOMAR_VENDA_DIARIA = _upsert_somando(
+    VendaDiaria, ["dia"], ["pedidos", "unidades", "receita_bruta", "descontos", "receita"]
+)
+SOMAR_VENDA_PRODUTO = _upsert_somando(
+    VendaProdutoDia, ["dia", "produto_id"], ["unidades", "receita_bruta"], substituir=("nome_produto",)
+)
+SOMAR_VENDA_CATEGORIA = _upsert_somando(
+    VendaCategoriaDia, ["dia", "categoria"], ["unidades", "receita_bruta"]
+)
+SOMAR_USO_CUPOM = _upsert_somando(UsoCupomDia, ["dia", "cupom"], ["pedidos", "descontos"])
+
+def dia_atual() -> date:
+    """Dia em UTC, o mesmo de CURRENT_TIMESTAMP usado em pedidos.data"""
+    return datetime.utcnow().date()
+
+async def registrar_venda(
+    db: AsyncSession,
+    itens: Iterable[Dict[str, Any]],
+    total_bruto: Decimal,
+    desconto: Decimal,
+    total_final: Decimal,
+    cupom: Optional[str],
+    dia: Optional[date] = None
+):
+    """
+    Soma um pedido aos agregados (na transação do checkout, antes do commit)
+    itens: produto_id, nome, categoria, quantidade, subtotal
+    """
+    dia = dia or dia_atual()
+    itens = list(itens)
+
+    por_categoria: Dict[str, Dict[str, Any]] = {}
+    for item in itens:
+        soma = por_categoria.setdefault(item["categoria"], {"unidades": 0, "receita_bruta": Decimal("0")})
+        soma["unidades"] += item["quantidade"]
+        soma["receita_bruta"] += item["subtotal"]
+
+    await db.execute(SOMAR_VENDA_DIARIA, {
+        "dia": dia,
+        "pedidos": 1,
+        "unidades": sum(item["quantidade"] for item in itens),
+        "receita_bruta": total_bruto,
+        "descontos": desconto,
+        "receita": total_final,
+    })
+    await db.execute(SOMAR_VENDA_PRODUTO, [
+        {
+            "dia": dia,
+            "produto_id": item["produto_id"],
+            "nome_produto": item["nome"],
+            "unidades": item["quantidade"],
+            "receita_bruta": item["subtotal"],
+        }
+        for item in itens
+    ])
+    await db.execute(SOMAR_VENDA_CATEGORIA, [
+        {"dia": dia, "categoria": categoria, **soma} for categoria, soma in por_categoria.items()
+    ])
+    if cupom:
+        await db.execute(SOMAR_USO_CUPOM, {"dia": dia, "cupom": cupom, "pedidos": 1, "descontos": desconto})
+
+# ========== RECONSTRUÇÃO (BACKFILL) ==========
+
+# Recalcula tudo a partir de pedidos/itens_pedido (categoria atual do produto)
+SQL_BACKFILL = [
+    "DELETE FROM vendas_diarias",
+    "DELETE FROM vendas_produto_dia",
+    "DELETE FROM vendas_categoria_dia",
+    "DELETE FROM uso_cupom_dia",
+    """
+    INSERT INTO vendas_diarias (dia, pedidos, unidades, receita_bruta, descontos, receita)
+    SELECT date(p.data), COUNT(*), COALESCE(SUM(u.unidades), 0),
+           SUM(p.total_bruto), SUM(p.desconto), SUM(p.total_final)
+    FROM pedidos p
+    LEFT JOIN (
+        SELECT pedido_id, SUM(quantidade) AS unidades FROM itens_pedido GROUP BY pedido_id
+    ) u ON u.pedido_id = p.id
+    GROUP BY date(p.data)
+    """,
+    """
+    INSERT INTO vendas_produto_dia (dia, produto_id, nome_produto, unidades, receita_bruta)
+    SELECT date(p.data), i.produto_id, MAX(i.nome_produto), SUM(i.quantidade), SUM(i.subtotal)
+    FROM itens_pedido i
+    JOIN pedidos p ON p.id = i.pedido_id
+    GROUP BY date(p.data), i.produto_id
+    """,
+    """
+    INSERT INTO vendas_categoria_dia (dia, categoria, unidades, receita_bruta)
+    SELECT date(p.data), COALESCE(pr.categoria, 'Sem categoria'), SUM(i.quantidade), SUM(i.subtotal)
+    FROM itens_pedido i
+    JOIN pedidos p ON p.id = i.pedido_id
+    LEFT JOIN produtos pr ON pr.id = i.produto_id
+    GROUP BY date(p.data), COALESCE(pr.categoria, 'Sem categoria')
+    """,
+    """
+    INSERT INTO uso_cupom_dia (dia, cupom, pedidos, descontos)
+    SELECT date(data), cupom_usado, COUNT(*), SUM(desconto)
+    FROM pedidos
+    WHERE cupom_usado IS NOT NULL
+    GROUP BY date(data), cupom_usado
+    """,
+]
+
+def reconstruir_agregados(engine):
+    """Refaz todos os agregados em uma transação (leitores veem o antes ou o depois)"""
+    with engine.begin() as conn:
+        for sql in SQL_BACKFILL:
+            conn.execute(text(sql))
+    logger.info("Agregados de vendas reconstruídos")
+
+# ========== CONSULTAS ==========
+
+def intervalo(inicio: Optional[date], fim: Optional[date]) -> Tuple[date, date]:
+    """Intervalo inclusivo; padrão: últimos 30 dias"""
+    fim = fim or dia_atual()
+    inicio = inicio or fim - timedelta(days=RELATORIO_DIAS_PADRAO - 1)
+    if inicio > fim:
+        raise HTTPException(status_code=400, detail="Data inicial posterior à data final")
+    if (fim - inicio).days + 1 > RELATORIO_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"Intervalo máximo de {RELATORIO_MAX_DIAS} dias")
+    return inicio, fim
+
+def _valor(numero) -> float:
+    return round(float(numero or 0), 2)
+
+async def resumo_vendas(db: AsyncSession, inicio: date, fim: date) -> Dict[str, Any]:
+    """Receita, descontos, pedidos e unidades por dia e no total"""
+    result = await db.execute(
+        select(VendaDiaria).where(VendaDiaria.dia.between(inicio, fim)).order_by(VendaDiaria.dia)
+    )
+    dias = [
+        {
+            "dia": linha.dia,
+            "pedidos": linha.pedidos,
+            "unidades": linha.unidades,
+            "receita_bruta": _valor(linha.receita_bruta),
+            "descontos": _valor(linha.descontos),
+            "receita": _valor(linha.receita),
+        }
+        for linha in result.scalars()
+    ]
+    totais = {
+        campo: sum(dia[campo] for dia in dias)
+        for campo in ("pedidos", "unidades", "receita_bruta", "descontos", "receita")
+    }
+    for campo in ("receita_bruta", "descontos", "receita"):
+        totais[campo] = round(totais[campo], 2)
+    totais["ticket_medio"] = round(totais["receita"] / totais["pedidos"], 2) if totais["pedidos"] else 0.0
+    return {"inicio": inicio, "fim": fim, "totais": totais, "dias": dias}
+
+async def vendas_por_categoria(db: AsyncSession, inicio: date, fim: date) -> List[Dict[str, Any]]:
+    receita = func.sum(VendaCategoriaDia.receita_bruta)
+    result = await db.execute(
+        select(VendaCategoriaDia.categoria, func.sum(VendaCategoriaDia.unidades), receita)
+        .where(VendaCategoriaDia.dia.between(inicio, fim))
+        .group_by(VendaCategoriaDia.categoria)
+        .order_by(desc(receita))
+    )
+    return [
+        {"categoria": categoria, "unidades": unidades, "receita_bruta": _valor(total)}
+        for categoria, unidades, total in result
+    ]
+
+async def uso_cupons(db: AsyncSession, inicio: date, fim: date) -> List[Dict[str, Any]]:
+    result = await db.execute(
+        select(UsoCupomDia.cupom, func.sum(UsoCupomDia.pedidos), func.sum(UsoCupomDia.descontos))
+        .where(UsoCupomDia.dia.between(inicio, fim))
+        .group_by(UsoCupomDia.cupom)
+        .order_by(desc(func.sum(UsoCupomDia.pedidos)))
+    )
+    return [
+        {"cupom": cupom, "pedidos": pedidos, "descontos": _valor(descontos)}
+        for cupom, pedidos, descontos in result
+    ]
+
+async def mais_vendidos(
+    db: AsyncSession, inicio: date, fim: date, limite: int, por: str = "unidades"
+) -> List[Dict[str, Any]]:
+    unidades = func.sum(VendaProdutoDia.unidades)
+    receita = func.sum(VendaProdutoDia.receita_bruta)
+    result = await db.execute(
+        select(VendaProdutoDia.produto_id, func.max(VendaProdutoDia.nome_produto), unidades, receita)
+        .where(VendaProdutoDia.dia.between(inicio, fim))
+        .group_by(VendaProdutoDia.produto_id)
+        .order_by(desc(receita if por == "receita" else unidades), VendaProdutoDia.produto_id)
+        .limit(limite)
+    )
+    return [
+        {"produto_id": produto_id, "nome": nome, "unidades": total_unidades, "receita_bruta": _valor(total_receita)}
+        for produto_id, nome, total_unidades, total_receita in result
+    ]
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    from database import engine
+    from migracoes import verificar_schema
+
+    if len(sys.argv) < 2 or sys.argv[1] != "--backfill":
+        print("Uso: python relatorios.py --backfill")
+        sys.exit(1)
+
+    print("📊 RECONSTRUINDO AGREGADOS DE VENDAS")
+    print("=" * 50)
+    verificar_schema(engine)
+    reconstruir_agregados(engine)
+    print("✅ Agregados reconstruídos a partir do histórico de pedidos")
@@ -0,0 +1,387 @@
+"""
+Reservas temporárias de estoque dos carrinhos
+Colocar um produto no carrinho segura a quantidade por RESERVA_TTL_MINUTOS
+(o prazo é renovado a cada alteração do carrinho). A soma das reservas de cada
+produto fica em produtos.reservado, atualizada na mesma transação da reserva:
+disponível = estoque - reservado, lido pela chave primária, sem agregar.
+
+Reservas vencidas são devolvidas em lotes por uma tarefa de fundo; no checkout
+as reservas do carrinho viram venda sem disputar o estoque livre.
+Cada escrita confere o rowcount: a varredura, o checkout e o próprio carrinho
+nunca devolvem a mesma reserva duas vezes.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete, insert, case, literal, and_, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metricas import registrar_reserva
+from models import Produto, ReservaEstoque, Principal
+
+logger = logging.getLogger(__name__)
+
+# Prazo de uma reserva sem atividade no carrinho e intervalo/lote da varredura das vencidas
+RESERVA_TTL_MINUTOS = int(os.getenv("RESERVA_TTL_MINUTOS", "15"))
+RESERVA_VARREDURA_SEGUNDOS = int(os.getenv("RESERVA_VARREDURA_SEGUNDOS", "30"))
+RESERVA_LOTE_VARREDURA = int(os.getenv("RESERVA_LOTE_VARREDURA", "500"))
+DISPONIBILIDADE_MAX_IDS = 100
+
+# Carrinho de visitante: identificador gerado pelo cliente (ex.: uuid4)
+CABECALHO_SESSAO = "X-Sessao-Carrinho"
+_SESSAO_VALIDA = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+def agora() -> int:
+    return int(time.time())
+
+def dono_reserva(principal: Optional[Principal], sessao: Optional[str]) -> Optional[str]:
+    """Carrinho dono das reservas: o usuário logado ou a sessão do visitante"""
+    if principal:
+        return f"u:{principal.user_id}"
+    if sessao is None:
+        return None
+    if not _SESSAO_VALIDA.match(sessao):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{CABECALHO_SESSAO} deve ter de 16 a 64 letras, números, '-' ou '_'"
+        )
+    return f"s:{sessao}"
+
+def exigir_dono(principal: Optional[Principal], sessao: Optional[str]) -> str:
+    dono = dono_reserva(principal, sessao)
+    if dono is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Informe o token de acesso ou o cabeçalho {CABECALHO_SESSAO}"
+        )
+    return dono
+
+def _conflito():
+    return HTTPException(
+        status_code=409,
+        detail="Reserva alterada por outra requisição. Tente novamente."
+    )
+
+# ========== RESERVAS DO CARRINHO ==========
+
+# Executados com uma lista de parâmetros (executemany), um por reserva
+_ALTERAR_RESERVA = update(ReservaEstoque).where(
+    ReservaEstoque.id == bindparam("reserva_id"), ReservaEstoque.quantidade == bindparam("anterior")
+)
+_SOLTAR_RESERVA = delete(ReservaEstoque).where(
+    ReservaEstoque.id == bindparam("reserva_id"), ReservaEstoque.quantidade == bindparam("anterior")
+)
+
+def consulta_reservaveis(dono: str, produto_ids: Iterable[int]):
+    """Produtos com a reserva do carrinho em cada um (reserva_id e reservada nulos sem reserva)"""
+    return (
+        select(
+            Produto.id, Produto.nome, Produto.preco, Produto.categoria, Produto.estoque, Produto.reservado,
+            ReservaEstoque.id.label("reserva_id"), ReservaEstoque.quantidade.label("reservada")
+        )
+        .outerjoin(ReservaEstoque, and_(ReservaEstoque.produto_id == Produto.id, ReservaEstoque.dono == dono))
+        .where(Produto.id.in_(list(produto_ids)))
+    )
+
+async def carregar_reservaveis(db: AsyncSession, dono: str, produto_ids: Iterable[int]) -> Dict[int, Any]:
+    """Produtos e a reserva do carrinho em cada um, numa consulta (produto_id -> linha)"""
+    result = await db.execute(consulta_reservaveis(dono, produto_ids))
+    return {linha.id: linha for linha in result}
+
+async def reservar(
+    db: AsyncSession, dono: str, quantidades: Dict[int, int], expira_em: int, linhas: Optional[Dict[int, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Grava a quantidade reservada de cada produto no carrinho (0 solta a reserva), sem commit
+    linhas: já carregadas por carregar_reservaveis (None: carrega aqui)
+    Número fixo de comandos, qualquer que seja a quantidade de produtos.
+    Retorna, por produto, nome, preço, categoria, a quantidade anterior e o disponível;
+    se não der, desfaz a transação inteira e levanta HTTPException
+    """
+    if linhas is None:
+        linhas = await carregar_reservaveis(db, dono, quantidades.keys())
+
+    reservas, novas, alteradas, soltas, deltas = [], [], [], [], {}
+    for produto_id, quantidade in quantidades.items():
+        linha = linhas.get(produto_id)
+        if not linha:
+            await db.rollback()
+            raise HTTPException(status_code=404, detail=f"Produto com ID {produto_id} não encontrado")
+
+        anterior = linha.reservada or 0
+        delta = quantidade - anterior
+        disponivel = linha.estoque - linha.reservado
+        if delta > disponivel:
+            await db.rollback()
+            raise HTTPException(
+                status_code=422,
+                detail=f"Estoque insuficiente para '{linha.nome}'. Disponível: {max(disponivel, 0) + anterior}, Solicitado: {quantidade}"
+            )
+
+        reservas.append({
+            "produto_id": produto_id,
+            "nome": linha.nome,
+            "preco": linha.preco,
+            "categoria": linha.categoria,
+            "quantidade": quantidade,
+            "anterior": anterior,
+            "disponivel": max(disponivel - delta, 0),
+        })
+        if linha.reserva_id is None:
+            if quantidade:
+                novas.append({"dono": dono, "produto_id": produto_id, "quantidade": quantidade, "expira_em": expira_em})
+        elif quantidade == 0:
+            soltas.append({"reserva_id": linha.reserva_id, "anterior": anterior})
+        else:
+            alteradas.append({"reserva_id": linha.reserva_id, "anterior": anterior, "quantidade": quantidade})
+        if delta:
+            deltas[produto_id] = delta
+
+    # Primeiro as linhas das reservas, condicionadas à quantidade lida
+    # (rowcount menor: a varredura ou outra requisição do carrinho mexeu nelas)
+    comandos = []
+    if novas:
+        comandos.append((insert(ReservaEstoque), novas))
+    if alteradas:
+        comandos.append((_ALTERAR_RESERVA.values(expira_em=expira_em), alteradas))
+    if soltas:
+        comandos.append((_SOLTAR_RESERVA, soltas))
+    for stmt, parametros in comandos:
+        try:
+            result = await db.execute(stmt.execution_options(synchronize_session=False), parametros)
+        except IntegrityError:
+            result = None  # reserva criada ao mesmo tempo por outra requisição do carrinho
+        if result is None or result.rowcount != len(parametros):
+            await db.rollback()
+            raise _conflito()
+
+    # Total reservado de cada produto num UPDATE só: quem cresce precisa de estoque livre
+    if deltas:
+        result = await db.execute(
+            update(Produto)
+            .where(
+                Produto.id.in_(deltas.keys()),
+                Produto.estoque - Produto.reservado >= case(
+                    {produto_id: max(delta, 0) for produto_id, delta in deltas.items()}, value=Produto.id
+                )
+            )
+            .values(reservado=Produto.reservado + case(deltas, value=Produto.id))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(deltas):
+            await db.rollback()
+            raise HTTPException(
+                status_code=422,
+                detail="Estoque reservado por outro carrinho ao mesmo tempo. Revise as quantidades e tente novamente."
+            )
+    return reservas
+
+async def renovar_reservas(db: AsyncSession, dono: str, expira_em: int):
+    """Carrinho ativo: todas as reservas dele ganham o mesmo prazo (sem commit)"""
+    await db.execute(
+        update(ReservaEstoque)
+        .where(ReservaEstoque.dono == dono)
+        .values(expira_em=expira_em)
+        .execution_options(synchronize_session=False)
+    )
+
+def prazo_reserva() -> int:
+    return agora() + RESERVA_TTL_MINUTOS * 60
+
+def registrar_movimento(reserva: Dict[str, Any]):
+    """Métrica das unidades reservadas ou soltas por reservar (depois do commit)"""
+    delta = reserva["quantidade"] - reserva["anterior"]
+    registrar_reserva("reservadas" if delta > 0 else "soltas", abs(delta))
+
+async def ajustar_reserva(db: AsyncSession, dono: str, produto_id: int, quantidade: int) -> Dict[str, Any]:
+    """
+    Define a quantidade reservada do produto no carrinho (0 solta a reserva)
+    e renova o prazo das demais reservas do mesmo carrinho
+    """
+    expira_em = prazo_reserva()
+    reserva, = await reservar(db, dono, {produto_id: quantidade}, expira_em)
+    if quantidade or reserva["anterior"]:
+        await renovar_reservas(db, dono, expira_em)
+        await db.commit()
+    registrar_movimento(reserva)
+    return {
+        "produto_id": produto_id,
+        "nome": reserva["nome"],
+        "quantidade": quantidade,
+        "expira_em": datetime.utcfromtimestamp(expira_em),
+        "disponivel": reserva["disponivel"],
+    }
+
+async def listar_reservas(db: AsyncSession, dono: str) -> List[Dict[str, Any]]:
+    """Reservas ainda no prazo do carrinho, na ordem em que foram feitas"""
+    result = await db.execute(
+        select(
+            ReservaEstoque.produto_id, Produto.nome, ReservaEstoque.quantidade, ReservaEstoque.expira_em,
+            (Produto.estoque - Produto.reservado).label("disponivel")
+        )
+        .join(Produto, Produto.id == ReservaEstoque.produto_id)
+        .where(ReservaEstoque.dono == dono, ReservaEstoque.expira_em > agora())
+        .order_by(ReservaEstoque.id)
+    )
+    return [
+        {
+            "produto_id": linha.produto_id,
+            "nome": linha.nome,
+            "quantidade": linha.quantidade,
+            "expira_em": datetime.utcfromtimestamp(linha.expira_em),
+            "disponivel": max(linha.disponivel, 0),
+        }
+        for linha in result
+    ]
+
+async def soltar_reservas(db: AsyncSession, dono: str) -> int:
+    """Solta todas as reservas do carrinho, sem commit; retorna as unidades devolvidas"""
+    linhas = (await db.execute(
+        select(ReservaEstoque.id, ReservaEstoque.produto_id, ReservaEstoque.quantidade)
+        .where(ReservaEstoque.dono == dono)
+    )).all()
+    if linhas and not await devolver_reservas(db, linhas):
+        await db.rollback()
+        raise _conflito()
+    return sum(linha.quantidade for linha in linhas)
+
+async def liberar_reservas(db: AsyncSession, dono: str) -> int:
+    """Solta todas as reservas do carrinho; retorna as unidades devolvidas"""
+    unidades = await soltar_reservas(db, dono)
+    if unidades:
+        await db.commit()
+        registrar_reserva("soltas", unidades)
+    return unidades
+
+async def devolver_reservas(db: AsyncSession, linhas: Iterable) -> bool:
+    """
+    Apaga as reservas (linhas com id, produto_id e quantidade) e desconta
+    de produtos.reservado, sem commit. False se alguma já não existia
+    """
+    linhas = list(linhas)
+    result = await db.execute(
+        delete(ReservaEstoque)
+        .where(ReservaEstoque.id.in_([linha.id for linha in linhas]))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(linhas):
+        return False
+
+    por_produto: Dict[int, int] = {}
+    for linha in linhas:
+        por_produto[linha.produto_id] = por_produto.get(linha.produto_id, 0) + linha.quantidade
+    await db.execute(
+        update(Produto)
+        .where(Produto.id.in_(por_produto.keys()))
+        .values(reservado=Produto.reservado - case(por_produto, value=Produto.id))
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+# ========== CHECKOUT ==========
+
+async def consumir_reservas(db: AsyncSession, reserva_ids: List[int]) -> bool:
+    """Apaga as reservas convertidas em venda (sem commit); False se a varredura levou alguma antes"""
+    result = await db.execute(
+        delete(ReservaEstoque)
+        .where(ReservaEstoque.id.in_(reserva_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(reserva_ids)
+
+def baixa_estoque(
+    quantidades: Dict[int, int], reservadas: Dict[int, int], precos: Optional[Dict[int, Decimal]] = None
+):
+    """
+    UPDATE único da baixa do checkout
+    Cada produto precisa de estoque livre só para o que o carrinho não tinha
+    reservado; a reserva inteira sai de reservado. Com precos (carrinho salvo),
+    o preço também precisa ser o mesmo da foto do carrinho. Rowcount menor que
+    len(quantidades): outro pedido levou o estoque (ou o preço mudou)
+    """
+    quantidade_por_id = case(quantidades, value=Produto.id)
+    reservada_por_id = case(reservadas, value=Produto.id, else_=0) if reservadas else literal(0)
+    condicoes = [
+        Produto.id.in_(quantidades.keys()),
+        Produto.estoque - Produto.reservado + reservada_por_id >= quantidade_por_id,
+    ]
+    if precos:
+        condicoes.append(Produto.preco == case(precos, value=Produto.id))
+    return (
+        update(Produto)
+        .where(*condicoes)
+        .values(estoque=Produto.estoque - quantidade_por_id, reservado=Produto.reservado - reservada_por_id)
+        .execution_options(synchronize_session=False)
+    )
+
+# ========== DISPONIBILIDADE ==========
+
+async def consultar_disponibilidade(db: AsyncSession, produto_ids: List[int]) -> List[Dict[str, int]]:
+    """Estoque, reservado e disponível por produto (busca pela chave primária)"""
+    result = await db.execute(
+        select(Produto.id, Produto.estoque, Produto.reservado)
+        .where(Produto.id.in_(produto_ids))
+        .order_by(Produto.id)
+    )
+    return [
+        {
+            "produto_id": linha.id,
+            "estoque": linha.estoque,
+            "reservado": linha.reservado,
+            "disponivel": max(linha.estoque - linha.reservado, 0),
+        }
+        for linha in result
+    ]
+
+# ========== VARREDURA ==========
+
+async def varrer_expiradas(sessionmaker, lote: int = RESERVA_LOTE_VARREDURA) -> int:
+    """
+    Devolve as reservas vencidas em lotes (índice em expira_em), uma transação
+    curta por lote. Retorna as unidades devolvidas
+    """
+    unidades = 0
+    while True:
+        async with sessionmaker() as sessao:
+            linhas = (await sessao.execute(
+                select(ReservaEstoque.id, ReservaEstoque.produto_id, ReservaEstoque.quantidade)
+                .where(ReservaEstoque.expira_em <= agora())
+                .order_by(ReservaEstoque.expira_em)
+                .limit(lote)
+            )).all()
+            if not linhas:
+                break
+            if not await devolver_reservas(sessao, linhas):
+                # Checkout ou carrinho mexeu numa delas no meio do lote: fica para a próxima rodada
+                await sessao.rollback()
+                break
+            await sessao.commit()
+        devolvidas = sum(linha.quantidade for linha in linhas)
+        registrar_reserva("expiradas", devolvidas)
+        unidades += devolvidas
+        if len(linhas) < lote:
+            break
+    return unidades
+
+async def varredura_periodica(sessionmaker):
+    """
+    Tarefa de fundo iniciada no startup da API
+    Espera antes de varrer: cancelada no shutdown, nunca fica no meio de uma transação
+    """
+    while True:
+        await asyncio.sleep(RESERVA_VARREDURA_SEGUNDOS)
+        try:
+            devolvidas = await varrer_expiradas(sessionmaker)
+            if devolvidas:
+                logger.info(f"Reservas de estoque expiradas devolvidas: {devolvidas} unidades")
+        except Exception as e:
+            logger.error(f"Erro na varredura de reservas de estoque: {e}")
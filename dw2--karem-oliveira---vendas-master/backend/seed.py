@@ -6,7 +6,8 @@ Execute: python seed.py
 import sys
 from decimal import Decimal
 from database import SessionLocal, engine
-from models import Base, Produto, User
+from models import Produto, User
+from migracoes import aplicar_migracoes
 from auth import hash_password
 
 # Dados dos produtos educacionais
@@ -369,8 +370,8 @@ if __name__ == "__main__":
     print("🏪 LOJA ESCOLAR - SEED DO BANCO DE DADOS")
     print("=" * 50)
     
-    # Criar tabelas se não existirem
-    Base.metadata.create_all(bind=engine)
+    # Criar/atualizar o schema pelas migrações
+    aplicar_migracoes(engine)
     
     if len(sys.argv) > 1 and sys.argv[1] == "--limpar":
         limpar_produtos()
@@ -384,3 +385,4 @@ if __name__ == "__main__":
     print("   3. Teste o endpoint GET /produtos")
     print("   4. Faça login com: admin@loja.com / admin123")
     print("\n🧹 Para limpar o banco: python seed.py --limpar")
+    print("📈 Para dados em escala (carga): python dados_sinteticos.py --produtos 20000 --pedidos 100000")
@@ -0,0 +1,137 @@
+"""
+Serialização rápida do catálogo e compressão negociada das respostas
+O JSON é montado direto das linhas (sem ProdutoResponse/orm_mode nem a
+revalidação do response_model) e comprimido com brotli ou gzip acima de
+um tamanho mínimo, conforme o Accept-Encoding do cliente
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Request, Response
+
+from models import Produto
+from imagens import urls_variantes
+
+try:
+    import orjson
+    ORJSON_DISPONIVEL = True
+except ImportError:  # orjson é opcional: sem ele usa o json da biblioteca padrão
+    ORJSON_DISPONIVEL = False
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só gzip
+    brotli = None
+
+# Respostas menores que isso não compensam o custo da compressão
+COMPRESSAO_MINIMA = int(os.getenv("COMPRESSAO_MINIMA_BYTES", "1024"))
+NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", "5"))
+NIVEL_BROTLI = int(os.getenv("COMPRESSAO_NIVEL_BROTLI", "5"))
+
+# Colunas de ProdutoResponse, na mesma ordem dos campos do schema
+COLUNAS_CATALOGO = [
+    Produto.nome, Produto.descricao, Produto.preco, Produto.estoque, Produto.categoria,
+    Produto.sku, Produto.imagem_filename, Produto.id, Produto.criado_em, Produto.atualizado_em,
+]
+
+# ========== SERIALIZAÇÃO ==========
+
+def produto_dict(linha) -> Dict[str, Any]:
+    """Linha de COLUNAS_CATALOGO no mesmo formato JSON de ProdutoResponse"""
+    return {
+        "nome": linha.nome,
+        "descricao": linha.descricao,
+        "preco": float(linha.preco),
+        "estoque": linha.estoque,
+        "categoria": linha.categoria,
+        "sku": linha.sku,
+        "imagem_filename": linha.imagem_filename,
+        "id": linha.id,
+        "criado_em": linha.criado_em,
+        "atualizado_em": linha.atualizado_em,
+        "imagens": urls_variantes(linha.imagem_filename),
+    }
+
+def _padrao(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def serializar(valor: Any) -> bytes:
+    """JSON compacto em bytes (datetime em ISO 8601, Decimal como número)"""
+    if ORJSON_DISPONIVEL:
+        return orjson.dumps(valor, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), default=_padrao).encode("utf-8")
+
+# ========== COMPRESSÃO ==========
+
+def codificacao_aceita(accept_encoding: Optional[str]) -> Optional[str]:
+    """br ou gzip, o que o cliente aceitar (q > 0), preferindo br"""
+    if not accept_encoding:
+        return None
+    aceitas = set()
+    for item in accept_encoding.split(","):
+        nome, _, parametros = item.strip().partition(";")
+        qualidade = parametros.strip()
+        if qualidade.startswith("q="):
+            try:
+                if float(qualidade[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        aceitas.add(nome.strip().lower())
+    if brotli is not None and ("br" in aceitas or "*" in aceitas):
+        return "br"
+    if "gzip" in aceitas or "*" in aceitas:
+        return "gzip"
+    return None
+
+def comprimir(corpo: bytes, codificacao: str) -> bytes:
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=NIVEL_BROTLI)
+    return gzip.compress(corpo, compresslevel=NIVEL_GZIP, mtime=0)
+
+def codificacao_resposta(request: Request, corpo: bytes) -> Optional[str]:
+    """Codificação que resposta_json vai usar para este corpo (None: sem compressão)"""
+    if len(corpo) < COMPRESSAO_MINIMA:
+        return None
+    return codificacao_aceita(request.headers.get("accept-encoding"))
+
+def etag_codificada(etag: str, codificacao: Optional[str]) -> str:
+    """ETag forte de cada variante: bytes diferentes não podem ter a mesma ETag forte"""
+    return f'{etag[:-1]}-{codificacao}"' if codificacao else etag
+
+def resposta_json(
+    request: Request,
+    corpo: bytes,
+    headers: Optional[Mapping[str, str]] = None,
+    comprimidos: Optional[Dict[str, bytes]] = None
+) -> Response:
+    """
+    Resposta com o JSON já serializado, comprimida se o cliente aceitar
+    comprimidos: cache das versões comprimidas do mesmo corpo (ex.: página em cache)
+    Uma ETag em headers deve vir de etag_codificada com a codificação desta resposta
+    """
+    cabecalhos = {
+        chave: valor for chave, valor in (headers or {}).items() if chave.lower() not in ("content-length", "vary")
+    }
+    cabecalhos["Vary"] = "Accept-Encoding"
+
+    codificacao = codificacao_resposta(request, corpo)
+    if codificacao:
+        if comprimidos is None:
+            corpo = comprimir(corpo, codificacao)
+        else:
+            if codificacao not in comprimidos:
+                comprimidos[codificacao] = comprimir(corpo, codificacao)
+            corpo = comprimidos[codificacao]
+        cabecalhos["Content-Encoding"] = codificacao
+
+    return Response(content=corpo, headers=cabecalhos, media_type="application/json")
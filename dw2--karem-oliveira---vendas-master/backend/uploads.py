@@ -0,0 +1,179 @@
+"""
+Upload de avatares com limite de tamanho durante a leitura
+Gravação em blocos com rename atômico e miniaturas geradas em pool de workers
+"""
+
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile, status
+
+logger = logging.getLogger(__name__)
+
+# Configurações de upload
+AVATAR_DIR = os.getenv("AVATAR_DIR", "uploads/avatars")
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+# Margem para cabeçalhos multipart ao limitar o corpo inteiro da requisição
+MARGEM_MULTIPART = 64 * 1024
+TAMANHO_BLOCO = 64 * 1024
+
+# Miniaturas: lado em pixels -> gerada em WebP (JPEG se o Pillow não tiver WebP)
+TAMANHOS_MINIATURA = (64, 256)
+MINIATURA_WORKERS = int(os.getenv("MINIATURA_WORKERS", "2"))
+
+try:
+    from PIL import Image, ImageOps, features
+    PILLOW_DISPONIVEL = True
+except ImportError:  # Pillow é opcional: sem ele não há miniaturas
+    PILLOW_DISPONIVEL = False
+
+_executor_miniaturas: Optional[ThreadPoolExecutor] = None
+
+# ========== LIMITE DO CORPO DA REQUISIÇÃO ==========
+
+class LimiteCorpoMiddleware:
+    """
+    Middleware ASGI que interrompe a leitura do corpo ao passar do limite
+    Rejeita pelo Content-Length antes de ler e, se o cliente não informar
+    (ou mentir), conta os bytes recebidos e responde 413 ao exceder.
+    """
+
+    def __init__(self, app, limites: Dict[str, int]):
+        self.app = app
+        self.limites = limites
+
+    async def __call__(self, scope, receive, send):
+        limite = self.limites.get(scope.get("path")) if scope["type"] == "http" else None
+        if limite is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limite:
+            await self._responder_413(send, limite)
+            return
+
+        estado = {"recebidos": 0, "excedeu": False, "respondeu": False}
+
+        async def receive_limitado():
+            if estado["excedeu"]:
+                return {"type": "http.disconnect"}
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                estado["recebidos"] += len(mensagem.get("body", b""))
+                if estado["recebidos"] > limite:
+                    estado["excedeu"] = True
+                    return {"type": "http.disconnect"}
+            return mensagem
+
+        async def send_limitado(mensagem):
+            # Corpo excedido: troca a resposta de erro da aplicação por 413
+            if estado["excedeu"]:
+                if mensagem["type"] == "http.response.start" and not estado["respondeu"]:
+                    estado["respondeu"] = True
+                    await self._responder_413(send, limite)
+                return
+            await send(mensagem)
+
+        await self.app(scope, receive_limitado, send_limitado)
+
+    @staticmethod
+    async def _responder_413(send, limite: int):
+        corpo = json.dumps({
+            "detail": f"Arquivo muito grande. Máximo {limite // (1024 * 1024)}MB"
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(corpo)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": corpo})
+
+# ========== GRAVAÇÃO DO ARQUIVO ==========
+
+async def salvar_upload_limitado(file: UploadFile, destino: str, limite: int = AVATAR_MAX_BYTES) -> int:
+    """
+    Copia o upload em blocos para um arquivo temporário e renomeia no final
+    Memória constante por upload; aborta assim que passar do limite
+    """
+    temporario = f"{destino}.part"
+    total = 0
+    try:
+        async with aiofiles.open(temporario, "wb") as f:
+            while True:
+                bloco = await file.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                total += len(bloco)
+                if total > limite:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Arquivo muito grande. Máximo {limite // (1024 * 1024)}MB"
+                    )
+                await f.write(bloco)
+        await aiofiles.os.replace(temporario, destino)
+        return total
+    except BaseException:
+        if os.path.exists(temporario):
+            await aiofiles.os.remove(temporario)
+        raise
+
+def caminho_miniatura(filename: str, lado: int, extensao: str) -> str:
+    base = filename.rsplit(".", 1)[0]
+    return os.path.join(AVATAR_DIR, f"{base}_{lado}.{extensao}")
+
+async def remover_avatar(filename: str):
+    """Remove avatar e miniaturas sem bloquear o event loop"""
+    caminhos = [os.path.join(AVATAR_DIR, filename)]
+    for lado in TAMANHOS_MINIATURA:
+        caminhos += [caminho_miniatura(filename, lado, ext) for ext in ("webp", "jpg")]
+    for caminho in caminhos:
+        try:
+            await aiofiles.os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+# ========== MINIATURAS ==========
+
+def gerar_miniaturas(filename: str):
+    """Gera miniaturas quadradas de tamanho fixo (executa no pool de workers)"""
+    origem = os.path.join(AVATAR_DIR, filename)
+    extensao = "webp" if features.check("webp") else "jpg"
+    try:
+        with Image.open(origem) as imagem:
+            imagem = imagem.convert("RGB")
+            for lado in TAMANHOS_MINIATURA:
+                # Recorta ao centro e redimensiona: sempre lado x lado
+                miniatura = ImageOps.fit(imagem, (lado, lado), Image.LANCZOS)
+                destino = caminho_miniatura(filename, lado, extensao)
+                miniatura.save(f"{destino}.part", format="WEBP" if extensao == "webp" else "JPEG", quality=85)
+                os.replace(f"{destino}.part", destino)
+    except Exception as e:
+        logger.warning(f"Não foi possível gerar miniaturas de {filename}: {e}")
+
+def agendar_miniaturas(filename: str):
+    """Agenda a geração das miniaturas fora do caminho da requisição"""
+    global _executor_miniaturas
+    if not PILLOW_DISPONIVEL:
+        return
+    if _executor_miniaturas is None:
+        _executor_miniaturas = ThreadPoolExecutor(
+            max_workers=MINIATURA_WORKERS, thread_name_prefix="miniaturas"
+        )
+    asyncio.get_running_loop().run_in_executor(_executor_miniaturas, gerar_miniaturas, filename)
+
+def encerrar_pool_miniaturas():
+    """Encerra o pool de miniaturas (shutdown da aplicação)"""
+    global _executor_miniaturas
+    if _executor_miniaturas is not None:
+        _executor_miniaturas.shutdown(wait=False)
+        _executor_miniaturas = None
@@ -15,7 +15,8 @@ const CONFIG = {
   COUPON_DISCOUNT: 0.10, // 10%
   THEME_STORAGE_KEY: 'loja-escolar-theme',
   SORT_STORAGE_KEY: 'loja-escolar-sort',
-  CART_STORAGE_KEY: 'loja-escolar-cart'
+  CART_STORAGE_KEY: 'loja-escolar-cart',
+  CART_SESSION_KEY: 'loja-escolar-cart-session'
 };
 
 /* ========================================
@@ -26,6 +27,10 @@ const AppState = {
   products: [],
   filteredProducts: [],
   cart: [],
+  // Idempotency-Key da compra em andamento (reenviada nas novas tentativas)
+  checkout: null,
+  // Carrinho do servidor igual ao local (checkout pelo carrinho salvo)
+  serverCartSynced: false,
   currentPage: 1,
   totalPages: 1,
   filters: {
@@ -138,6 +143,19 @@ const Storage = {
   loadCart() {
     const saved = localStorage.getItem(CONFIG.CART_STORAGE_KEY);
     return saved ? JSON.parse(saved) : [];
+  },
+
+  /**
+   * Sessão do carrinho no servidor (gerada uma vez por navegador)
+   * @returns {string} Identificador enviado em X-Sessao-Carrinho
+   */
+  getCartSession() {
+    let session = localStorage.getItem(CONFIG.CART_SESSION_KEY);
+    if (!session) {
+      session = crypto.randomUUID();
+      localStorage.setItem(CONFIG.CART_SESSION_KEY, session);
+    }
+    return session;
   }
 };
 
@@ -314,7 +332,28 @@ getMockProducts() {
     }
   ];
 },  /**
+   * Buscar uma página de uma listagem paginada por cursor
+   * @param {string} endpoint - Endpoint da API (com a query string)
+   * @returns {Promise} { items, nextCursor } (nextCursor null na última página)
+   */
+  async requestPage(endpoint) {
+    const response = await fetch(`${CONFIG.API_BASE_URL}${endpoint}`, {
+      headers: { 'Content-Type': 'application/json' }
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    return {
+      items: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor')
+    };
+  },
+
+  /**
    * Buscar produtos com filtros
+   * Segue o cursor de X-Next-Cursor até a última página do catálogo
    * @param {Object} filters - Filtros de busca
    * @returns {Promise} Lista de produtos
    */
@@ -326,24 +365,100 @@ getMockProducts() {
     if (filters.sort) params.append('sort', filters.sort);
     if (filters.order) params.append('order', filters.order);
 
-    const queryString = params.toString();
-    const endpoint = `/produtos${queryString ? `?${queryString}` : ''}`;
-    
-    return this.request(endpoint);
+    const products = [];
+    let cursor = null;
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const queryString = params.toString();
+      const endpoint = `/produtos${queryString ? `?${queryString}` : ''}`;
+
+      let page;
+      try {
+        page = await this.requestPage(endpoint);
+      } catch (error) {
+        // Sem backend desde a primeira página: dados mock (como em request)
+        if (cursor === null) {
+          console.warn('API não disponível, usando dados mock:', error.message);
+          return this.getMockProducts();
+        }
+        throw error;
+      }
+
+      products.push(...page.items);
+      cursor = page.nextCursor;
+    } while (cursor);
+
+    return products;
   },
 
   /**
    * Confirmar pedido do carrinho
    * @param {Object} orderData - Dados do pedido
+   * @param {string} [idempotencyKey] - Mesma chave em todas as tentativas da mesma compra
    * @returns {Promise} Resposta do pedido confirmado
    */
-  async confirmOrder(orderData) {
+  async confirmOrder(orderData, idempotencyKey) {
+    // Com login, o pedido fica no histórico do usuário (/users/me/pedidos);
+    // o mesmo dono do carrinho salvo faz as reservas dele virarem venda
+    const headers = { 'Content-Type': 'application/json', ...this.cartHeaders() };
+    if (idempotencyKey) {
+      headers['Idempotency-Key'] = idempotencyKey;
+    }
+
     return this.request('/carrinho/confirmar', {
       method: 'POST',
+      headers,
       body: JSON.stringify(orderData)
     });
   },
 
+  /**
+   * Cabeçalhos do carrinho salvo: token (se logado) e sessão do visitante
+   * @returns {Object} Cabeçalhos da requisição
+   */
+  cartHeaders() {
+    const headers = { 'X-Sessao-Carrinho': Storage.getCartSession() };
+    const token = window.authManager && window.authManager.getToken();
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    return headers;
+  },
+
+  /**
+   * Enviar alterações ao carrinho salvo no servidor
+   * @param {Array} operacoes - [{op: 'adicionar'|'remover'|'definir', produto_id, quantidade}]
+   * @returns {Promise} Carrinho com o total atualizado
+   */
+  async updateServerCart(operacoes) {
+    return this.request('/carrinho', {
+      method: 'PATCH',
+      headers: { 'Content-Type': 'application/json', ...this.cartHeaders() },
+      body: JSON.stringify({ operacoes })
+    });
+  },
+
+  /**
+   * Buscar o carrinho salvo no servidor
+   * @returns {Promise} Itens e totais do carrinho salvo
+   */
+  async fetchServerCart() {
+    return this.request('/carrinho', { headers: this.cartHeaders() });
+  },
+
+  /**
+   * Confirmar o carrinho salvo no servidor
+   * @param {string} [idempotencyKey] - Mesma chave em todas as tentativas da mesma compra
+   * @returns {Promise} Resposta do pedido confirmado
+   */
+  async checkoutServerCart(idempotencyKey) {
+    const headers = this.cartHeaders();
+    if (idempotencyKey) {
+      headers['Idempotency-Key'] = idempotencyKey;
+    }
+    return this.request('/carrinho/checkout', { method: 'POST', headers });
+  },
+
   /**
    * Verificar se API está funcionando
    * @returns {Promise} Status da API
@@ -416,6 +531,98 @@ const CartManager = {
     AppState.cart = Storage.loadCart();
     this.bindEvents();
     this.updateUI();
+    // Carrinho recarregado do localStorage: o servidor recebe as quantidades atuais
+    if (AppState.cart.length > 0) {
+      this.serverNeedsResync = true;
+      this.syncServer([]);
+    }
+  },
+
+  // Alterações enviadas ao servidor uma por vez, na ordem em que aconteceram
+  serverQueue: Promise.resolve(),
+  // Uma alteração falhou: a próxima envia o carrinho inteiro
+  serverNeedsResync: false,
+  // Token da última sincronização (login e logout trocam o dono do carrinho salvo)
+  serverOwner: undefined,
+
+  /**
+   * Espelhar alterações no carrinho salvo do servidor (reserva o estoque)
+   * Sem backend, o carrinho continua só no localStorage
+   * @param {Array} operacoes - Operações na ordem em que aconteceram
+   * @returns {Promise} Resolvida quando esta alteração (e as anteriores) terminar
+   */
+  syncServer(operacoes) {
+    AppState.serverCartSynced = false;
+    this.serverQueue = this.serverQueue.then(() => this.sendToServer(operacoes));
+    return this.serverQueue;
+  },
+
+  /**
+   * Enviar uma alteração da fila; o carrinho só conta como sincronizado
+   * quando a resposta do servidor tem os mesmos itens e quantidades do local
+   * @param {Array} operacoes - Operações desta alteração
+   */
+  async sendToServer(operacoes) {
+    try {
+      if (this.serverNeedsResync) {
+        operacoes = await this.resyncOperations();
+      }
+      if (operacoes.length === 0) {
+        return;
+      }
+      const owner = API.cartHeaders().Authorization;
+      const serverCart = await API.updateServerCart(operacoes);
+      this.serverOwner = owner;
+      this.serverNeedsResync = false;
+      AppState.serverCartSynced = this.matchesServer(serverCart);
+    } catch (error) {
+      this.serverNeedsResync = true;
+      AppState.serverCartSynced = false;
+      console.warn('Carrinho não sincronizado com o servidor:', error.message);
+    }
+  },
+
+  /**
+   * Esperar as alterações pendentes antes do checkout
+   * Se o dono mudou desde a última sincronização, envia o carrinho inteiro de novo
+   * @returns {Promise<boolean>} Carrinho salvo igual ao local
+   */
+  async settleServer() {
+    if (API.cartHeaders().Authorization !== this.serverOwner) {
+      this.serverNeedsResync = true;
+      this.syncServer([]);
+    }
+    await this.serverQueue;
+    return AppState.serverCartSynced;
+  },
+
+  /**
+   * Operações que levam o carrinho salvo ao estado do local
+   * @returns {Promise<Array>} Quantidades locais e remoção dos itens que só o servidor tem
+   */
+  async resyncOperations() {
+    const serverCart = await API.fetchServerCart();
+    const operacoes = AppState.cart.map(item => ({
+      op: 'definir', produto_id: item.productId, quantidade: item.quantity
+    }));
+    (serverCart.itens || []).forEach(item => {
+      if (!AppState.cart.some(local => local.productId === item.produto_id)) {
+        operacoes.push({ op: 'definir', produto_id: item.produto_id, quantidade: 0 });
+      }
+    });
+    return operacoes;
+  },
+
+  /**
+   * Comparar o carrinho do servidor com o local
+   * @param {Object} serverCart - Resposta de /carrinho
+   * @returns {boolean} Mesmos produtos com as mesmas quantidades
+   */
+  matchesServer(serverCart) {
+    const itens = (serverCart && serverCart.itens) || [];
+    return itens.length === AppState.cart.length && itens.every(item =>
+      AppState.cart.some(local => local.productId === item.produto_id && local.quantity === item.quantidade)
+    );
   },
 
   /**
@@ -467,6 +674,7 @@ const CartManager = {
     }
 
     this.saveAndUpdate();
+    this.syncServer([{ op: 'adicionar', produto_id: productId, quantidade: quantity }]);
     // Re-renderizar produtos para atualizar o texto de estoque e desabilitar botões se necessário
     ProductsManager.renderProducts();
     console.log('[DEBUG] addProduct end', { productId, estoqueDepois: produto.estoque, cartAfter: AppState.cart.slice() });
@@ -488,6 +696,7 @@ const CartManager = {
 
       AppState.cart = AppState.cart.filter(i => i.productId !== productId);
       this.saveAndUpdate();
+      this.syncServer([{ op: 'definir', produto_id: productId, quantidade: 0 }]);
       ProductsManager.renderProducts();
       console.log('[DEBUG] removeProduct end', { productId, estoqueDepois: produto ? produto.estoque : null, cartAfter: AppState.cart.slice() });
       announceToScreenReader(`${item.nome} removido do carrinho`);
@@ -528,6 +737,7 @@ const CartManager = {
         this.removeProduct(productId);
       } else {
         this.saveAndUpdate();
+        this.syncServer([{ op: 'definir', produto_id: productId, quantidade: newQuantity }]);
         ProductsManager.renderProducts();
         console.log('[DEBUG] updateQuantity end', { productId, estoqueDepois: produto.estoque, cartAfter: AppState.cart.slice() });
         announceToScreenReader(`Quantidade atualizada para ${newQuantity}`);
@@ -599,6 +809,13 @@ const CartManager = {
       cupom: null
     };
 
+    // Nova tentativa do mesmo carrinho reaproveita a chave: o backend
+    // devolve o pedido já criado em vez de criar outro
+    const body = JSON.stringify(orderData);
+    if (!AppState.checkout || AppState.checkout.body !== body) {
+      AppState.checkout = { body, key: crypto.randomUUID() };
+    }
+
     // Mostrar loading visual mínimo no botão de confirmar
     const confirmBtn = document.getElementById('confirm-order');
     const originalBtnText = confirmBtn ? confirmBtn.textContent : null;
@@ -611,7 +828,11 @@ const CartManager = {
       // Tentar enviar para o backend quando disponível
       let result = null;
       try {
-        result = await API.confirmOrder(orderData);
+        // Carrinho salvo já validado no servidor: o checkout só grava a foto
+        // (depois das alterações pendentes; se diferir do local, vai o local)
+        result = await CartManager.settleServer()
+          ? await API.checkoutServerCart(AppState.checkout.key)
+          : await API.confirmOrder(orderData, AppState.checkout.key);
       } catch (err) {
         // API não disponível ou falhou — log e continuar com fluxo simulado
         console.warn('[WARN] confirmOrder: backend unavailable, proceeding locally', err);
@@ -623,7 +844,9 @@ const CartManager = {
         ToastManager.success('Parabéns — compra concluída', 5000);
         announceToScreenReader('Compra concluída com sucesso');
 
-        // Limpar carrinho localmente
+        // Limpar carrinho localmente (o do servidor some no checkout)
+        AppState.checkout = null;
+        AppState.serverCartSynced = false;
         AppState.cart = [];
         CartManager.saveAndUpdate();
 
@@ -1053,15 +1276,28 @@ const ProductsManager = {
       ? `images/${produto.imagem_filename}` 
       : `https://via.placeholder.com/280x200/0EA5E9/FFFFFF?text=${encodeURIComponent(produto.nome)}`;
     
+    // Variantes redimensionadas do backend (AVIF/WebP): o navegador escolhe formato e largura
+    const imageSources = Object.entries(produto.imagens || {})
+      .map(([formato, larguras]) => {
+        const srcset = Object.entries(larguras)
+          .map(([largura, url]) => `${CONFIG.API_BASE_URL}${url} ${largura}w`)
+          .join(', ');
+        return `<source type="image/${formato}" srcset="${srcset}" sizes="280px" />`;
+      })
+      .join('');
+    
     return `
       <article class="product-card" data-product-id="${produto.id}">
         <div class="product-card__image">
-          <img 
-            src="${productImage}" 
-            alt="${produto.nome}"
-            loading="lazy"
-            onerror="this.src='https://via.placeholder.com/280x200/0EA5E9/FFFFFF?text=${encodeURIComponent(produto.nome)}'"
-          />
+          <picture>
+            ${imageSources}
+            <img 
+              src="${productImage}" 
+              alt="${produto.nome}"
+              loading="lazy"
+              onerror="this.src='https://via.placeholder.com/280x200/0EA5E9/FFFFFF?text=${encodeURIComponent(produto.nome)}'"
+            />
+          </picture>
           ${isOutOfStock ? '<div class="product-card__badge product-card__badge--out-of-stock">Esgotado</div>' : ''}
         </div>
         